@@ -1,15 +1,66 @@
 import psycopg2 as pg2
-from typing import Dict, Any, List
+from psycopg2 import pool
+import io
+import re
+import hashlib
+import threading
+import time
+import weakref
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Iterator
 from src import logger
 
 from src.tools.local_storage import remove_items
+from src.tools.lru_cache import LRUCache
+from src.tools.records import record_type
 
 class SteamDatabase():
     """
         Database class to handle PostgreSQL connection and data operations for Steam Client
     """
+    # inserts with at least this many rows are streamed in with COPY instead of one INSERT per row
+    COPY_THRESHOLD = 500
+    # rows a server side cursor fetches per round trip when streamed with stream_rows
+    STREAM_ITERSIZE = 2000
+    # seconds a pooled connection can sit unused before it's checked when borrowed
+    POOL_IDLE_CHECK_TIME = 60
+    # game names compared by lower case letters and numbers only, games has an index on this expression
+    NORMALIZED_NAME_SQL = "lower(regexp_replace({column}, '[^[:alnum:]]+', '', 'g'))"
+    # fields that make up a game's features, see get_game_features
+    GAME_FEATURE_FIELDS = ['game_type', 'game_name', 'is_free', 'detailed_description','header_image','website','recommendations','release_date','esrb_rating']
+    PRICE_FEATURE_FIELDS = ['currency','price_in_cents','final_formatted','discount_percentage']
+    METACRITIC_FEATURE_FIELDS = ['score','url']
+    # feature name -> (table, column)
+    FEATURE_NAME_LISTS = {
+        'developers': ('developers', 'developer_name'),
+        'publishers': ('publishers', 'publisher_name'),
+        'categories': ('categories', 'category_name'),
+        'genres': ('genres', 'genre_name')
+    }
+    # user tables kept in sync with steam by sync_user_items, table -> column that can change
+    SYNC_FIELDS = {
+        'wishlist': 'priority',
+        'user_library': 'playtime_minutes'
+    }
+    # denormalized row for each game, one column per feature, kept up to date by refresh_game_features
+    FEATURE_TABLE_SELECT = f"""
+        SELECT g.appid, {', '.join(f'g.{field}' for field in GAME_FEATURE_FIELDS)},
+            {', '.join(
+                f"COALESCE((SELECT array_agg(t.{column} ORDER BY t.{column}) FROM {table} t WHERE t.appid = g.appid), '{{}}') AS {feature}"
+                for feature, (table, column) in FEATURE_NAME_LISTS.items()
+            )},
+            {', '.join(f'p.{field}' for field in PRICE_FEATURE_FIELDS)},
+            m.score AS metacritic_score, m.url AS metacritic_url,
+            NOW() AS refreshed_at
+        FROM games g
+        LEFT JOIN prices p ON p.appid = g.appid
+        LEFT JOIN metacritic m ON m.appid = g.appid
+        WHERE g.appid = ANY(%s)
+    """
     
-    def __init__(self, database: str, user: str, password: str):
+    def __init__(self, database: str, user: str, password: str, min_connections: int = 0, max_connections: int = 0,
+                 cache_size: int = 0, cache_ttl: float = 300):
         """
             Initialize database connection
             
@@ -17,10 +68,148 @@ class SteamDatabase():
                 database: Name of the PostgreSQL database
                 user: Database username
                 password: Database password
+                min_connections: connections the pool keeps open, only used when pooled
+                max_connections: when above 0 a thread safe pool with up to this many connections is used,
+                                 otherwise a single connection is shared and calls take turns using it
+                cache_size: when above 0 game getters are cached in memory, up to this many results
+                cache_ttl: seconds a cached result is used before the database is asked again
+        """
+        self.connect_args = {"database": database, "user": user, "password": password}
+        self.pool = None
+        self.conn = None
+        self.cur = None
+        self._lock = threading.RLock()
+        # steamids known to be in users, loaded by one query on first use, see _is_known_user
+        self._known_users = None
+        self._users_lock = threading.Lock()
+        # get_game, get_developers... results by (table, appid), cleared for the appids each write touches
+        self.read_cache = LRUCache(cache_size, cache_ttl) if cache_size > 0 else None
+        # query -> prepared statement name, and the names already prepared on each open connection
+        self._statement_names = {}
+        self._prepared = weakref.WeakKeyDictionary()
+        self._prepared_lock = threading.Lock()
+        
+        if max_connections > 0:
+            # each operation borrows its own connection and cursor
+            self.pool = pool.ThreadedConnectionPool(min_connections, max_connections, **self.connect_args)
+            # the pool raises when every connection is lent out, callers wait here for a free one instead
+            self._pool_slots = threading.BoundedSemaphore(max_connections)
+            # when each pooled connection was last given back, connections never given back count from now
+            self._idle_since = weakref.WeakKeyDictionary()
+            self._pool_opened_at = time.monotonic()
+            self._idle_lock = threading.Lock()
+        else:
+            self.conn = pg2.connect(**self.connect_args)
+            # Allows enteraction with database
+            self.cur = self.conn.cursor()
+    
+    @contextmanager
+    def _connection(self):
+        """
+            Borrow a connection and cursor for one operation.
+            
+            Pooled: connection comes from the pool, broken connections are thrown away and replaced.
+            Single: the shared connection is locked so only one thread uses it at a time,
+                    it's reopened if it was closed.
+            
+            Yields: (connection, cursor)
         """
-        self.conn = pg2.connect(database=database, user=user, password=password)
-        # Allows enteraction with database
-        self.cur = self.conn.cursor()
+        if self.pool is None:
+            with self._lock:
+                if self.conn.closed:
+                    logger.warning("Database connection closed, reconnecting")
+                    self.conn = pg2.connect(**self.connect_args)
+                    self.cur = self.conn.cursor()
+                yield self.conn, self.cur
+            return
+        
+        self._pool_slots.acquire()
+        try:
+            conn = self._borrow_connection()
+            is_broken = False
+            try:
+                with conn.cursor() as cur:
+                    yield conn, cur
+            except (pg2.OperationalError, pg2.InterfaceError):
+                is_broken = True
+                raise
+            finally:
+                # pool rolls back anything left open, broken connections are closed instead of reused
+                close = is_broken or bool(conn.closed)
+                if not close:
+                    with self._idle_lock:
+                        self._idle_since[conn] = time.monotonic()
+                self.pool.putconn(conn, close=close)
+        finally:
+            self._pool_slots.release()
+    
+    def _borrow_connection(self):
+        """
+            Get a healthy connection from the pool.
+            A connection the server dropped while it sat in the pool is closed and another one is taken.
+            Only connections unused for POOL_IDLE_CHECK_TIME are checked with a round trip,
+            one that breaks sooner fails its operation and is closed by _connection.
+        """
+        for _ in range(self.pool.maxconn + 1):
+            conn = self.pool.getconn()
+            with self._idle_lock:
+                idle_since = self._idle_since.pop(conn, self._pool_opened_at)
+            is_recent = time.monotonic() - idle_since < self.POOL_IDLE_CHECK_TIME
+            if not conn.closed and (is_recent or self._is_healthy(conn)):
+                return conn
+            logger.warning("Database pooled connection broken, reconnecting")
+            self.pool.putconn(conn, close=True)
+        raise pg2.OperationalError("No healthy database connection available!")
+    
+    def _is_healthy(self, conn) -> bool:
+        """
+            Quick round trip to make sure the connection still works.
+        """
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (pg2.OperationalError, pg2.InterfaceError):
+            return False
+    
+    def _execute_prepared(self, conn, cur, query: str, params: tuple):
+        """
+            Run query as a server side prepared statement so repeated calls skip parsing and planning.
+            The statement is prepared the first time a connection runs it, then only EXECUTE is sent.
+            Prepared statements live as long as their connection, a reconnect prepares them again.
+            
+            Args:
+                conn: connection the cursor belongs to
+                cur: cursor to execute with
+                query: SQL with $1, $2... placeholders, table and column names can't be placeholders
+                params: values for the placeholders in order
+        """
+        name = self._statement_names.get(query)
+        if name is None:
+            name = f"steam_db_{hashlib.md5(query.encode()).hexdigest()[:16]}"
+            self._statement_names[query] = name
+        
+        with self._prepared_lock:
+            prepared = self._prepared.setdefault(conn, set())
+        try:
+            if name not in prepared:
+                cur.execute(f"PREPARE {name} AS {query}")
+                prepared.add(name)
+            cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        except pg2.errors.InvalidSqlStatementName:
+            # statements were dropped by the server (e.g. DEALLOCATE ALL), prepare again next time
+            prepared.clear()
+            raise
+    
+    def close(self):
+        """
+            Close the pool or single connection.
+        """
+        if self.pool is not None:
+            self.pool.closeall()
+        elif self.conn is not None:
+            self.conn.close()
 
     def add_steam_user(self, user: Dict[str,Any]) -> bool:
         """
@@ -31,14 +220,15 @@ class SteamDatabase():
             Returns: bool, False if user already exist
         """
         # checking to see if user exist, if so exit
-        is_user = self._check_table_item('steamid','users', user['steamid'])
+        is_user = self._is_known_user(user['steamid'])
         if is_user:
             # user is already in db
             return False
         
         # fields within the database to be populated
         fields = ['steamid', 'persona_name', 'profile_url', 'avatar_full', 'real_name', 'country_code', 'state_code']
-        self._insert_new_row('users', fields, [user])
+        if self._insert_new_row('users', fields, [user]):
+            self._known_users.add(str(user['steamid']))
         return True
         
     def add_to_wishlist(self, user_id: str, items: List[Dict[str, Any]]) -> int:
@@ -59,9 +249,9 @@ class SteamDatabase():
         table = 'wishlist'
         return self._add_to_database(user_id, items, on_conflict, fields, table)
     
-    def get_wishlist(self, user_id: str)-> List[Dict[str,Any]]:
+    def get_wishlist(self, user_id: str, compact: bool = False)-> List[Dict[str,Any]]:
         fields = ['steamid', 'appid', 'priority']
-        return self._search_db('steamid', user_id, fields, 'wishlist')
+        return self._search_db('steamid', user_id, fields, 'wishlist', compact)
     
     def add_to_library(self, user_id: str, items: List[Dict[str, Any]]):
         on_conflict = f"""
@@ -73,11 +263,92 @@ class SteamDatabase():
         table = 'user_library'
         return self._add_to_database(user_id, items, on_conflict, fields, table)
         
-    def get_library(self, user_id: str)-> List[Dict[str,Any]]:
+    def get_library(self, user_id: str, compact: bool = False)-> List[Dict[str,Any]]:
         fields = ['steamid', 'appid', 'playtime_minutes','user_paid_price']
-        return self._search_db('steamid', user_id, fields, 'user_library')
+        return self._search_db('steamid', user_id, fields, 'user_library', compact)
+    
+    def sync_wishlist(self, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        return self.sync_user_items(user_id, 'wishlist', items)
+    
+    def sync_library(self, user_id: str, items: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        return self.sync_user_items(user_id, 'user_library', items)
+    
+    def sync_user_items(self, user_id: str, table: str, items: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+        """
+            Makes a user's stored wishlist or library match the one from the steam server, writing only what changed.
+            The stored rows are diffed against items in one statement, which then deletes removed appids
+            and upserts added ones and ones whose SYNC_FIELDS column changed. Unchanged rows aren't touched.
+            
+            Args:
+                user_id: Steam user ID
+                table: wishlist or user_library
+                items: every item currently on the steam server, with appid and the table's SYNC_FIELDS column
+            Returns: appids added, removed and changed, plus new_games, appids of items not yet in the games table
+        """
+        changes = {"added": [], "removed": [], "changed": [], "new_games": []}
+        field = self.SYNC_FIELDS[table]
+        is_user = self._is_known_user(user_id)
+        if not is_user:
+            return changes
+        
+        query = f"""
+            WITH incoming AS (
+                SELECT DISTINCT ON (appid) appid, value
+                FROM unnest(%(appids)s::bigint[], %(values)s::integer[]) AS i(appid, value)
+                ORDER BY appid
+            ),
+            stored AS (
+                SELECT appid, {field} AS value FROM {table} WHERE steamid = %(steamid)s
+            ),
+            diff AS (
+                SELECT COALESCE(i.appid, s.appid) AS appid, i.value,
+                    CASE WHEN s.appid IS NULL THEN 'added' WHEN i.appid IS NULL THEN 'removed' ELSE 'changed' END AS change
+                FROM incoming i
+                FULL OUTER JOIN stored s ON s.appid = i.appid
+                WHERE s.appid IS NULL OR i.appid IS NULL OR s.value IS DISTINCT FROM i.value
+            ),
+            removed AS (
+                DELETE FROM {table} t
+                USING diff d
+                WHERE t.steamid = %(steamid)s AND t.appid = d.appid AND d.change = 'removed'
+            ),
+            upserted AS (
+                INSERT INTO {table} (steamid, appid, {field})
+                SELECT %(steamid)s, appid, value FROM diff WHERE change <> 'removed'
+                ON CONFLICT (steamid, appid)
+                DO UPDATE SET
+                    {field} = EXCLUDED.{field}
+            )
+            SELECT appid, change FROM diff
+            UNION ALL
+            SELECT i.appid, 'new_games' FROM incoming i
+            WHERE NOT EXISTS (SELECT 1 FROM games g WHERE g.appid = i.appid)
+        """
+        with self._connection() as (conn, cur):
+            try:
+                params = {
+                    "steamid": user_id,
+                    "appids": [int(item['appid']) for item in items],
+                    "values": [item[field] for item in items]
+                }
+                cur.execute(query, params)
+                for appid, change in cur.fetchall():
+                    changes[change].append(appid)
+                conn.commit()
+                logger.info(f"DB - {table} - Synced added {len(changes['added'])}, removed {len(changes['removed'])}, changed {len(changes['changed'])}")
+            except (KeyError, pg2.Error) as e:
+                logger.error(f"Database Sync {table}: {e}")
+                if conn:
+                    conn.rollback()
+                changes = {"added": [], "removed": [], "changed": [], "new_games": []}
+        
+        return changes
     
     def add_to_games(self, user_id: str, items: List[Dict[str, Any]]):
+        table, fields, items, on_conflict = self._games_rows(items)
+        return self._add_to_database(user_id, items, on_conflict, fields, table)
+    
+    def _games_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid)
             DO UPDATE SET
@@ -86,15 +357,19 @@ class SteamDatabase():
         """   
         fields = ['appid','game_type', 'game_name', 'is_free', 'detailed_description','header_image','website','recommendations','release_date','esrb_rating']
         table = 'games'
-        return self._add_to_database(user_id, items, on_conflict, fields, table)
+        return table, fields, items, on_conflict
     
     
     def get_game(self, appid: str)-> Dict[str,Any]:
         fields = ['game_type', 'game_name', 'is_free', 'detailed_description','header_image','website','recommendations','release_date','esrb_rating']
-        item = self._search_db('appid', appid, fields, 'games')
+        item = self._search_appid(appid, fields, 'games')
         return item[0] if item else {}
     
     def add_to_developers(self, user_id: str, items: List[Dict[str, Any]])-> int:
+        table, fields, correct_items, on_conflict = self._developers_rows(items)
+        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+    
+    def _developers_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid, developer_name)
             DO NOTHING
@@ -114,13 +389,34 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_developers missing key, {e}")
             raise KeyError(f"Database add_to_developers missing correct key") from e
-        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+        return table, fields, correct_items, on_conflict
+    
+    def get_game_names(self)-> List[Dict[str,Any]]:
+        """
+            Every game's appid and name, used to build a NameMatcher.
+        """
+        fields = ['appid', 'game_name']
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute(f"SELECT {', '.join(fields)} FROM games")
+                items = [dict(zip(fields, item)) for item in cur.fetchall()]
+                logger.info(f"Database games {len(items)} names Fetched")
+                return items
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database Fetching game names: {e}")
+                if conn:
+                    conn.rollback()
+        return []
     
     def get_developers(self, appid: str)-> List[Dict[str,Any]]:
         fields = ['developer_name']
-        return self._search_db('appid', appid, fields, 'developers')
+        return self._search_appid(appid, fields, 'developers')
     
     def add_to_publishers(self, user_id: str, items: List[Dict[str, Any]])-> int:
+        table, fields, correct_items, on_conflict = self._publishers_rows(items)
+        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+    
+    def _publishers_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid, publisher_name)
             DO NOTHING
@@ -140,13 +436,17 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_publishers missing key, {e}")
             raise KeyError(f"Database add_to_publishers missing correct key") from e
-        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+        return table, fields, correct_items, on_conflict
     
     def get_publishers(self, appid: str)-> List[Dict[str,Any]]:
         fields = ['publisher_name']
-        return self._search_db('appid', appid, fields, 'publishers')
+        return self._search_appid(appid, fields, 'publishers')
     
     def add_to_categories(self, user_id: str, items: List[Dict[str, Any]]):
+        table, fields, correct_items, on_conflict = self._categories_rows(items)
+        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+    
+    def _categories_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid, category_name)
             DO NOTHING
@@ -166,13 +466,17 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_categories missing key, {e}")
             raise KeyError(f"Database add_to_categories missing correct key") from e
-        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+        return table, fields, correct_items, on_conflict
     
-    def get_categories(self, appid: str)-> List[Dict[str, Any]]:
+    def get_categories(self, appid: str, compact: bool = False)-> List[Dict[str, Any]]:
         fields = ['category_name']
-        return self._search_db('appid', appid, fields, 'categories')
+        return self._search_db('appid', appid, fields, 'categories', compact)
     
     def add_to_genres(self, user_id: str, items: List[Dict[str, Any]]):
+        table, fields, correct_items, on_conflict = self._genres_rows(items)
+        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+    
+    def _genres_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid, genre_name)
             DO NOTHING
@@ -192,13 +496,17 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_genres missing key, {e}")
             raise KeyError(f"Database add_to_genres missing correct key") from e
-        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+        return table, fields, correct_items, on_conflict
     
     def get_genres(self, appid: str):
         fields = ['genre_name']
-        return self._search_db('appid', appid, fields, 'genres')
+        return self._search_appid(appid, fields, 'genres')
     
     def add_to_prices(self, user_id: str, items: List[Dict[str, Any]]):
+        table, fields, prices, on_conflict = self._prices_rows(items)
+        return self._add_to_database(user_id, prices, on_conflict, fields, table)
+    
+    def _prices_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid)
             DO UPDATE SET
@@ -224,14 +532,18 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_prices missing key, {e}")
             raise KeyError(f"Database add_to_prices missing correct key") from e
-        return self._add_to_database(user_id, prices, on_conflict, fields, table)
+        return table, fields, prices, on_conflict
     
     def get_prices(self, appid: str):
         fields = ['currency','price_in_cents','final_formatted','discount_percentage']
-        item = self._search_db('appid', appid, fields, 'prices')
+        item = self._search_appid(appid, fields, 'prices')
         return item[0] if item else {}
     
     def add_to_metacritic(self, user_id: str, items: List[Dict[str, Any]]):
+        table, fields, correct_items, on_conflict = self._metacritic_rows(items)
+        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+    
+    def _metacritic_rows(self, items: List[Dict[str, Any]]):
         on_conflict = f"""
             ON CONFLICT (appid)
             DO UPDATE SET
@@ -252,18 +564,386 @@ class SteamDatabase():
         except KeyError as e:
             logger.warning(f"Database add_to_metacritic missing key, {e}")
             raise KeyError(f"Database add_to_metacritic missing correct key") from e
-        return self._add_to_database(user_id, correct_items, on_conflict, fields, table)
+        return table, fields, correct_items, on_conflict
     
     def get_metacritics(self, appid: str):
         fields = ['score','url']
-        item = self._search_db('appid', appid, fields, 'metacritic')
+        item = self._search_appid(appid, fields, 'metacritic')
         return item[0] if item else {}
     
+    def get_game_features(self, appids: List[int], from_feature_table: bool = False) -> Dict[int, Dict[str, Any]]:
+        """
+            Gets everything stored about each game in one query per table, instead of a query per game per table.
+            Developers, publishers, categories and genres are aggregated into lists by the database.
+            
+            Args:
+                appids: games to get features for
+                from_feature_table: read the game_features table first, a single indexed lookup.
+                                    Only as current as the last refresh_game_features,
+                                    games missing from it are read from the game tables.
+            Returns: appid -> game fields plus developers, publishers, categories, genres, price and metacritic.
+                     Games not found in the games table are left out.
+        """
+        if not appids:
+            return {}
+        appids = [int(appid) for appid in appids]
+        
+        game_fields = self.GAME_FEATURE_FIELDS
+        price_fields = self.PRICE_FEATURE_FIELDS
+        metacritic_fields = self.METACRITIC_FEATURE_FIELDS
+        name_lists = self.FEATURE_NAME_LISTS
+        
+        features = {}
+        with self._connection() as (conn, cur):
+            try:
+                if from_feature_table:
+                    features = self._get_features_from_table(conn, cur, appids)
+                    logger.info(f"Database game_features {len(features)} Fetched")
+                    # games the table doesn't have yet are built from the game tables below
+                    appids = [appid for appid in appids if appid not in features]
+                    if not appids:
+                        return features
+                
+                cur.execute(f"SELECT appid, {', '.join(game_fields)} FROM games WHERE appid = ANY(%s)", (appids,))
+                for row in cur.fetchall():
+                    features[row[0]] = dict(zip(game_fields, row[1:]))
+                    features[row[0]] |= {
+                        'developers': [], 'publishers': [], 'categories': [], 'genres': [],
+                        'price': {}, 'metacritic': {}
+                    }
+                
+                for feature, (table, column) in name_lists.items():
+                    cur.execute(f"""
+                        SELECT appid, array_agg({column} ORDER BY {column})
+                        FROM {table}
+                        WHERE appid = ANY(%s)
+                        GROUP BY appid
+                    """, (appids,))
+                    for appid, names in cur.fetchall():
+                        if appid in features:
+                            features[appid][feature] = names
+                
+                for feature, table, fields in [('price', 'prices', price_fields), ('metacritic', 'metacritic', metacritic_fields)]:
+                    cur.execute(f"SELECT appid, {', '.join(fields)} FROM {table} WHERE appid = ANY(%s)", (appids,))
+                    for row in cur.fetchall():
+                        if row[0] in features:
+                            features[row[0]][feature] = dict(zip(fields, row[1:]))
+                
+                logger.info(f"Database game features {len(features)} Fetched")
+                return features
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database Fetching game features: {e}")
+                if conn:
+                    conn.rollback()
+        
+        return {}
+    
+    def _get_features_from_table(self, conn, cur, appids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """
+            Reads game_features rows and shapes them the same as get_game_features.
+            Returns nothing if the table can't be read, e.g. it hasn't been created.
+        """
+        columns = self._feature_table_columns()
+        try:
+            cur.execute(f"SELECT {', '.join(columns)} FROM game_features WHERE appid = ANY(%s)", (appids,))
+        except pg2.Error as e:
+            logger.warning(f"Database game_features unavailable, using game tables: {e}")
+            conn.rollback()
+            return {}
+        
+        features = {}
+        for row in cur.fetchall():
+            row = dict(zip(columns, row))
+            features[row['appid']] = self._feature_from_row(row)
+        return features
+    
+    def _feature_table_columns(self) -> List[str]:
+        return ['appid'] + self.GAME_FEATURE_FIELDS + list(self.FEATURE_NAME_LISTS) + self.PRICE_FEATURE_FIELDS + ['metacritic_score', 'metacritic_url']
+    
+    def _feature_from_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """
+            Shape a game_features row, by column name, the same as get_game_features.
+        """
+        feature = {field: row[field] for field in self.GAME_FEATURE_FIELDS + list(self.FEATURE_NAME_LISTS)}
+        # games without a price or metacritic row come back as NULL columns
+        has_price = any(row[field] is not None for field in self.PRICE_FEATURE_FIELDS)
+        feature['price'] = {field: row[field] for field in self.PRICE_FEATURE_FIELDS} if has_price else {}
+        has_metacritic = row['metacritic_score'] is not None or row['metacritic_url'] is not None
+        feature['metacritic'] = {'score': row['metacritic_score'], 'url': row['metacritic_url']} if has_metacritic else {}
+        return feature
+    
+    def stream_game_features(self, batch_size: int = 1000, itersize: int = None) -> Iterator[Dict[int, Dict[str, Any]]]:
+        """
+            Scans every row of game_features without loading the table into memory.
+            
+            Args:
+                batch_size: games within each yielded batch
+                itersize: rows fetched from the server per round trip, STREAM_ITERSIZE if not given
+            Yields: appid -> features, shaped the same as get_game_features, batch_size games at a time
+            Raises: pg2.Error if the scan fails, see stream_rows
+        """
+        for rows in self.stream_rows('game_features', self._feature_table_columns(), itersize=itersize, batch_size=batch_size, compact=True):
+            yield {row['appid']: self._feature_from_row(row) for row in rows}
+    
+    def stream_rows(self, table: str, fields: List[str], column: str = None, value: Any = None,
+                    itersize: int = None, batch_size: int = None, compact: bool = False) -> Iterator:
+        """
+            Reads rows through a named server side cursor so only itersize rows are in memory at once,
+            use instead of the get_* functions for whole tables or very large libraries.
+            
+            The connection is held until the generator is used up or closed,
+            with a single shared connection other threads wait until then.
+            Use a pool (max_connections) for large scans: on the shared connection the cursor is WITH HOLD
+            so the first commit by another call while streaming makes the server copy every remaining row.
+            Rows still reach Python itersize at a time, but the server side memory saving is lost.
+            
+            Args:
+                table: Name of the table to read
+                fields: columns of each row
+                column: only rows where column equals value, every row if not given
+                value: value column must equal
+                itersize: rows fetched from the server per round trip, STREAM_ITERSIZE if not given
+                batch_size: yield lists of this many rows instead of one row at a time
+                compact: rows are Records instead of dicts, see _row_maker
+            Yields: each row as a dict of fields, or lists of them when batch_size is given
+            Raises: pg2.Error if the scan fails, once the cursor is closed and the transaction ended
+        """
+        query = f"SELECT {', '.join(fields)} FROM {table}"
+        params = None
+        if column is not None:
+            query += f" WHERE {column} = %s"
+            params = (value,)
+        
+        make_row = self._row_maker(fields, compact)
+        count = 0
+        with self._connection() as (conn, _):
+            # the shared connection can be committed by other calls while rows are read, a hold cursor outlives that
+            cur = conn.cursor(name=f"steam_db_stream_{uuid.uuid4().hex}", withhold=self.pool is None)
+            cur.itersize = itersize or self.STREAM_ITERSIZE
+            try:
+                cur.execute(query, params)
+                if batch_size:
+                    while rows := cur.fetchmany(batch_size):
+                        count += len(rows)
+                        yield [make_row(row) for row in rows]
+                else:
+                    for row in cur:
+                        count += 1
+                        yield make_row(row)
+                logger.info(f"Database {table} {count} Streamed")
+            except pg2.Error as e:
+                # raised so a scan cut short isn't mistaken for a complete one
+                logger.error(f"ERROR: Database Streaming {table} after {count} rows: {e}")
+                raise
+            finally:
+                # named cursor is closed before the transaction that holds it ends,
+                # nothing was written so it's rolled back instead of left idle in transaction
+                cur.close()
+                if not conn.closed:
+                    conn.rollback()
+    
+    def create_game_features_table(self) -> bool:
+        """
+            Creates the denormalized game_features table if it doesn't exist yet,
+            filled with every game already stored. Column types are taken from the tables each feature comes from.
+            
+            Returns: bool, True if table exists once done
+        """
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute("SELECT to_regclass('game_features')")
+                if cur.fetchone()[0] is None:
+                    # no rows are selected, appid only gives the empty array a type
+                    cur.execute(f"CREATE TABLE game_features AS {self.FEATURE_TABLE_SELECT} WITH NO DATA", ([0],))
+                    cur.execute("ALTER TABLE game_features ADD PRIMARY KEY (appid)")
+                    # later ingests only refresh the games they touch, so games stored before now are added here
+                    cur.execute("SELECT COALESCE(array_agg(appid), '{}') FROM games")
+                    cur.execute(f"INSERT INTO game_features ({', '.join(self._feature_table_columns() + ['refreshed_at'])}) {self.FEATURE_TABLE_SELECT}", (cur.fetchone()[0],))
+                    conn.commit()
+                    logger.info(f"Database game_features table created with {cur.rowcount} games")
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database creating game_features: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return False
+    
+    def refresh_game_features(self, appids: List[int]) -> bool:
+        """
+            Rebuilds game_features rows for only the appids passed, e.g. the games touched by the last ingest batch.
+            Games no longer in the games table have their row removed.
+            
+            Args:
+                appids: games whose features have changed
+            Returns: bool, True if rows were refreshed
+        """
+        if not appids:
+            return False
+        appids = [int(appid) for appid in appids]
+        
+        columns = self._feature_table_columns() + ['refreshed_at']
+        updates = ',\n'.join(f"{column} = EXCLUDED.{column}" for column in columns[1:])
+        query = f"""
+            INSERT INTO game_features ({', '.join(columns)})
+            {self.FEATURE_TABLE_SELECT}
+            ON CONFLICT (appid)
+            DO UPDATE SET
+                {updates}
+        """
+        
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute(query, (appids,))
+                cur.execute("""
+                    DELETE FROM game_features
+                    WHERE appid = ANY(%s) AND appid NOT IN (SELECT appid FROM games WHERE appid = ANY(%s))
+                """, (appids, appids))
+                conn.commit()
+                logger.info(f"Database game_features {len(appids)} refreshed")
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database refreshing game_features: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return False
+    
+    def create_refresh_status_table(self) -> bool:
+        """
+            Creates game_refresh_status if it doesn't exist yet.
+            Each game has a row per field class (e.g. price, static) with when that data was last downloaded.
+            
+            Returns: bool, True if table exists once done
+        """
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS game_refresh_status (
+                        appid BIGINT NOT NULL,
+                        field_class TEXT NOT NULL,
+                        refreshed_at TIMESTAMPTZ NOT NULL,
+                        PRIMARY KEY (appid, field_class)
+                    )
+                """)
+                conn.commit()
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database creating game_refresh_status: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return False
+    
+    def create_game_name_index(self) -> bool:
+        """
+            Creates the index on normalized game names that add_paid_price_bulk matches purchases with,
+            if it doesn't exist yet. Run once before purchases are applied, not inside their transaction.
+            
+            Returns: bool, True if index exists once done
+        """
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS games_normalized_name_idx ON games ({self.NORMALIZED_NAME_SQL.format(column='game_name')})")
+                conn.commit()
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database creating games_normalized_name_idx: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return False
+    
+    def mark_games_refreshed(self, appids: List[int], field_classes: List[str]) -> bool:
+        """
+            Records that the field classes of these games were just downloaded.
+            
+            Args:
+                appids: games that were downloaded
+                field_classes: classes of data that were downloaded for every game
+            Returns: bool, True if status was saved
+        """
+        if not appids or not field_classes:
+            return False
+        
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute("""
+                    INSERT INTO game_refresh_status (appid, field_class, refreshed_at)
+                    SELECT a.appid, c.field_class, NOW()
+                    FROM unnest(%s::bigint[]) AS a(appid)
+                    CROSS JOIN unnest(%s::text[]) AS c(field_class)
+                    ON CONFLICT (appid, field_class)
+                    DO UPDATE SET
+                        refreshed_at = EXCLUDED.refreshed_at
+                """, ([int(appid) for appid in appids], list(field_classes)))
+                conn.commit()
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database setting game_refresh_status: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return False
+    
+    def get_stale_games(self, ttls: Dict[str, float], limit: int) -> List[Dict[str, Any]]:
+        """
+            Picks the games most in need of a refresh, for spending a limited request budget.
+            
+            A field class is stale once it is older than its time to live, how overdue it is
+            is its age divided by that ttl, so short lived prices go stale long before descriptions.
+            Games are ordered by their most overdue class weighted by how many users have the game
+            in their library or wishlist. Classes never downloaded are infinitely overdue.
+            
+            Args:
+                ttls: seconds each field class stays fresh
+                limit: most games to return
+            Returns: appid and stale_classes of each game, most in need first
+        """
+        query = """
+            WITH classes AS (
+                SELECT * FROM unnest(%(classes)s::text[], %(ttls)s::float8[]) AS c(field_class, ttl)
+            ),
+            usage AS (
+                SELECT appid, COUNT(*) AS users
+                FROM (SELECT appid FROM user_library UNION ALL SELECT appid FROM wishlist) u
+                GROUP BY appid
+            ),
+            overdue AS (
+                SELECT g.appid, c.field_class,
+                    COALESCE(EXTRACT(EPOCH FROM NOW() - r.refreshed_at)::float8, 'Infinity'::float8) / c.ttl AS overdue
+                FROM games g
+                CROSS JOIN classes c
+                LEFT JOIN game_refresh_status r ON r.appid = g.appid AND r.field_class = c.field_class
+            )
+            SELECT o.appid, array_agg(o.field_class ORDER BY o.field_class) AS stale_classes
+            FROM overdue o
+            LEFT JOIN usage u ON u.appid = o.appid
+            WHERE o.overdue >= 1
+            GROUP BY o.appid, u.users
+            ORDER BY MAX(o.overdue) * (1 + COALESCE(u.users, 0)) DESC, COALESCE(u.users, 0) DESC, o.appid
+            LIMIT %(limit)s
+        """
+        params = {"classes": list(ttls), "ttls": [float(ttl) for ttl in ttls.values()], "limit": limit}
+        
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute(query, params)
+                stale_games = [{"appid": appid, "stale_classes": list(stale_classes)} for appid, stale_classes in cur.fetchall()]
+                logger.info(f"Database {len(stale_games)} stale games picked for refresh")
+                return stale_games
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database Fetching stale games: {e}")
+                if conn:
+                    conn.rollback()
+                    
+        return []
+    
     def add_paid_price(self, user_id: str, game_prices: List[Dict]):
         """ 
             Takes the game name and price user paid for it and addes that price to prices table under user_price_paid.
         """
-        is_user = self._check_table_item('steamid','users', user_id)
+        is_user = self._is_known_user(user_id)
         if not is_user or len(game_prices) < 1:
             return
         
@@ -277,52 +957,250 @@ class SteamDatabase():
             )
         """
         
-        try:
-            for game in game_prices:
-                self.cur.execute(query, (game["price"], game["game_name"]))   
-            self.conn.commit()
-        except pg2.Error as e:
-            logger.error(f"Database Insert Adding user_paid_price to user_library: {e}")
-            if self.conn:
-                self.conn.rollback()
+        with self._connection() as (conn, cur):
+            try:
+                for game in game_prices:
+                    cur.execute(query, (game["price"], game["game_name"]))   
+                conn.commit()
+            except pg2.Error as e:
+                logger.error(f"Database Insert Adding user_paid_price to user_library: {e}")
+                if conn:
+                    conn.rollback()
         
     
+    def add_paid_price_bulk(self, user_id: str, game_prices: List[Dict]) -> Dict[str, int]:
+        """ 
+            Set based add_paid_price, every purchase is applied in one statement.
+            Purchases are copied into a staging table then joined to the user's library by appid,
+            only this user's library is updated. Purchases without an appid are matched to games by normalized name,
+            create_game_name_index keeps that match from scanning games.
+            When a game was bought more than once the last purchase is used.
+            
+            Args:
+                user_id: Steam user ID whose library is updated
+                game_prices: purchases with game_name and price in cents, and appid when already resolved (see NameMatcher)
+            Returns: counts of purchases matched to a game, unmatched and library rows updated
+        """
+        counts = {"matched": 0, "unmatched": 0, "updated": 0}
+        is_user = self._is_known_user(user_id)
+        if not is_user or len(game_prices) < 1:
+            return counts
+        
+        staging_name = self.NORMALIZED_NAME_SQL.format(column='sp.game_name')
+        games_name = self.NORMALIZED_NAME_SQL.format(column='g.game_name')
+        
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute("""
+                    CREATE TEMP TABLE IF NOT EXISTS staging_purchases (game_name TEXT, price INTEGER, appid BIGINT, staging_row BIGINT)
+                """)
+                cur.execute("TRUNCATE staging_purchases")
+                rows = io.StringIO()
+                for index, game in enumerate(game_prices):
+                    rows.write(f"{self._copy_value(game['game_name'])},{self._copy_value(game['price'])},{self._copy_value(game.get('appid'))},{index}\n")
+                rows.seek(0)
+                cur.copy_expert("COPY staging_purchases (game_name, price, appid, staging_row) FROM STDIN WITH (FORMAT csv)", rows)
+                
+                # the appid picked by the matcher is kept, names only match purchases it couldn't resolve
+                cur.execute(f"""
+                    UPDATE user_library ul
+                    SET user_paid_price = purchases.price
+                    FROM (
+                        SELECT DISTINCT ON (appid) appid, price
+                        FROM (
+                            SELECT sp.appid, sp.price, sp.staging_row
+                            FROM staging_purchases sp
+                            WHERE sp.appid IS NOT NULL
+                            UNION ALL
+                            SELECT g.appid, sp.price, sp.staging_row
+                            FROM staging_purchases sp
+                            JOIN games g ON {games_name} = {staging_name}
+                            WHERE sp.appid IS NULL
+                        ) matched
+                        ORDER BY appid, staging_row DESC
+                    ) purchases
+                    WHERE ul.steamid = %s AND ul.appid = purchases.appid
+                """, (user_id,))
+                counts["updated"] = cur.rowcount
+                
+                cur.execute(f"""
+                    SELECT COUNT(*) FILTER (WHERE sp.appid IS NOT NULL OR EXISTS (SELECT 1 FROM games g WHERE {games_name} = {staging_name}))
+                    FROM staging_purchases sp
+                """)
+                counts["matched"] = cur.fetchone()[0]
+                counts["unmatched"] = len(game_prices) - counts["matched"]
+                conn.commit()
+                logger.info(f"DB - user_library - Purchases matched {counts['matched']}, unmatched {counts['unmatched']}, updated {counts['updated']}")
+            except (KeyError, pg2.Error) as e:
+                logger.error(f"Database Insert Adding user_paid_price to user_library: {e}")
+                if conn:
+                    conn.rollback()
+                counts = {"matched": 0, "unmatched": 0, "updated": 0}
+        
+        return counts
+    
+    def add_games_batch(self, user_id: str, items: List[Dict[str, Any]]) -> int:
+        """
+            Adds a batch of processed games to games, developers, publishers, categories, genres, prices and metacritic
+            in a single transaction. The user is checked once and everything is committed once,
+            if any table fails nothing from the batch is saved.
+            
+            Args:
+                user_id: Steam user ID the games were retrieved for
+                items: processed games from the steam server
+            Returns: number of games added, 0 if user doesn't exist or batch failed
+        """
+        is_user = self._is_known_user(user_id)
+        if not is_user or not items:
+            return 0
+        
+        # build every table's rows first so a missing key fails before anything is written
+        inserts = [
+            self._games_rows(items),
+            self._developers_rows(items),
+            self._publishers_rows(items),
+            self._categories_rows(items),
+            self._genres_rows(items),
+            self._prices_rows(items),
+            self._metacritic_rows(items)
+        ]
+        
+        table = ''
+        with self._connection() as (conn, cur):
+            try:
+                for table, fields, rows, on_conflict in inserts:
+                    self._execute_insert(cur, table, fields, rows, on_conflict)
+                conn.commit()
+                for table, fields, rows, on_conflict in inserts:
+                    self._invalidate_cache(table, rows)
+                logger.info(f"DB - Batch - Total Games {len(items)} have been added to {len(inserts)} tables!")
+                return len(items)
+            except KeyError as ke:
+                logger.error(f"Database Batch Insert {table}: {ke}")
+            except pg2.Error as e:
+                logger.error(f"Database Batch Insert {table}: {e}")
+            
+            if conn:
+                conn.rollback()
+        return 0
+    
     def _add_to_database(self, user_id: str, items: List[Dict[str, Any]], on_conflict: str, fields: List, table: str)-> int:
-        is_user = self._check_table_item('steamid','users', user_id)
+        is_user = self._is_known_user(user_id)
         if not is_user:
             return 0
         
         has_passed = self._insert_new_row(table, fields, items, on_conflict)
+        self._invalidate_cache(table, items)
         if has_passed:
             logger.info(f"DB - {table} - Total Items {len(items)} have been added!")     
         return len(items)
     
-    def _search_db(self, column: str, value, fields: List[str], table: str)-> List[Dict[str,Any]]:
-        try:
-            columns = ', '.join(fields)
-            query = f"""
-                SELECT {columns} FROM {table}
-                WHERE {column} = '{value}';
-            """
+    def _is_known_user(self, user_id: str) -> bool:
+        """
+            Check if user_id is in users without a query each time.
+            Every steamid is loaded by one query on first use and add_steam_user adds new ones,
+            a steamid not loaded is still looked up in case another session added it.
+            A user removed since loading is caught by the foreign keys of the user tables.
+            
+            Returns: bool, True if user exists
+        """
+        with self._users_lock:
+            if self._known_users is None:
+                self._known_users = self._load_known_users()
+        
+        user_id = str(user_id)
+        if user_id in self._known_users:
+            return True
+        if self._check_table_item('steamid', 'users', user_id):
+            self._known_users.add(user_id)
+            return True
+        return False
+    
+    def _load_known_users(self) -> set:
+        with self._connection() as (conn, cur):
+            try:
+                cur.execute("SELECT steamid FROM users")
+                users = {str(steamid) for steamid, in cur.fetchall()}
+                logger.info(f"Database users {len(users)} Fetched")
+                return users
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database Fetching users: {e}")
+                if conn:
+                    conn.rollback()
+        return set()
+    
+    def _search_appid(self, appid, fields: List[str], table: str)-> List[Dict[str,Any]]:
+        """
+            _search_db by appid, read through read_cache when caching is on.
+            Callers get copies of the cached rows so changing them doesn't change the cache.
+        """
+        if self.read_cache is None:
+            return self._search_db('appid', appid, fields, table)
+        
+        key = (table, str(appid))
+        found, items = self.read_cache.get(key)
+        if not found:
+            generation = self.read_cache.generation
+            try:
+                items = self._search_db('appid', appid, fields, table, raise_errors=True)
+            except pg2.Error:
+                # a failed read isn't cached, the next call asks the database again
+                return []
+            self.read_cache.set(key, items, generation)
+        return [dict(item) for item in items]
+    
+    def _invalidate_cache(self, table: str, items: List[Dict[str, Any]]):
+        """
+            Drop cached results of table for every appid within items.
+        """
+        if self.read_cache is not None:
+            self.read_cache.invalidate({(table, str(item['appid'])) for item in items if 'appid' in item})
+    
+    def cache_stats(self) -> Dict[str, int]:
+        """
+            Returns: read_cache hits, misses, evictions and size, empty when caching is off
+        """
+        return self.read_cache.stats() if self.read_cache is not None else {}
+    
+    def _row_maker(self, fields: List[str], compact: bool):
+        """
+            Function turning a database row into a dict of fields,
+            or when compact into a Record shared by every query with these fields.
+            A Record reads like a read only dict but uses a fraction of the memory, for results with many rows.
+        """
+        if compact:
+            return record_type(tuple(fields)).from_row
+        return lambda row: dict(zip(fields, row))
+    
+    def _search_db(self, column: str, value, fields: List[str], table: str, compact: bool = False,
+                   raise_errors: bool = False)-> List[Dict[str,Any]]:
+        """
+            Rows of table where column equals value, as dicts of fields or Records when compact.
+            A database error returns nothing, or is raised once rolled back when raise_errors is set.
+        """
+        with self._connection() as (conn, cur):
+            try:
+                columns = ', '.join(fields)
+                query = f"""
+                    SELECT {columns} FROM {table}
+                    WHERE {column} = $1
+                """
             
-            self.cur.execute(query)
-            items = self.cur.fetchall()
+                self._execute_prepared(conn, cur, query, (value,))
+                items = cur.fetchall()
             
-            # need to return in json format just like the server would
-            items_dict = []
-            for item in items:
-                item_json = {}
-                for index,field in enumerate(fields):
-                    item_json[field] = item[index]
-                
-                items_dict.append(item_json) 
+                # need to return in json format just like the server would
+                make_row = self._row_maker(fields, compact)
+                items_dict = [make_row(item) for item in items]
             
-            logger.info(f"Database {table} {len(items_dict)} Fetched")
-            return items_dict
-        except pg2.Error as e:
-            logger.error(f"ERROR: Database Fetching {table}: {e}")
-            if self.conn:
-                self.conn.rollback()
+                logger.info(f"Database {table} {len(items_dict)} Fetched")
+                return items_dict
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database Fetching {table}: {e}")
+                if conn:
+                    conn.rollback()
+                if raise_errors:
+                    raise
                 
         return []  
     
@@ -337,37 +1215,109 @@ class SteamDatabase():
                 items: values to place within each field
             Return: True is row was inserted, otherwise False
         """
-        try:
-            fields_len = len(fields)
-            columns = ', '.join(fields)
-            placeholders = ', '.join(['%s'] * fields_len)
-
-            query = f"""
-                INSERT INTO {table} ({columns})
-                VALUES ({placeholders})
-            """
-            query += on_conflict
-            
-            values = []  
-            for item in items:
-                # check if item has data in it
-                if item:
-                    row_values = [item[field] for field in fields]
-                    values.append(row_values)
-                
-            # place all item values in placeholder spot, then execute query
-            self.cur.executemany(query, values)
-            self.conn.commit()
-            return True
-        except KeyError as ke:
-            logger.error(f"Database Insert {table}, {fields}, {items}: {ke}")
-        except pg2.Error as e:
-            logger.error(f"Database Insert {table}: {e}")
-            if self.conn:
-                self.conn.rollback()
+        with self._connection() as (conn, cur):
+            try:
+                self._execute_insert(cur, table, fields, items, on_conflict)
+                conn.commit()
+                return True
+            except KeyError as ke:
+                logger.error(f"Database Insert {table}, {fields}, {items}: {ke}")
+            except pg2.Error as e:
+                logger.error(f"Database Insert {table}: {e}")
+                if conn:
+                    conn.rollback()
                 
         return False
     
+    def _execute_insert(self, cur, table: str, fields: List[str], items: List[Dict[str, Any]], on_conflict: str=''):
+        """
+            Runs the insert for _insert_new_row without committing, so it can be part of a larger transaction.
+            Large inserts are handed to _copy_insert.
+            Errors are left for the caller to handle.
+        """
+        values = []  
+        for item in items:
+            # check if item has data in it
+            if item:
+                row_values = [item[field] for field in fields]
+                values.append(row_values)
+        
+        if len(values) >= self.COPY_THRESHOLD:
+            self._copy_insert(cur, table, fields, values, on_conflict)
+            return
+            
+        fields_len = len(fields)
+        columns = ', '.join(fields)
+        placeholders = ', '.join(['%s'] * fields_len)
+
+        query = f"""
+            INSERT INTO {table} ({columns})
+            VALUES ({placeholders})
+        """
+        query += on_conflict
+            
+        # place all item values in placeholder spot, then execute query
+        cur.executemany(query, values)
+    
+    def _copy_insert(self, cur, table: str, fields: List[str], values: List[List[Any]], on_conflict: str=''):
+        """
+            Bulk insert, rows are streamed into a temp staging table with COPY FROM STDIN
+            then moved into table with a single INSERT ... SELECT using the same on_conflict as a normal insert.
+            
+            When a key shows up more than once only its last row is kept,
+            the same result as inserting the rows one after another.
+            
+            Args:
+                cur: cursor of the transaction to load within
+                table: Name of the table to insert into
+                fields: List of column names for values to be placed
+                values: rows of values in the same order as fields
+                on_conflict: ON CONFLICT clause used by table
+        """
+        staging = f"staging_{table}"
+        columns = ', '.join(fields)
+        # staging table only has the columns being loaded, plus the order rows came in
+        cur.execute(f"""
+            CREATE TEMP TABLE IF NOT EXISTS {staging} AS
+            SELECT {columns}, 0::bigint AS staging_row FROM {table} WITH NO DATA
+        """)
+        cur.execute(f"TRUNCATE {staging}")
+        
+        rows = io.StringIO()
+        for index, row_values in enumerate(values):
+            rows.write(','.join(self._copy_value(value) for value in row_values))
+            rows.write(f",{index}\n")
+        rows.seek(0)
+        cur.copy_expert(f"COPY {staging} ({columns}, staging_row) FROM STDIN WITH (FORMAT csv)", rows)
+        
+        select = f"SELECT {columns} FROM {staging}"
+        conflict_keys = re.search(r"ON CONFLICT\s*\(([^)]*)\)", on_conflict)
+        if conflict_keys:
+            keys = conflict_keys.group(1)
+            # a single statement can't update the same row twice, keep the last row for each key
+            select = f"SELECT DISTINCT ON ({keys}) {columns} FROM {staging} ORDER BY {keys}, staging_row DESC"
+        
+        query = f"""
+            INSERT INTO {table} ({columns})
+            {select}
+        """
+        query += on_conflict
+        cur.execute(query)
+        logger.info(f"Database COPY {table} {len(values)} rows loaded")
+    
+    def _copy_value(self, value: Any) -> str:
+        """
+            Format a value for COPY csv, unquoted empty is NULL and quoted empty is an empty string.
+        """
+        if value is None:
+            return ''
+        if isinstance(value, bool):
+            return 't' if value else 'f'
+        if isinstance(value, (int, float)):
+            return str(value)
+        text = str(value).replace('"', '""')
+        return f'"{text}"'
+    
     def _delete_entries(self, user_id: str, table: str, items: List[Any]) -> bool:
         """
             Delete all entries of user from specified table
@@ -378,22 +1328,22 @@ class SteamDatabase():
         """
         if not items:
             return False
-        try:
-            appids = ', '.join(str(item) for item in items)
-            query = f"""
-                DELETE FROM {table}
-                WHERE steamid = '{user_id}' AND appid IN ({appids})
-            """
-                
-            # place all item values in placeholder spot, then execute query
-            self.cur.execute(query)
-            self.conn.commit()
-            logger.info(f"Database SteamID {user_id}, DELETE {len(items)} items from {table}")
-            return True
-        except pg2.Error as e:
-            logger.error(f"ERROR: Database DELETE {table}: {e}")
-            if self.conn:
-                self.conn.rollback()
+        with self._connection() as (conn, cur):
+            try:
+                query = f"""
+                    DELETE FROM {table}
+                    WHERE steamid = $1 AND appid = ANY($2)
+                """
+                    
+                # place all item values in placeholder spot, then execute query
+                self._execute_prepared(conn, cur, query, (user_id, [int(item) for item in items]))
+                conn.commit()
+                logger.info(f"Database SteamID {user_id}, DELETE {len(items)} items from {table}")
+                return True
+            except pg2.Error as e:
+                logger.error(f"ERROR: Database DELETE {table}: {e}")
+                if conn:
+                    conn.rollback()
                 
         return False
     
@@ -409,27 +1359,27 @@ class SteamDatabase():
                 
             Returns: bool, True if data needs to be updated
         """
-        # check if user has stored data already
-        is_user = self._check_table_item('steamid', 'schedule_data_retrieval', user_id)
-        # if no user than schedule update
-        if is_user:
+        with self._connection() as (conn, cur):
             try:
                 # checks if a week has passed since last update
                 query = f"""
                     SELECT needs_retrieval({column}) 
                     FROM schedule_data_retrieval 
-                    WHERE steamid = '{user_id}';
+                    WHERE steamid = $1
                 """
                 
-                self.cur.execute(query)
-                first_item = self.cur.fetchone()
+                self._execute_prepared(conn, cur, query, (user_id,))
+                first_item = cur.fetchone()
+                # if user has no stored data yet then schedule update
+                if first_item is None:
+                    return True
                 # sometimes it gets return as a single item or tuple, even when its just one item
                 first_item = first_item[0] if isinstance(first_item, tuple) else first_item
                 return first_item
             except pg2.Error as e:
                 logger.error(f"ERROR: Database Fetching Schedule: {e}")
-                if self.conn:
-                    self.conn.rollback()
+                if conn:
+                    conn.rollback()
                     
         return True
             
@@ -444,15 +1394,18 @@ class SteamDatabase():
                 
             Returns: bool, indicating if item exists
         """
-        try:
-            self.cur.execute(f"SELECT {column} FROM {table} WHERE {column} = '{item}'")
-            if self.cur.fetchone() is not None:
-                logger.info(f"Found - Item: {item}, From Table: {table} Column {column}!")
-                return True
-            else:
-                logger.warning(f"Doesn't Exist - Item: {item}, From Table: {table} Column {column}!")
-        except pg2.Error as e:
-            logger.error(f"ERROR - Database Selection: {e}")
+        with self._connection() as (conn, cur):
+            try:
+                self._execute_prepared(conn, cur, f"SELECT {column} FROM {table} WHERE {column} = $1", (item,))
+                if cur.fetchone() is not None:
+                    logger.info(f"Found - Item: {item}, From Table: {table} Column {column}!")
+                    return True
+                else:
+                    logger.warning(f"Doesn't Exist - Item: {item}, From Table: {table} Column {column}!")
+            except pg2.Error as e:
+                logger.error(f"ERROR - Database Selection: {e}")
+                if conn:
+                    conn.rollback()
             
         return False
     
@@ -467,23 +1420,21 @@ class SteamDatabase():
             Args: user_id: Steam user ID   
             Returns: bool, True if data was updated, False if user_id doesn't exist in table or data wasn't set
         """
-        # check if user has stored data already
-        is_user = self._check_table_item('steamid', 'schedule_data_retrieval', user_id)
-        # if no user than schedule update
-        if is_user:
+        with self._connection() as (conn, cur):
             try:
-                # checks if a week has passed since last update
-                query = f"""
+                query = """
                     UPDATE schedule_data_retrieval
                     SET games_updated_at = NOW()
-                    WHERE steamid = '{user_id}'
+                    WHERE steamid = $1
                 """
                 
-                self.cur.execute(query)
-                return True
+                self._execute_prepared(conn, cur, query, (user_id,))
+                conn.commit()
+                # no row updated when user has no stored data yet
+                return cur.rowcount > 0
             except pg2.Error as e:
                 logger.error(f"ERROR: Database setting games_updated_at failed: {e}")
-                if self.conn:
-                    self.conn.rollback()
-        else:          
-            return False
\ No newline at end of file
+                if conn:
+                    conn.rollback()
+        
+        return False
\ No newline at end of file
@@ -14,7 +14,10 @@ def load_game_data_to_db():
         game_finder.load_wishlist()
         game_finder.load_library()
         game_finder.store_game_data_to_db()
-        game_finder.parse_payment_history() 
+        game_finder.refresh_stale_games()
+        game_finder.parse_payment_history()
+        game_finder.import_kinguin_orders()
+        game_finder.import_steam_pdf_orders()
 
 def main(load_game_data:bool = False):
     BASE_MODEL = "meta-llama/Meta-Llama-3.1-8B"
@@ -28,7 +31,8 @@ def main(load_game_data:bool = False):
     steam = Steam(STEAM_API_KEY, STEAM_USER_ID)
     
     user_games= []
-    game_finder = StoreToDB(steam, db)
+    # wishlist and library are only read, Records keep them small
+    game_finder = StoreToDB(steam, db, compact_rows=True)
     wishlist = game_finder.load_wishlist(False)
     for game in wishlist:
         priority = game["priority"]
@@ -53,31 +57,29 @@ def main(load_game_data:bool = False):
         })
     
     
-    for user_game in user_games:
-        appid = str(user_game["appid"])
-        game_info = db.get_game(appid) 
-        developers = db.get_developers(appid)
-        categories = db.get_categories()
+    # every feature for every game from game_features, a single lookup kept current by each ingest batch
+    db.create_game_features_table()
+    game_features = db.get_game_features([user_game["appid"] for user_game in user_games], from_feature_table=True)
+    for index, user_game in enumerate(user_games):
+        game_info = game_features.get(user_game["appid"])
+        if not game_info:
+            continue
+        
         new_data = {
             "game_name": game_info["game_name"],
             "is_free": game_info["is_free"],
             "detailed_description": game_info["detailed_description"],
             "recommendations": game_info["recommendations"],
             "esrb_rating": game_info["esrb_rating"],
-            "developers": ",".join([developer for developer in developers["developer_name"]]),
-            "categories": 
+            "developers": ",".join(game_info["developers"]),
+            "publishers": ",".join(game_info["publishers"]),
+            "categories": ",".join(game_info["categories"]),
+            "genres": ",".join(game_info["genres"]),
+            "price_in_cents": game_info["price"].get("price_in_cents", 0),
+            "metacritic_score": game_info["metacritic"].get("score", 0)
         }
         
-        user_game = user_game | new_data
-          
-
-    # appid category_name
-    categories = db.get_categories()
-    publishers = db.get_publishers()
-    genres = db.get_genres()
-    prices = db.get_prices()
-    # appid score
-    metacritic = db.get_metacritics()
+        user_games[index] = user_game | new_data
     # TODO: where does rating come from
     # rating, description
     # rating = db.get_rating()
@@ -0,0 +1,102 @@
+from typing import List, Dict, Any
+
+from src.steam_api import Steam
+from src.store_to_db import StoreToDB
+from data.steam_database import SteamDatabase
+from src import logger
+from src.tools.rate_limiter import TokenBucket
+from src.tools.response_cache import ResponseCache
+
+class MultiUserIngest:
+    """
+        Ingests many Steam accounts at once while downloading each game only once.
+
+        Every user's wishlist and library is synced first, then the games new to the database
+        are merged into one work list without duplicates and downloaded by a single ingest.
+        Game data is shared by every user, so once it's saved each user that had the game is done.
+        All users draw from the same token bucket and response cache, so the request budget
+        is shared instead of each account getting its own.
+    """
+
+    def __init__(self, steam_api_key: str, steamids: List[str], db: SteamDatabase,
+                 rate_limiter: TokenBucket = None, cache: ResponseCache = None):
+        """
+            Args:
+                steam_api_key: Steam API key for authentication
+                steamids: Steam user IDs to ingest, repeats are ignored
+                db: database every user is saved to
+                rate_limiter: global request budget, StoreToDB.REQUEST_LIMIT per REQUEST_PERIOD if not given
+                cache: response cache shared by every user, StoreToDB.CACHE_DIR if not given
+        """
+        self.db = db
+        self.rate_limiter = rate_limiter or TokenBucket(StoreToDB.REQUEST_LIMIT, StoreToDB.REQUEST_PERIOD)
+        self.cache = cache or ResponseCache(StoreToDB.CACHE_DIR)
+        self.users = {
+            steamid: StoreToDB(Steam(steam_api_key, steamid, rate_limiter=self.rate_limiter, cache=self.cache), db)
+            for steamid in dict.fromkeys(steamids)
+        }
+
+    def run(self, pipelined: bool = False, refresh_stale: bool = True) -> Dict[str, Dict[str, Any]]:
+        """
+            Sync every user, download the games new to any of them once, then mark each user as updated.
+            A user whose games didn't all save is left pending so the next run picks it up again.
+
+            Args:
+                pipelined: download games with the pipelined ingest, see StoreToDB.store_game_data_to_db
+                refresh_stale: spend a rate limit window refreshing stored games once new games are saved
+            Return: for each steamid that has an account, its wishlist and library sizes,
+                    how many of its games were new and how many of those another user also needed
+        """
+        active = {}
+        for steamid, store in self.users.items():
+            if not store.load_user():
+                logger.warning(f"SteamID {steamid} has no account, skipping")
+                continue
+            store.load_wishlist()
+            store.load_library()
+            active[steamid] = store
+
+        if not active:
+            return {}
+
+        # each appid is downloaded once however many users need it
+        new_appids = {steamid: list(store.new_appids) for steamid, store in active.items()}
+        needed_by = {}
+        for appids in new_appids.values():
+            for appid in appids:
+                needed_by[appid] = needed_by.get(appid, 0) + 1
+        appids_to_download = list(needed_by)
+        logger.info(f"Ingest {len(active)} users: {len(appids_to_download)} unique games to download, "
+                    f"{sum(needed_by.values()) - len(appids_to_download)} duplicates skipped")
+
+        ingest = next(iter(active.values()))
+        ingest.new_appids = appids_to_download
+        ingest.store_game_data_to_db(pipelined)
+        if refresh_stale:
+            ingest.refresh_stale_games()
+
+        # appids in batches that failed to save, the shared ingest keeps them for its next run
+        failed = set(ingest.new_appids)
+        results = {}
+        for steamid, store in active.items():
+            if store is not ingest:
+                store.new_appids = [appid for appid in new_appids[steamid] if appid in failed]
+                if store.new_appids:
+                    logger.warning(f"SteamID {steamid}: {len(store.new_appids)} games failed to save, left pending")
+                else:
+                    # the games this user needed were saved by the shared ingest
+                    self.db.set_games_update_status(store.user_id)
+            results[steamid] = {
+                "wishlist": len(store.wishlist),
+                "library": len(store.library),
+                "new_games": len(new_appids[steamid]),
+                "shared_games": sum(1 for appid in new_appids[steamid] if needed_by[appid] > 1)
+            }
+        return results
+
+    def close(self):
+        """
+            Close the connections of every user's steam client.
+        """
+        for store in self.users.values():
+            store.steam.close()
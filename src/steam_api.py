@@ -10,11 +10,21 @@
     Game Info
 """
 import requests
-from typing import Dict, Any, List
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 import logging
+import random
 import re
+import threading
 import time
 
+from src.tools.rate_limiter import TokenBucket
+from src.tools.response_cache import ResponseCache
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
@@ -31,17 +41,190 @@ class Steam():
     STEAM_LIBRARY_URL = 'https://api.steampowered.com/IPlayerService/GetOwnedGames/v0001/'
     STEAM_GAME_URL = 'https://store.steampowered.com/api/appdetails'
     STEAM_USER_URL = 'https://api.steampowered.com/ISteamUser/GetPlayerSummaries/v0002/'
+    # Connection pool settings, one pool is kept per host
+    POOL_CONNECTIONS = 2 # hosts to keep pools for within a session
+    POOL_MAXSIZE = 10 # connections kept alive per host, should be >= workers fetching at once
+    TIMEOUT = (5, 15) # Seconds, (connect, read)
+    # Retry settings for throttled requests, server errors and dropped connections
+    MAX_RETRIES = 5
+    BACKOFF_BASE = 1.0 # Seconds, doubled after each failed attempt
+    BACKOFF_MAX = 60.0 # Seconds
+    RETRY_AFTER_MAX = 300.0 # Seconds, longest a Retry-After header can make a request wait
+    RETRY_STATUSES = {500, 502, 503, 504}
+    THROTTLED_STATUS = 429
+    THROTTLE_FACTOR = 0.5 # rate limiter is slowed by this much after a 429
+    THROTTLE_PERIOD = 5 * 60 # Seconds, how long the rate limiter stays slowed
     
-    def __init__(self, steam_api_key: str, user_id: str):
+    def __init__(self, steam_api_key: str, user_id: str, rate_limiter: TokenBucket = None, 
+                 pool_connections: int = POOL_CONNECTIONS, pool_maxsize: int = POOL_MAXSIZE, timeout: Tuple[float, float] = TIMEOUT,
+                 cache: ResponseCache = None, locale: str = '', max_retries: int = MAX_RETRIES):
         """ 
             Initialize Steam API client with API key and user ID
             
             Args:
                 steam_api_key: Steam API key for authentication
                 user_id: Steam user ID to retrieve data for
+                rate_limiter: token bucket every game data request must take a token from, None for no limit
+                pool_connections: number of connection pools cached by each session
+                pool_maxsize: max connections kept alive for each host
+                timeout: seconds to wait on (connect, read) before a request fails
+                cache: on disk cache for game data responses, None to always call the server
+                locale: language game data is returned in, empty for steam's default
+                max_retries: times a throttled, failed or dropped request is tried again
         """
         self.steam_api_key = steam_api_key
         self.user_id = user_id
+        self.rate_limiter = rate_limiter
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.timeout = timeout
+        self.cache = cache
+        self.locale = locale
+        self.max_retries = max_retries
+        # long lived keep-alive sessions, api.steampowered.com and store.steampowered.com each get their own
+        self._sessions: Dict[str, requests.Session] = {}
+        self._request_counts: Dict[str, int] = {}
+        self._session_lock = threading.Lock()
+        # workers get_games_data reuses between batches, created on first use
+        self._executor: ThreadPoolExecutor = None
+        self._executor_workers = 0
+        self._executor_lock = threading.Lock()
+        
+    def _get_session(self, host: str) -> requests.Session:
+        """
+            Get the pooled session for a host, creating it the first time the host is called.
+        """
+        with self._session_lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+                self._request_counts[host] = 0
+            return session
+    
+    def _get(self, url: str, params: Dict[str, Any], headers: Dict[str, str] = None, rate_limited: bool = False) -> requests.Response:
+        """
+            Make a GET request using the session pooled for the url's host.
+            Throttled (429) and server error (5xx) responses and connection errors are retried
+            with exponential backoff and jitter, Retry-After is used when the server sends it.
+            
+            Args:
+                rate_limited: take a token from the rate limiter before each attempt
+            Return: response from server, raise_for_status has not been called
+        """
+        host = urlsplit(url).netloc
+        session = self._get_session(host)
+        kwargs = {'params': params, 'timeout': self.timeout}
+        if headers:
+            kwargs['headers'] = headers
+        
+        attempt = 0
+        while True:
+            if rate_limited and self.rate_limiter:
+                self.rate_limiter.acquire()
+            
+            # every attempt is its own request for connection_stats
+            with self._session_lock:
+                self._request_counts[host] += 1
+            try:
+                response = session.get(url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt >= self.max_retries:
+                    raise
+                wait_time = self._backoff_time(attempt)
+                logger.warning(f"Request to {url} failed ({e.__class__.__name__}), retrying in {wait_time:.1f}s")
+            else:
+                status = response.status_code
+                if status == self.THROTTLED_STATUS:
+                    # steam wants fewer requests, slow down everyone sharing the rate limiter
+                    if self.rate_limiter:
+                        self.rate_limiter.throttle(self.THROTTLE_FACTOR, self.THROTTLE_PERIOD)
+                elif status not in self.RETRY_STATUSES:
+                    return response
+                
+                if attempt >= self.max_retries:
+                    return response
+                retry_after = self._parse_retry_after(response.headers.get('Retry-After'))
+                wait_time = min(retry_after, self.RETRY_AFTER_MAX) if retry_after is not None else self._backoff_time(attempt)
+                logger.warning(f"Request to {url} returned {status}, retrying in {wait_time:.1f}s")
+            
+            time.sleep(wait_time)
+            attempt += 1
+    
+    def _backoff_time(self, attempt: int) -> float:
+        """
+            Exponential backoff with full jitter, so workers that failed together don't retry together.
+        """
+        return random.uniform(0, min(self.BACKOFF_MAX, self.BACKOFF_BASE * 2 ** attempt))
+    
+    def _parse_retry_after(self, retry_after: str) -> float:
+        """
+            Retry-After can be seconds to wait or a HTTP date to wait until.
+            
+            Return: seconds to wait, None if header is missing or can't be read
+        """
+        if not retry_after:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+    
+    def connection_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+            Shows how well connections are being reused for each host.
+            
+            Return: host -> requests made, connections opened and requests that reused an open connection
+        """
+        stats = {}
+        with self._session_lock:
+            for host, session in self._sessions.items():
+                adapter = session.get_adapter(f"https://{host}")
+                pool = adapter.poolmanager.connection_from_host(host, port=443, scheme='https')
+                requests_made = self._request_counts[host]
+                stats[host] = {
+                    "requests": requests_made,
+                    "connections": pool.num_connections,
+                    "reused": max(0, requests_made - pool.num_connections)
+                }
+        return stats
+    
+    def _get_executor(self, max_workers: int) -> ThreadPoolExecutor:
+        """
+            Get the worker pool shared by every get_games_data call, replaced with a larger one
+            when more workers are asked for than it has.
+        """
+        with self._executor_lock:
+            if self._executor is None or self._executor_workers < max_workers:
+                if self._executor is not None:
+                    # requests already given to the old pool still finish
+                    self._executor.shutdown(wait=False)
+                self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='steam-fetch')
+                self._executor_workers = max_workers
+            return self._executor
+    
+    def close(self):
+        """
+            Close every pooled session and their connections, and stop the fetch workers.
+        """
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+                self._executor_workers = 0
+        with self._session_lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions = {}
+            self._request_counts = {}
         
     def check_user_account(self) -> Dict[str, Any]:
         """
@@ -55,7 +238,7 @@ class Steam():
         }
         
         try:
-            response = requests.get(self.STEAM_USER_URL, params=params)
+            response = self._get(self.STEAM_USER_URL, params=params)
             response.raise_for_status()
             
             # only store profile data that is needed
@@ -113,7 +296,7 @@ class Steam():
         }
         
         try:
-            response = requests.get(self.STEAM_WISHLIST_URL, params=params)
+            response = self._get(self.STEAM_WISHLIST_URL, params=params)
             response.raise_for_status()
             
             data = self._process_wishlist_data(response.json())
@@ -162,7 +345,7 @@ class Steam():
         }
         
         try:
-            response = requests.get(self.STEAM_LIBRARY_URL, params=params)
+            response = self._get(self.STEAM_LIBRARY_URL, params=params)
             response.raise_for_status()
             
             data = self._process_library_data(response.json())
@@ -196,13 +379,27 @@ class Steam():
             
         return process_data
     
-    def get_games_data(self, appids: List[int], wait_time: float = 0.0)-> List[Dict[str,Any]]:
+    def get_games_data(self, appids: List[int], wait_time: float = 0.0, max_workers: int = 1)-> List[Dict[str,Any]]:
+        """
+            Retrieves game data for each appid, returned in the same order as appids.
+            
+            Args:
+                appids: games to retrieve from steam server
+                wait_time: seconds to sleep after each request, only used when fetching one at a time
+                max_workers: how many requests can be in flight at once.
+                             Should be used with a rate_limiter so the workers share the request budget.
+        """
         try:
             processed_games = []
-            for appid in appids:
-                processed_game = self.get_single_game_data(appid)
-                processed_games.append(processed_game)
-                time.sleep(wait_time)
+            if max_workers > 1:
+                # request latency overlaps with waiting on the rate limiter,
+                # the workers are kept between batches instead of started and joined for each one
+                processed_games = list(self._get_executor(max_workers).map(self.get_single_game_data, appids))
+            else:
+                for appid in appids:
+                    processed_game = self.get_single_game_data(appid)
+                    processed_games.append(processed_game)
+                    time.sleep(wait_time)
             
             logger.info(f"Games: {len(processed_games)} games retrieved from Server!") 
             return processed_games
@@ -217,15 +414,10 @@ class Steam():
             
             Note: Steam server can only handle 200 request per 5 minutes.
         """
-        params = {
-            'appids': appid
-        }
-        
         try:
-            response = requests.get(self.STEAM_GAME_URL, params=params)
-            response.raise_for_status()
+            response = self._get_game_response(appid)
             
-            data = self._process_single_game_data(str(appid), response.json())
+            data = self._process_single_game_data(str(appid), response)
             if not data:
                 logger.warning(f"GameId: {appid} has no information!")
             else:
@@ -236,6 +428,81 @@ class Steam():
             logger.error(f"Failed to retrieve GameId {self.user_id}!")
             raise requests.RequestException(f"Failed to retrieve GameId {self.user_id}!")
     
+    def _get_game_response(self, appid: int) -> Dict[str, Any]:
+        """
+            Get the raw appdetails response for a game, from the cache when it's still fresh.
+            Cache hits don't use the network or take a token from the rate limiter.
+            
+            When only prices are stale just the price_overview is downloaded again,
+            otherwise the server is asked if the response changed using ETag/Last-Modified.
+        """
+        entry = self.cache.load(appid, self.locale) if self.cache else None
+        stale_classes = self.cache.stale_classes(entry) if entry else []
+        if entry and not stale_classes:
+            return entry["response"]
+        
+        params = {
+            'appids': appid
+        }
+        if self.locale:
+            params['l'] = self.locale
+        
+        if entry and ResponseCache.STATIC not in stale_classes:
+            # static data is still good, only refresh the fields that expire quickly
+            fields = [field for field_class in stale_classes for field in ResponseCache.FIELD_CLASSES[field_class]]
+            response = self._get(self.STEAM_GAME_URL, params=params | {'filters': ','.join(fields)}, rate_limited=True)
+            response.raise_for_status()
+            response_json = response.json()
+            if not self._is_successful(str(appid), response_json):
+                # cached fields are kept and stay stale, so the next call tries again
+                return entry["response"]
+            self._merge_game_fields(str(appid), entry["response"], response_json, fields)
+            self.cache.refresh(entry, stale_classes)
+            return entry["response"]
+        
+        headers = {}
+        if entry and entry.get("etag"):
+            headers['If-None-Match'] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers['If-Modified-Since'] = entry["last_modified"]
+        
+        response = self._get(self.STEAM_GAME_URL, params=params, headers=headers, rate_limited=True)
+        if entry and response.status_code == 304:
+            # server says nothing has changed
+            self.cache.refresh(entry, stale_classes)
+            return entry["response"]
+        response.raise_for_status()
+        
+        response_json = response.json()
+        # a failed lookup is often temporary, caching it would hide the game until static data expires
+        if self.cache and self._is_successful(str(appid), response_json):
+            self.cache.save(appid, self.locale, response_json, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return response_json
+    
+    def _is_successful(self, appid: str, response: Dict[str, Any]) -> bool:
+        """
+            Steam answers with success false when it has no data for the game right now.
+        """
+        return bool(response.get(appid, {}).get("success", False))
+    
+    def _merge_game_fields(self, appid: str, cached: Dict[str, Any], partial: Dict[str, Any], fields: List[str]):
+        """
+            Copy fields from a filtered appdetails response into a cached full response.
+            Steam leaves a field out when it has no value, e.g. free games have no price_overview.
+        """
+        cached_data = cached.get(appid, {}).get("data")
+        if not isinstance(cached_data, dict):
+            return
+        
+        partial_data = partial.get(appid, {}).get("data", {})
+        # steam returns an empty list instead of a dict when none of the fields exist
+        partial_data = partial_data if isinstance(partial_data, dict) else {}
+        for field in fields:
+            if field in partial_data:
+                cached_data[field] = partial_data[field]
+            else:
+                cached_data.pop(field, None)
+    
     def _process_single_game_data(self, appid: str, response: Dict[str,Any]) -> Dict[str,Any]:
         """ 
             Want certain data from single game return from steam server.
@@ -1,25 +1,67 @@
 import os
 from tqdm import tqdm
-from typing import List, Dict
+from typing import List, Dict, Iterator
 import time
 import json  
+import queue
+import threading
+from itertools import islice
 
 from src.steam_api import Steam
 from data.steam_database import SteamDatabase
 from src import logger
-from src.tools.local_storage import check_file, load_from_json, save_to_json, remove_items, parse_library_purchase_history
+from src.tools.local_storage import check_file, load_from_json, save_to_json, remove_items, parse_library_purchase_history_incremental, delete_file, \
+    append_to_journal, load_journal, compact_journal, iter_kinguin_orders, iter_steam_pdf_purchases
+from src.tools.rate_limiter import TokenBucket
+from src.tools.response_cache import ResponseCache
+from src.tools.name_matcher import NameMatcher
 
 class StoreToDB:
     TEMP_FILE = 'data/temp_data.json'
+    JOURNAL_FILE = 'data/temp_data.journal' # appids finished since TEMP_FILE was written
     PAYMENT_HISTORY_FILE = 'data/payment_history.html'
     PAYMENT_HISTORY_DIR = 'data/purchase_history'
+    PURCHASE_NAMES_FILE = 'data/purchase_names.json'
+    KINGUIN_ORDER_HISTORY_FILE = 'files/kinguin_game_history.json' # JSON export of Kinguin orders
+    STEAM_ORDER_HISTORY_PDF = 'files/steam_game_history.pdf' # Steam purchase history page saved as a PDF
+    PURCHASE_MANIFEST_FILE = 'data/purchase_manifest.json' # content hash and orders of every parsed purchase file
+    CACHE_DIR = 'data/cache/appdetails'
     BATCH_SIZE = 20 # items, How many resquests to make in one iteration
-    # There is a 200 request limit every 5 mins. (5*60)/200 = 1.5
-    SLEEP_TIME = 1.6 # Seconds, time between calling each game
+    # There is a 200 request limit every 5 mins. (5*60)/200 = 1.5 seconds between each game
+    REQUEST_LIMIT = 200 # requests allowed within REQUEST_PERIOD
+    REQUEST_PERIOD = 5 * 60 # Seconds
+    MAX_WORKERS = 4 # requests that can be in flight at once
+    JOURNAL_COMPACT_BATCHES = 50 # batches between folding JOURNAL_FILE back into TEMP_FILE
+    NAME_MATCH_SCORE = 0.6 # lowest similarity for a purchase name to be matched to a game
+    PARSE_WORKERS = os.cpu_count() or 1 # processes parsing purchase history files
+    IMPORT_BATCH_SIZE = 1000 # purchases written at once while importing an order export
+    PIPELINE_QUEUE_SIZE = 3 # batches that can wait between two pipeline stages
+    PIPELINE_POLL_TIME = 0.5 # Seconds, how often a waiting stage checks if the pipeline was stopped
+    _STAGE_DONE = object() # placed on a queue once a stage has nothing left to pass on
+    # outcomes of _persist_games
+    PERSIST_SAVED = 'saved'
+    PERSIST_EMPTY = 'empty' # steam had nothing to save for the batch
+    PERSIST_FAILED = 'failed' # database write failed, nothing from the batch was saved
     
-    def __init__(self, steam, db):
+    def __init__(self, steam, db, compact_rows: bool = False):
+        """
+            Args:
+                steam: Steam client of the user
+                db: database the user's data is saved to
+                compact_rows: wishlist and library loaded from the database are read only Records
+                              instead of dicts, far less memory for large libraries
+        """
         self.steam = steam
         self.db = db
+        self.compact_rows = compact_rows
+        # every game request draws from the same budget, even when made at the same time
+        if self.steam.rate_limiter is None:
+            self.steam.rate_limiter = TokenBucket(self.REQUEST_LIMIT, self.REQUEST_PERIOD)
+        # games shared between users or ingests are read from disk instead of the server
+        if self.steam.cache is None:
+            self.steam.cache = ResponseCache(self.CACHE_DIR)
+        # appids found by the last wishlist or library sync that aren't in the games table yet
+        self.new_appids = []
         
     def load_user(self)-> bool:
         """
@@ -49,14 +91,14 @@ class StoreToDB:
         
         self.wishlist = []
         if is_wishlist_outdated and check_steam:
-            # TODO: only get new items and delete any removed ones, check db
-            # call server to load and save wishlist
+            # call server to load wishlist, only changes from the stored one are saved
             wishlist = self.steam.get_wishlist()
             if wishlist:
-                self.db.add_to_wishlist(self.user_id, wishlist)
+                changes = self.db.sync_wishlist(self.user_id, wishlist)
+                self._queue_new_games(changes["new_games"])
         else:
             # call database to load wishlist
-            wishlist = self.db.get_wishlist(self.user_id)
+            wishlist = self.db.get_wishlist(self.user_id, self.compact_rows)
         
         self.wishlist = wishlist    
         return self.wishlist
@@ -74,68 +116,370 @@ class StoreToDB:
         
         library = []
         if is_library_outdated and check_steam:
-            # TODO: only load new items to library, get items from db to check
-            # call server to load and save library
+            # call server to load library, only changes from the stored one are saved
             library = self.steam.get_library()
             if library:
-                self.db.add_to_library(self.user_id, library)
+                changes = self.db.sync_library(self.user_id, library)
+                self._queue_new_games(changes["new_games"])
         else:
             # call database to load library
-            library =self.db.get_library(self.user_id)
+            library =self.db.get_library(self.user_id, self.compact_rows)
         
         self.library = library  
         return self.library
     
-    def store_game_data_to_db(self):
-        # only call if a week has passed from last mass update
-        # are_games_updated = self.db.check_update_status(self.user_id, 'games_updated_at')
-        # if not are_games_updated:
-        #     return
+    def _queue_new_games(self, appids: List[int]):
+        """
+            Add appids to the games store_game_data_to_db downloads, each appid is queued once.
+        """
+        queued = set(self.new_appids)
+        for appid in appids:
+            if appid not in queued:
+                queued.add(appid)
+                self.new_appids.append(appid)
     
+    def store_game_data_to_db(self, pipelined: bool = False):
+        """
+            Download game data for every game the wishlist and library syncs found that isn't in the database yet.
+            Appids to download are saved to TEMP_FILE and each finished batch is added to JOURNAL_FILE,
+            so a failed ingest can pick up where it stopped.
+            
+            Args:
+                pipelined: fetch, transform and persist batches at the same time in separate stages,
+                           otherwise each batch is fetched then saved before the next starts.
+        """
+        # games already stored are kept up to date by refresh_stale_games
         appids_to_download = []
         if check_file(self.TEMP_FILE):
-            # load appid still to download
-            appids_to_download = load_from_json(self.TEMP_FILE)["data"]
+            # load appid still to download plus the games this sync found, each appid once,
+            # minus the ones finished since it was saved
+            appids_to_download = list(dict.fromkeys(load_from_json(self.TEMP_FILE)["data"] + list(self.new_appids)))
+            appids_to_download = remove_items(appids_to_download, load_journal(self.JOURNAL_FILE))
+            compact_journal(self.JOURNAL_FILE, self.TEMP_FILE, appids_to_download)
         else:
-            # save all appids that need to be downloaded
-            # appids_to_download = [item['appid'] for item in self.wishlist]
-            appids_to_download = [item['appid'] for item in self.library]
+            # only games new to the database need downloading, games already stored are kept as they are
+            appids_to_download = list(self.new_appids)
             save_to_json(self.TEMP_FILE, appids_to_download)
+            # journal from another work list doesn't apply
+            delete_file(self.JOURNAL_FILE)
         
         logger.info(f"Left to Download: {len(appids_to_download)}")  
-        iterations = len(appids_to_download)
-        ids_left = appids_to_download
-        with tqdm(total=iterations, desc="Retrieving game data from server!", unit='game') as pbar:
-            for i in range(0, iterations, self.BATCH_SIZE):
-                batch_appids = appids_to_download[i:i+self.BATCH_SIZE]
-                
-                
-                games_from_server = self.steam.get_games_data(batch_appids, self.SLEEP_TIME)
-                # save games to DB
-                
-                # keep track of what appids still need to be downloaded
-                # important incase there's an error while downloading
-                ids_left = remove_items(ids_left, batch_appids)
-                save_to_json(self.TEMP_FILE, ids_left)
+        self.db.create_game_features_table()
+        self.db.create_refresh_status_table()
+        self._ids_left = appids_to_download
+        self._ids_done = []
+        self._ids_failed = []
+        if pipelined:
+            self._store_game_data_pipelined(appids_to_download)
+        else:
+            iterations = len(appids_to_download)
+            with tqdm(total=iterations, desc="Retrieving game data from server!", unit='game') as pbar:
+                for i in range(0, iterations, self.BATCH_SIZE):
+                    batch_appids = appids_to_download[i:i+self.BATCH_SIZE]
+                    
+                    games_from_server = self.steam.get_games_data(batch_appids, max_workers=self.MAX_WORKERS)
+                    persisted = self._persist_games(self._transform_games(games_from_server))
+                    
+                    # keep track of what appids still need to be downloaded
+                    # important incase there's an error while downloading
+                    self._finish_batch(batch_appids, persisted)
+                    pbar.update(len(batch_appids))
+        
+        if self._ids_failed:
+            # failed batches stay in the work list, the next ingest downloads them again
+            logger.error(f"{len(self._ids_failed)} games failed to save, kept in {self.TEMP_FILE} for the next ingest")
+            compact_journal(self.JOURNAL_FILE, self.TEMP_FILE, remove_items(self._ids_left, self._ids_done))
+            self.new_appids = list(self._ids_failed)
+            return
+        
+        # everything is downloaded, next ingest starts from a new work list
+        delete_file(self.TEMP_FILE)
+        delete_file(self.JOURNAL_FILE)
+        self.new_appids = []
+        logger.info(f"Steam connections: {self.steam.connection_stats()}")
+        self.db.set_games_update_status(self.user_id)
+    
+    def _finish_batch(self, batch_appids: List[int], persisted: str):
+        """
+            Checkpoint a batch once its games are safely in the database or steam had nothing for it.
+            A batch whose write failed isn't checkpointed so it stays in the work list.
+        """
+        if persisted == self.PERSIST_FAILED:
+            self._ids_failed += batch_appids
+            return
+        self._checkpoint(batch_appids)
+    
+    def _checkpoint(self, batch_appids: List[int]):
+        """
+            Record a finished batch in the journal, costs the size of the batch instead of the work left.
+            Every JOURNAL_COMPACT_BATCHES batches the journal is folded back into TEMP_FILE so it doesn't keep growing.
+        """
+        append_to_journal(self.JOURNAL_FILE, batch_appids)
+        self._ids_done += batch_appids
+        
+        if len(self._ids_done) >= self.JOURNAL_COMPACT_BATCHES * self.BATCH_SIZE:
+            self._ids_left = remove_items(self._ids_left, self._ids_done)
+            self._ids_done = []
+            compact_journal(self.JOURNAL_FILE, self.TEMP_FILE, self._ids_left)
+    
+    def _transform_games(self, games: List[Dict]) -> List[Dict]:
+        """
+            Prepare games from server to be saved.
+            Games steam has no information on come back empty and can't be saved.
+        """
+        return [game for game in games if game]
+    
+    def _persist_games(self, games: List[Dict], field_classes: List[str] = None) -> str:
+        """
+            Save all game data to DB, every table is written in one transaction
+            
+            Args:
+                games: processed games to save
+                field_classes: classes of data that were downloaded, every class when not given
+            Return: PERSIST_SAVED if the games were saved, PERSIST_EMPTY if there were none to save,
+                    PERSIST_FAILED if the database write failed
+        """
+        if not games:
+            return self.PERSIST_EMPTY
+        if not self.db.add_games_batch(self.user_id, games):
+            return self.PERSIST_FAILED
+        
+        appids = [game['appid'] for game in games]
+        # only rebuild the features of games this batch touched
+        self.db.refresh_game_features(appids)
+        self.db.mark_games_refreshed(appids, field_classes or list(self._field_ttls()))
+        return self.PERSIST_SAVED
+    
+    def _field_ttls(self) -> Dict[str, float]:
+        """
+            Return: seconds each class of game data stays fresh, the same ones the response cache uses
+        """
+        return self.steam.cache.ttls if self.steam.cache else ResponseCache.TTLS
+    
+    def refresh_stale_games(self, budget: int = None) -> int:
+        """
+            Download again the stored games whose data is most out of date, spending at most budget requests.
+            The database picks games by how overdue each class of data is and how many users have the game,
+            so prices, which go stale within a day, are refreshed far more often than descriptions.
+            When only prices are stale the response cache downloads just the price fields.
+            
+            Args:
+                budget: most games to refresh, one rate limit window (REQUEST_LIMIT) by default
+            Return: number of games refreshed
+        """
+        self.db.create_refresh_status_table()
+        stale_games = self.db.get_stale_games(self._field_ttls(), budget or self.REQUEST_LIMIT)
+        
+        refreshed = 0
+        with tqdm(total=len(stale_games), desc="Refreshing stale game data!", unit='game') as pbar:
+            for i in range(0, len(stale_games), self.BATCH_SIZE):
+                batch = stale_games[i:i+self.BATCH_SIZE]
+                stale_classes = {str(game['appid']): tuple(game['stale_classes']) for game in batch}
+                games = self._transform_games(self.steam.get_games_data(list(map(int, stale_classes)), max_workers=self.MAX_WORKERS))
                 
-                # save all game data to DB
-                self.db.add_to_games(self.user_id, games_from_server)
-                self.db.add_to_developers(self.user_id, games_from_server)
-                self.db.add_to_publishers(self.user_id, games_from_server)
-                self.db.add_to_categories(self.user_id, games_from_server)
-                self.db.add_to_genres(self.user_id, games_from_server)
-                self.db.add_to_prices(self.user_id, games_from_server)
-                self.db.add_to_metacritic(self.user_id, games_from_server)
-                # only sleep if there is still iterations to go
-                pbar.update(iterations/self.BATCH_SIZE)
+                # games are saved with the classes that were stale for them
+                by_classes = {}
+                for game in games:
+                    by_classes.setdefault(stale_classes.get(str(game['appid']), ()), []).append(game)
+                for field_classes, class_games in by_classes.items():
+                    if self._persist_games(class_games, list(field_classes)) == self.PERSIST_SAVED:
+                        refreshed += len(class_games)
                 
-        self.db.set_games_update_status(self.user_id)
+                # steam had nothing for these, marking them makes them wait a full ttl before being tried again
+                returned = {str(game['appid']) for game in games}
+                empty = {}
+                for appid, field_classes in stale_classes.items():
+                    if appid not in returned:
+                        empty.setdefault(field_classes, []).append(int(appid))
+                for field_classes, appids in empty.items():
+                    self.db.mark_games_refreshed(appids, list(field_classes))
+                pbar.update(len(batch))
+        
+        logger.info(f"Refreshed {refreshed}/{len(stale_games)} stale games")
+        return refreshed
+    
+    def _store_game_data_pipelined(self, appids: List[int]):
+        """
+            Runs the ingest as three stages joined by bounded queues:
+            fetch (steam server) -> transform -> persist (database and checkpoint).
+            
+            While the database saves one batch the next batches are already being fetched,
+            so throughput is set by the slowest stage instead of the sum of all of them.
+            A stage blocks when the queue after it is full, which keeps memory bounded when the database is slow.
+        """
+        batches = [appids[i:i+self.BATCH_SIZE] for i in range(0, len(appids), self.BATCH_SIZE)]
+        fetched = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        transformed = queue.Queue(maxsize=self.PIPELINE_QUEUE_SIZE)
+        stop = threading.Event()
+        errors = []
+        
+        stages = ['fetch', 'transform', 'persist']
+        bars = {
+            stage: tqdm(total=len(appids), desc=f"Games {stage}", unit='game', position=position)
+            for position, stage in enumerate(stages)
+        }
+        
+        def fetch_stage():
+            for batch_appids in batches:
+                if stop.is_set():
+                    return
+                games_from_server = self.steam.get_games_data(batch_appids, max_workers=self.MAX_WORKERS)
+                if not self._put_stage_item(fetched, (batch_appids, games_from_server), stop):
+                    return
+                bars['fetch'].update(len(batch_appids))
+        
+        def transform_stage():
+            for batch_appids, games in self._stage_items(fetched, stop):
+                if not self._put_stage_item(transformed, (batch_appids, self._transform_games(games)), stop):
+                    return
+                bars['transform'].update(len(batch_appids))
+        
+        def persist_stage():
+            for batch_appids, games in self._stage_items(transformed, stop):
+                # only checkpoint once the games are safely in the database
+                self._finish_batch(batch_appids, self._persist_games(games))
+                bars['persist'].update(len(batch_appids))
+        
+        workers = [
+            threading.Thread(target=self._run_stage, args=(fetch_stage, fetched, stop, errors), name='ingest-fetch'),
+            threading.Thread(target=self._run_stage, args=(transform_stage, transformed, stop, errors), name='ingest-transform')
+        ]
+        for worker in workers:
+            worker.start()
+        # database connection is only used from this thread
+        self._run_stage(persist_stage, None, stop, errors)
+        
+        for worker in workers:
+            worker.join()
+        for bar in bars.values():
+            bar.close()
+            
+        if errors:
+            logger.error(f"Ingest pipeline stopped: {errors[0]}")
+            raise errors[0]
+    
+    def _run_stage(self, stage, output: queue.Queue, stop: threading.Event, errors: List[Exception]):
+        """
+            Run a pipeline stage, any error stops every other stage.
+            When the stage is done the next stage is told nothing else is coming.
+        """
+        try:
+            stage()
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            if output is not None:
+                self._put_stage_item(output, self._STAGE_DONE, stop)
+    
+    def _put_stage_item(self, stage_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        """
+            Place item on the queue, waiting while it's full unless the pipeline was stopped.
+            
+            Return: False if the pipeline was stopped before the item was placed
+        """
+        while not stop.is_set():
+            try:
+                stage_queue.put(item, timeout=self.PIPELINE_POLL_TIME)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def _stage_items(self, stage_queue: queue.Queue, stop: threading.Event):
+        """
+            Yield items from the queue until the stage before is done or the pipeline is stopped.
+        """
+        while not stop.is_set():
+            try:
+                item = stage_queue.get(timeout=self.PIPELINE_POLL_TIME)
+            except queue.Empty:
+                continue
+            if item is self._STAGE_DONE:
+                return
+            yield item
      
     def parse_payment_history(self, parse_data: bool = False):
         if parse_data:
-            steam_purchase_history = parse_library_purchase_history(self.PAYMENT_HISTORY_DIR+"/steam")
-            kinguin_purchase_history = parse_library_purchase_history(self.PAYMENT_HISTORY_DIR+"/kinguin")
-            total_purchase_history = steam_purchase_history + kinguin_purchase_history
-            save_to_json('data/purchase_names.json', total_purchase_history)
-        orders = load_from_json('data/purchase_names.json')['data']
-        self.db.add_paid_price(self.user_id, orders)
\ No newline at end of file
+            # only order pages added or changed since the last run are parsed
+            manifest = load_from_json(self.PURCHASE_MANIFEST_FILE)['data'] if check_file(self.PURCHASE_MANIFEST_FILE) else {}
+            steam_purchase_history = parse_library_purchase_history_incremental(self.PAYMENT_HISTORY_DIR+"/steam", manifest, self.PARSE_WORKERS)
+            kinguin_purchase_history = parse_library_purchase_history_incremental(self.PAYMENT_HISTORY_DIR+"/kinguin", manifest, self.PARSE_WORKERS)
+            total_purchase_history = (steam_purchase_history or []) + (kinguin_purchase_history or [])
+            save_to_json(self.PURCHASE_MANIFEST_FILE, manifest)
+            save_to_json(self.PURCHASE_NAMES_FILE, total_purchase_history)
+        orders = load_from_json(self.PURCHASE_NAMES_FILE)['data']
+        orders = self.resolve_purchase_names(orders)
+        self.db.create_game_name_index()
+        self.db.add_paid_price_bulk(self.user_id, orders)
+    
+    def import_kinguin_orders(self, file_path: str = None) -> Dict[str, int]:
+        """
+            Adds prices paid from a Kinguin order history JSON export to the user's library.
+            
+            Args:
+                file_path: Kinguin JSON export, KINGUIN_ORDER_HISTORY_FILE by default
+            Return: totals of add_paid_price_bulk counts over every batch
+        """
+        file_path = file_path or self.KINGUIN_ORDER_HISTORY_FILE
+        if not check_file(file_path):
+            logger.warning(f"Kinguin order history {file_path} not found")
+            return {"matched": 0, "unmatched": 0, "updated": 0}
+        return self._import_purchases(iter_kinguin_orders(file_path), "Kinguin orders")
+    
+    def import_steam_pdf_orders(self, file_path: str = None) -> Dict[str, int]:
+        """
+            Adds prices paid from the Steam purchase history saved as a PDF to the user's library.
+            
+            Args:
+                file_path: Steam purchase history PDF, STEAM_ORDER_HISTORY_PDF by default
+            Return: totals of add_paid_price_bulk counts over every batch
+        """
+        file_path = file_path or self.STEAM_ORDER_HISTORY_PDF
+        if not check_file(file_path):
+            logger.warning(f"Steam purchase history {file_path} not found")
+            return {"matched": 0, "unmatched": 0, "updated": 0}
+        try:
+            return self._import_purchases(iter_steam_pdf_purchases(file_path, self.PARSE_WORKERS), "Steam PDF orders")
+        except ImportError as e:
+            logger.error(f"Can't import {file_path}: {e}")
+            return {"matched": 0, "unmatched": 0, "updated": 0}
+    
+    def _import_purchases(self, purchases: Iterator[Dict], source: str) -> Dict[str, int]:
+        """
+            Streams purchases into add_paid_price_bulk, IMPORT_BATCH_SIZE at a time,
+            so the size of an order export doesn't change memory use.
+        """
+        totals = {"matched": 0, "unmatched": 0, "updated": 0}
+        matcher = NameMatcher(self.db.get_game_names())
+        self.db.create_game_name_index()
+        while batch := list(islice(purchases, self.IMPORT_BATCH_SIZE)):
+            counts = self.db.add_paid_price_bulk(self.user_id, self.resolve_purchase_names(batch, matcher))
+            for key in totals:
+                totals[key] += counts.get(key, 0)
+        
+        logger.info(f"{source}: {totals['matched']} purchases matched, {totals['updated']} library games updated")
+        return totals
+    
+    def resolve_purchase_names(self, orders: List[Dict], matcher: NameMatcher = None) -> List[Dict]:
+        """
+            Receipt names rarely match steam names exactly ("Fort Solis PC Steam" vs "Fort Solis").
+            Each purchase name is replaced with the closest game name in the database,
+            names with no close match are left as they are.
+            
+            Args:
+                orders: purchases with game_name
+                matcher: matcher to reuse across calls, built from the games table if not given
+            Return: orders with game_name set to the matched game and appid added when matched
+        """
+        matcher = matcher or NameMatcher(self.db.get_game_names())
+        resolved = []
+        for order in orders:
+            match = matcher.best_match(order["game_name"], self.NAME_MATCH_SCORE)
+            if match:
+                appid, game_name, score = match
+                order = order | {"appid": appid, "game_name": game_name}
+            resolved.append(order)
+        
+        logger.info(f"Purchases: {sum('appid' in order for order in resolved)}/{len(orders)} names matched to games")
+        return resolved
@@ -1,8 +1,42 @@
 import json
+import html
 from src import logger
 import os
+import time
+import hashlib
+import re
+from datetime import datetime
+from itertools import chain
+from statistics import median
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from concurrent.futures import ProcessPoolExecutor
 from bs4 import BeautifulSoup
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Iterator
+
+try:
+    import lxml
+    HTML_PARSER = 'lxml' # C parser, much faster on large order pages
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+# Kinguin exports mix day first formats
+ORDER_DATE_FORMATS = ("%d/%m/%Y", "%d-%m-%Y", "%Y-%m-%d")
+
+# Steam purchase history table, the last two are the wallet columns
+STEAM_HISTORY_COLUMNS = ("Date", "Items", "Type", "Total", "Wallet", "Change", "Balance")
+STEAM_DATE_FORMAT = "%b %d, %Y"
+STEAM_HISTORY_ROW_GAP = 1.6 # text heights between lines that start a new table row
+PRICE_PATTERN = re.compile(r"[+-]?\$[\d,]+\.\d{2}")
+WALLET_CREDIT_PATTERN = re.compile(r"Purchased .*Wallet Credit")
+# store and platform words after a purchase's game name, only matched as whole words following the name
+PLATFORM_NAME_PATTERN = re.compile(r"(?<=\s)(?:PC|Steam|EA|Origin)\b")
+SPACE_PATTERN = re.compile(r"\s+")
         
 def save_to_json(file_path: str, variable_data: List):
     """
@@ -70,37 +104,229 @@ def remove_items(all_items: List[Any], items_to_remove: List[Any])-> List[Any]:
     items_set = set(items_to_remove)
     return [item for item in all_items if item not in items_set]
 
-def parse_library_purchase_history(dir_path: str)-> list[Dict]:
+def append_to_journal(file_path: str, items: List[Any]):
+    """
+        Appends items to an append only journal, one JSON value per line.
+        File is flushed and fsynced so the items survive a crash once this returns.
+        
+        file_path: Path to the journal file
+        items: JSON-serializable items to add
+    """
+    lines = ''.join(f"{json.dumps(item)}\n" for item in items)
+    with open(file_path, 'a') as journal_file:
+        journal_file.write(lines)
+        journal_file.flush()
+        os.fsync(journal_file.fileno())
+
+def load_journal(file_path: str)-> List[Any]:
+    """
+        Loads every item within a journal.
+        A line cut short by a crash while writing is skipped.
+        
+        file_path: Path to the journal file
+        return: items in the order they were added, empty if journal doesn't exist
+    """
+    items = []
+    if not os.path.exists(file_path):
+        return items
+    
+    with open(file_path, 'r') as journal_file:
+        for line in journal_file:
+            try:
+                items.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"Skipping unreadable line in journal {file_path}")
+    return items
+
+def compact_journal(journal_path: str, file_path: str, variable_data: List):
+    """
+        Folds a journal back into its JSON file.
+        The new data is written to a temp file and moved into place before the journal is emptied,
+        so a crash at any point leaves a file and journal that replay to the same result.
+        
+        journal_path: Path to the journal file
+        file_path: Path to the JSON file the journal is replayed against
+        variable_data: data left once the journal has been replayed
+    """
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w') as json_file:
+        json.dump({"data": variable_data}, json_file)
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(temp_path, file_path)
+    
+    # journal is now part of file_path
+    open(journal_path, 'w').close()
+    logger.info(f"Journal {journal_path} compacted into {file_path}")
+
+def parse_library_purchase_history(dir_path: str, workers: int = 1, report: Dict = None)-> list[Dict]:
     """ 
         Parses html files found in directory that was passed. Then returns all orders that are found with game names and prices paid.
+        Files are parsed in name order and their orders are merged in that order, with or without workers.
+        
+        Args:
+            dir_path: directory holding the html files
+            workers: processes parsing files at the same time, 1 parses them one after another
+            report: filled with files parsed, failed files and their errors, seconds taken and files per second
         
         Note:
             The html pages must be stored within a steam of kinguin folder depending on where the orders are from.
     """
+    listing = _list_purchase_files(dir_path)
+    if not listing:
+        return
+    source, file_paths = listing
+    
+    results, parse_report = _parse_purchase_files(file_paths, source, workers)
+    if report is not None:
+        report.update(parse_report)
+    
+    all_transactions = []
+    for transaction_data, error in results:
+        if not error:
+            all_transactions += transaction_data
+    return all_transactions
+
+def parse_library_purchase_history_incremental(dir_path: str, manifest: Dict, workers: int = 1, report: Dict = None)-> list[Dict]:
+    """ 
+        Same as parse_library_purchase_history but only parses files that are new or changed since the last run.
+        
+        The manifest keeps the content hash of every file and the orders parsed from each hash.
+        A file whose size and modified time haven't changed isn't read again, a file that was touched is hashed
+        and only parsed when its content is new. Files with the same content count once, so copies of an
+        order page don't duplicate its orders. Files that failed to parse are left out of the manifest and retried next run.
+        
+        Args:
+            dir_path: directory holding the html files
+            manifest: state from the previous run, updated in place, starts as {}
+            workers: processes parsing files at the same time
+            report: filled like parse_library_purchase_history plus how many files didn't need parsing
+        Return: every order found within dir_path, None like parse_library_purchase_history
+    """
+    listing = _list_purchase_files(dir_path)
+    if not listing:
+        return
+    source, file_paths = listing
+    files = manifest.setdefault("files", {})
+    orders = manifest.setdefault("orders", {})
+    
+    to_parse = {}
+    for file_path in file_paths:
+        stat = os.stat(file_path)
+        entry = files.get(file_path)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns and entry["hash"] in orders:
+            continue
+        entry = {"hash": hash_file(file_path), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+        if entry["hash"] in orders:
+            files[file_path] = entry
+        else:
+            to_parse[file_path] = entry
+    
+    results, parse_report = _parse_purchase_files(list(to_parse), source, workers)
+    for (file_path, entry), (transaction_data, error) in zip(to_parse.items(), results):
+        if error:
+            files.pop(file_path, None)
+            continue
+        orders[entry["hash"]] = transaction_data
+        files[file_path] = entry
+    
+    # forget files that were removed from dir_path and orders no file points to anymore
+    prefix = os.path.join(dir_path, '')
+    current_files = set(file_paths)
+    for file_path in [path for path in files if path.startswith(prefix) and path not in current_files]:
+        del files[file_path]
+    used_hashes = {entry["hash"] for entry in files.values()}
+    for file_hash in [file_hash for file_hash in orders if file_hash not in used_hashes]:
+        del orders[file_hash]
+    
+    if report is not None:
+        report.update(parse_report | {"unchanged": len(file_paths) - len(to_parse)})
+    
+    all_transactions = []
+    seen_hashes = set()
+    for file_path in file_paths:
+        entry = files.get(file_path)
+        if entry and entry["hash"] not in seen_hashes:
+            seen_hashes.add(entry["hash"])
+            all_transactions += orders[entry["hash"]]
+    return all_transactions
+
+def hash_file(file_path: str)-> str:
+    """ 
+        Return: sha256 hex digest of a files content
+    """
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _list_purchase_files(dir_path: str)-> tuple:
+    """
+        Return: ('steam' or 'kinguin', html file paths in name order), None if there is nothing to parse
+    """
     if not os.path.isdir(dir_path):
         return
     
-    html_files = [file for file in os.listdir(dir_path) if file.lower().endswith('.html')]
+    html_files = sorted(file for file in os.listdir(dir_path) if file.lower().endswith('.html'))
     if not html_files:
         return
     
-    all_transactions = []
-    for file in html_files:
-        file_path = os.path.join(dir_path, file)
+    if 'steam' in dir_path:
+        source = 'steam'
+    elif 'kinguin' in dir_path:
+        source = 'kinguin'
+    else:
+        return
+    return source, [os.path.join(dir_path, file) for file in html_files]
+
+def _parse_purchase_files(file_paths: List[str], source: str, workers: int)-> tuple:
+    """
+        Parses purchase html files, spread over a process pool when workers is more than 1.
+        Failures are logged per file rather than stopping the other files.
         
-        if 'steam' in dir_path:
-            transaction_data = parse_payment_history_steam(file_path)
-        elif 'kinguin' in dir_path:
-            transaction_data = parse_payment_history_kinguin(file_path)
-        else:
-            return
-        all_transactions += transaction_data
+        Return: ((orders, error) per file in the order given, report)
+    """
+    tasks = [(file_path, source) for file_path in file_paths]
+    start_time = time.perf_counter()
+    if workers > 1 and len(tasks) > 1:
+        workers = min(workers, len(tasks))
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_parse_purchase_file, tasks, chunksize=chunksize))
+    else:
+        results = [_parse_purchase_file(task) for task in tasks]
+    seconds = time.perf_counter() - start_time
+    
+    failed = {}
+    for file_path, (_, error) in zip(file_paths, results):
+        if error:
+            failed[file_path] = error
+            logger.error(f"Error processing '{file_path}': {error}")
+    
+    files_per_sec = len(tasks) / seconds if seconds else float(len(tasks))
+    logger.info(f"Parsed {len(tasks)} {source} purchase files in {seconds:.2f}s ({files_per_sec:.1f} files/sec), {len(failed)} failed")
+    return results, {"files": len(tasks), "failed": failed, "seconds": seconds, "files_per_sec": files_per_sec}
+
+def _parse_purchase_file(task: tuple)-> tuple:
+    """
+        Parses one purchase html file, runs inside a worker process when parsing in parallel.
         
-    return all_transactions
+        Args:
+            task: (file path, 'steam' or 'kinguin')
+        Return: (orders, None) or ([], error message) when the file couldn't be parsed
+    """
+    file_path, source = task
+    parser = parse_payment_history_steam if source == 'steam' else parse_payment_history_kinguin
+    try:
+        return parser(file_path), None
+    except Exception as e:
+        return [], f"{type(e).__name__}: {e}"
             
 def parse_payment_history_steam(filepath: str)-> List[Dict]:
     """ 
         Takes a steam order html file and parses it for game_names and price user paid.
+        Raises when the file can't be read or an order can't be parsed.
         
         Note: 
         Order History Page: https://store.steampowered.com/account/history/
@@ -110,32 +336,30 @@ def parse_payment_history_steam(filepath: str)-> List[Dict]:
     if not filepath.endswith('.html'):
         return {}
     
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            html_content = file.read()
-            
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # Get individual items
-        item = soup.find(class_='purchase_line_items')
-        if not item:
-            return []
-        names = item.find_all(class_='purchase_detail_field')
-        prices = item.find_all(class_='refund_value')
-        
-        for i in range(len(names)):
-            price_text = prices[i].get_text()
-            price = float(price_text.replace("$",''))
-            price_cents = int(price * 100)
-            items.append({"game_name": names[i].get_text(), "price":price_cents})
-    except Exception as e:
-            print(f"Error processing '{filepath}': {str(e)}")
+    with open(filepath, 'r', encoding='utf-8') as file:
+        html_content = file.read()
+        
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    
+    # Get individual items
+    item = soup.find(class_='purchase_line_items')
+    if not item:
+        return []
+    names = item.find_all(class_='purchase_detail_field')
+    prices = item.find_all(class_='refund_value')
+    
+    for i in range(len(names)):
+        price_text = prices[i].get_text()
+        price = float(price_text.replace("$",''))
+        price_cents = int(price * 100)
+        items.append({"game_name": names[i].get_text(), "price":price_cents})
     
     return items
 
 def parse_payment_history_kinguin(filepath: str)-> List[Dict]:
     """ 
         Takes a Kinguin order html file and gets all game orders returning game names and price user paid.
+        Raises when the file can't be read or an order can't be parsed.
         
         Note: 
         Order Page: https://www.kinguin.net/app/dashboard/orders
@@ -145,43 +369,288 @@ def parse_payment_history_kinguin(filepath: str)-> List[Dict]:
     if not filepath.endswith('.html'):
         return {}
     
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            html_content = file.read() 
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        items = []
-        # find all orders
-        rows = soup.find_all(class_='sc-jwQYvw hlGyez')
-        for row in rows:
-            # don't process headers
-            if row.find('th'):
+    with open(filepath, 'r', encoding='utf-8') as file:
+        html_content = file.read() 
+    soup = BeautifulSoup(html_content, HTML_PARSER)
+    
+    # find all orders
+    rows = soup.find_all(class_='sc-jwQYvw hlGyez')
+    for row in rows:
+        # don't process headers
+        if row.find('th'):
+            continue
+        
+        # each item bought
+        cells = row.find_all('td', class_='sc-gFSQbh')
+        name = cells[2].get_text()
+        # extract game name only
+        game_name = parse_game_name(name)
+        
+        # amount game was paid for in cents
+        price = cells[5].get_text()
+        price_in_cents = int(float(price.replace("$",'')) * 100)
+        items.append({"game_name": game_name.strip(), "price":price_in_cents})
+    
+    return items
+
+def iter_kinguin_orders(file_path: str, payment_statuses: tuple = ("COMPLETED",), chunk_size: int = 64 * 1024)-> Iterator[Dict]:
+    """ 
+        Streams purchases out of a Kinguin order history JSON export, one order is held in memory at a time.
+        Orders whose payment_status isn't in payment_statuses are skipped.
+        
+        Export: {"orders": [{"order_id", "date", "payment_status", "products": [{"product_name", "value"}, ...]}, ...]}
+        
+        Args:
+            file_path: path to the JSON export
+            payment_statuses: statuses of orders that were paid for
+            chunk_size: characters read from the file at once
+        Yield: purchases with game_name, price in cents, date (YYYY-MM-DD or None) and order_id
+    """
+    with open(file_path, 'r', encoding='utf-8') as file:
+        for order in iter_json_array(file, "orders", chunk_size):
+            if order.get("payment_status") not in payment_statuses:
                 continue
             
-            # each item bought
-            cells = row.find_all('td', class_='sc-gFSQbh')
-            name = cells[2].get_text()
-            # extract game name only
-            game_name = parse_game_name(name)
-            
-            # amount game was paid for in cents
-            price = cells[5].get_text()
-            price_in_cents = int(float(price.replace("$",'')) * 100)
-            items.append({"game_name": game_name.strip(), "price":price_in_cents})
-    except Exception as e:
-            print(f"Error processing '{filepath}': {str(e)}")
+            date = parse_order_date(order.get("date"))
+            for product in order.get("products", []):
+                try:
+                    price_in_cents = price_to_cents(product["value"])
+                    # store words are removed on word boundaries by normalize_name when the name is matched
+                    game_name = str(product["product_name"])
+                except (KeyError, TypeError, InvalidOperation) as e:
+                    logger.warning(f"Skipping product in Kinguin order {order.get('order_id')}: {type(e).__name__}: {e}")
+                    continue
+                yield {"game_name": game_name.strip(), "price": price_in_cents, "date": date, "order_id": order.get("order_id")}
+
+def iter_json_array(file, key: str, chunk_size: int = 64 * 1024)-> Iterator[Any]:
+    """ 
+        Lazily decodes the items of the array stored under key, without loading the whole file.
+        The file is read in chunks and each item is decoded as soon as it is complete,
+        so memory is bounded by one chunk plus the largest item.
+        
+        Note:
+            Meant for arrays of objects under a key that appears once, like an export's top level list.
+        
+        file: text file object
+        key: name of the key holding the array
+        return: each item of the array, nothing if the key isn't found
+    """
+    decoder = json.JSONDecoder()
+    marker = re.compile(rf'"{re.escape(key)}"\s*:\s*\[')
+    buffer = ''
+    while True:
+        match = marker.search(buffer)
+        if match:
+            buffer = buffer[match.end():]
+            break
+        chunk = file.read(chunk_size)
+        if not chunk:
+            return
+        # keep the end in case the key is split between chunks
+        buffer = buffer[-(len(key) + 64):] + chunk
     
-    return items
+    position = 0
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        
+        if position < len(buffer) and buffer[position] == ']':
+            return
+        
+        end = None
+        if position < len(buffer):
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                end = None
+        if end is not None:
+            position = end
+            yield item
+            continue
+        
+        # item is cut off by the end of the chunk
+        chunk = file.read(chunk_size)
+        if not chunk:
+            raise ValueError(f"JSON array '{key}' ends before it is closed")
+        buffer = buffer[position:] + chunk
+        position = 0
+
+def price_to_cents(value: Any)-> int:
+    """ 
+        Converts a price such as "5.35", "$0.80" or 14.97 into cents without float rounding errors.
+    """
+    price = Decimal(str(value).replace("$", '').replace(",", '').strip())
+    return int((price * 100).to_integral_value(rounding=ROUND_HALF_UP))
+
+def parse_order_date(date: str, date_formats: tuple = ORDER_DATE_FORMATS)-> str:
+    """ 
+        Return: order date as YYYY-MM-DD, None if it isn't in one of date_formats
+    """
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(date, date_format).date().isoformat()
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def iter_steam_pdf_purchases(file_path: str, workers: int = 1, pages_per_task: int = 4)-> Iterator[Dict]:
+    """ 
+        Streams purchases out of the Steam purchase history page saved as a PDF.
+        Pages are read a few at a time, each by a fresh reader, so memory is bounded by the pages being parsed
+        and not by the size of the document. Workers parse page ranges at the same time while purchases
+        are still yielded in page order.
+        
+        Note: 
+        Purchase History Page: https://store.steampowered.com/account/history/
+        Only "Purchase" rows are returned, gifts, refunds, in-game purchases and wallet credit are skipped.
+        The page only shows a total per purchase, when several games were bought together
+        the total is split evenly between them.
+        
+        Args:
+            file_path: path to the PDF
+            workers: processes parsing pages at the same time, 1 parses them one after another
+            pages_per_task: pages a worker parses with one reader
+        Yield: purchases with game_name, price in cents and date (YYYY-MM-DD)
+    """
+    if PdfReader is None:
+        raise ImportError("pypdf is needed to read PDF purchase history, install it with 'pip install pypdf'")
+    
+    page_count = len(PdfReader(file_path).pages)
+    tasks = [(file_path, range(start, min(start + pages_per_task, page_count))) for start in range(0, page_count, pages_per_task)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            yield from _merge_steam_history_pages(chain.from_iterable(executor.map(_parse_steam_pdf_pages, tasks)))
+    else:
+        yield from _merge_steam_history_pages(chain.from_iterable(map(_parse_steam_pdf_pages, tasks)))
+
+def _parse_steam_pdf_pages(task: tuple)-> List[tuple]:
+    """
+        Parses a range of PDF pages, runs inside a worker process when parsing in parallel.
+        
+        Args:
+            task: (file path, page numbers)
+        Return: parse_steam_history_page result for each page
+    """
+    file_path, page_numbers = task
+    reader = PdfReader(file_path)
+    results = []
+    for page_number in page_numbers:
+        fragments = []
+        def visitor(text, cm, tm, font_dict, font_size):
+            if not text.strip():
+                return
+            # text position on the page, the text matrix moved by the current transformation matrix
+            x = tm[4] * cm[0] + tm[5] * cm[2] + cm[4]
+            y = tm[4] * cm[1] + tm[5] * cm[3] + cm[5]
+            height = font_size * abs(tm[3]) * abs(cm[3]) or font_size
+            fragments.append((x, y, height, text))
+        
+        reader.pages[page_number].extract_text(visitor_text=visitor)
+        results.append(parse_steam_history_page(fragments))
+    return results
+
+def parse_steam_history_page(fragments: List[tuple])-> tuple:
+    """ 
+        Rebuilds the purchase table of one Steam purchase history page from positioned text.
+        
+        Columns are found from the table header that is printed on every page. Lines are split into rows
+        where the gap between them is larger than the padding between two lines of the same row.
+        A row without a date at the top of the page is the end of the last row on the page before.
+        
+        fragments: (x, y, text height, text) with y going up the page like PDF coordinates
+        return: (items continuing the previous page's last row, rows with date, type, total in cents and items)
+    """
+    header_y = next((y for x, y, _, text in fragments if text.strip() == "Date"), None)
+    if header_y is None:
+        return [], []
+    height = median(fragment[2] for fragment in fragments)
+    edge = height * 0.25
+    
+    # header cells can be two lines high ("Wallet Change")
+    header = {
+        text.strip(): (x, y) for x, y, _, text in fragments
+        if text.strip() in STEAM_HISTORY_COLUMNS and abs(y - header_y) <= height * 1.5
+    }
+    if not all(column in header for column in STEAM_HISTORY_COLUMNS[:4]):
+        return [], []
+    items_x, type_x, total_x = header["Items"][0], header["Type"][0], header["Total"][0]
+    wallet_x = min((header[column][0] for column in STEAM_HISTORY_COLUMNS[4:] if column in header), default=float('inf'))
+    
+    def column(x):
+        if x < items_x - edge:
+            return "date"
+        if x < type_x - edge:
+            return "items" if x <= items_x + edge else "details"
+        if x < (type_x + total_x) / 2:
+            return "type"
+        if x < (total_x + wallet_x) / 2:
+            return "total"
+        return "wallet"
+    
+    # lines of text below the header, top of the page first
+    lines = defaultdict(list)
+    for x, y, _, text in sorted(fragments, key=lambda fragment: (-fragment[1], fragment[0])):
+        if y >= header_y - height * 1.5:
+            continue
+        line_y = next((line_y for line_y, line_column in lines if line_column == column(x) and abs(line_y - y) <= edge), y)
+        lines[(line_y, column(x))].append(text)
+    
+    rows = []
+    last_y = None
+    for (y, line_column), texts in sorted(lines.items(), key=lambda line: -line[0][0]):
+        if last_y is None or last_y - y > height * STEAM_HISTORY_ROW_GAP:
+            rows.append(defaultdict(list))
+        rows[-1][line_column].append(SPACE_PATTERN.sub(' ', html.unescape(''.join(texts))).strip())
+        last_y = y
+    
+    continued = []
+    transactions = []
+    for row in rows:
+        date = next(filter(None, (parse_order_date(text, (STEAM_DATE_FORMAT,)) for text in row["date"])), None)
+        if not date:
+            if not transactions:
+                continued += row["items"]
+            continue
+        total = next((text for text in row["total"] if PRICE_PATTERN.fullmatch(text)), None)
+        transactions.append({
+            "date": date,
+            "type": row["type"][0] if row["type"] else None,
+            "total": price_to_cents(total) if total else None,
+            "items": row["items"]
+        })
+    return continued, transactions
+
+def _merge_steam_history_pages(pages: Iterator[tuple])-> Iterator[Dict]:
+    """
+        Joins rows split over two pages and turns purchase rows into purchases,
+        a row is only held until the next page shows whether it continues.
+    """
+    pending = None
+    for continued, transactions in pages:
+        if pending and continued:
+            pending["items"] += continued
+        for transaction in transactions:
+            if pending:
+                yield from _steam_row_purchases(pending)
+            pending = transaction
+    if pending:
+        yield from _steam_row_purchases(pending)
+
+def _steam_row_purchases(transaction: Dict)-> List[Dict]:
+    """
+        Return: a purchase for each game in a "Purchase" row, sharing the rows total in cents
+    """
+    games = [item for item in transaction["items"] if item and not WALLET_CREDIT_PATTERN.match(item)]
+    if transaction["type"] != "Purchase" or transaction["total"] is None or not games:
+        return []
+    
+    price, remainder = divmod(transaction["total"], len(games))
+    return [
+        {"game_name": game_name, "price": price + (1 if index < remainder else 0), "date": transaction["date"]}
+        for index, game_name in enumerate(games)
+    ]
 
 def parse_game_name(name):
-    game_name = ""
-    if "PC" in name:
-        game_name = name.split("PC")[0]
-    elif "Steam" in name:
-        game_name = name.split("Steam")[0]
-    elif "EA" in name:
-        game_name = name.split("EA")[0]
-    elif "Origin" in name:
-        game_name = name.split("Origin")[0]
-        
-    return game_name
\ No newline at end of file
+    # names without a platform are already just the game name
+    # only whole words count, "BEAT SABER" isn't cut at "EA"
+    return PLATFORM_NAME_PATTERN.split(name, maxsplit=1)[0]
\ No newline at end of file
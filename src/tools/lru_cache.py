@@ -0,0 +1,92 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Iterable, Tuple
+
+class LRUCache:
+    """
+        Thread safe in memory cache bounded by size and age.
+
+        Once max_size entries are stored the least recently used one is dropped to make room,
+        entries older than ttl are treated as missing.
+        Every invalidation bumps a generation number, a reader that started before it can pass
+        the generation it saw to set so a value read before a write isn't stored after it.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None):
+        """
+            Args:
+                max_size: most entries kept at once
+                ttl: seconds an entry stays valid, None to keep entries until they are evicted
+        """
+        if max_size <= 0:
+            raise ValueError("LRUCache max_size must be greater than 0!")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+            Return: (True, value) when key is cached and fresh, otherwise (False, None)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (self.ttl is None or time.monotonic() - entry[0] <= self.ttl):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key: Hashable, value: Any, generation: int = None):
+        """
+            Store value under key, evicting the least recently used entries when full.
+
+            Args:
+                generation: generation seen before value was read, value is dropped if anything was invalidated since
+        """
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keys: Iterable[Hashable]):
+        """
+            Remove keys from the cache, keys that aren't cached are ignored.
+        """
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+            Return: hits, misses, evictions and current size
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self._entries)}
@@ -0,0 +1,123 @@
+import re
+import heapq
+from collections import defaultdict
+from typing import Dict, Any, List, Tuple
+
+# removed before names are compared
+TRADEMARK_PATTERN = re.compile(r"[™®©]")
+EDITION_PATTERN = re.compile(
+    r"\b(?:(?:standard|deluxe|gold|ultimate|complete|definitive|enhanced|special|collector s|digital|premium|anniversary|game of the year)\s+edition|goty)\b"
+)
+# store and platform words found in receipt names, e.g. "Fort Solis PC Steam CD Key"
+PLATFORM_PATTERN = re.compile(r"\b(?:pc|steam|origin|ea app|ea|gog|uplay|epic games|cd key|key|global)\b")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s]|_")
+SPACE_PATTERN = re.compile(r"\s+")
+
+def normalize_name(name: str)-> str:
+    """
+        Puts a game name in a form that can be compared with other sources.
+        Lower case, no trademark symbols, punctuation, edition suffixes or store/platform words.
+
+        name: game name from steam or a purchase receipt
+        return: normalized name, empty if nothing is left
+    """
+    name = TRADEMARK_PATTERN.sub('', name.lower())
+    name = PUNCTUATION_PATTERN.sub(' ', name)
+    name = EDITION_PATTERN.sub(' ', name)
+    name = PLATFORM_PATTERN.sub(' ', name)
+    return SPACE_PATTERN.sub(' ', name).strip()
+
+def trigrams(name: str)-> set:
+    """
+        Character trigrams of a normalized name, padded so the start and end of words count.
+    """
+    padded = f"  {name} "
+    return {padded[i:i+3] for i in range(len(padded) - 2)}
+
+class NameMatcher:
+    """
+        In memory fuzzy matcher from purchase names to steam appids.
+
+        Built once from the games table, every game's normalized name is split into character trigrams
+        and kept in an inverted index (trigram -> games). A query only scores games sharing a trigram with it,
+        so there is no comparison against every game name.
+        Trigrams found in a large share of names (" th", "the") are skipped while finding candidates,
+        the short list of candidates is then scored exactly.
+    """
+    COMMON_TRIGRAM_SHARE = 0.02 # trigrams in more than this share of names are too common to look up
+    MIN_COMMON_TRIGRAM = 200 # names a trigram must be in before it can be too common
+    CANDIDATES_PER_RESULT = 4 # candidates scored exactly for each result asked for
+
+    def __init__(self, games: List[Dict[str, Any]]):
+        """
+            Args:
+                games: rows with appid and game_name
+        """
+        self._appids: List[int] = []
+        self._names: List[str] = []
+        self._normalized: List[str] = []
+        self._index: Dict[str, List[int]] = defaultdict(list)
+        self._exact: Dict[str, List[int]] = defaultdict(list)
+
+        for game in games:
+            name = normalize_name(game["game_name"] or "")
+            if not name:
+                continue
+            position = len(self._appids)
+            self._appids.append(game["appid"])
+            self._names.append(game["game_name"])
+            self._normalized.append(name)
+            self._exact[name].append(position)
+
+            for trigram in trigrams(name):
+                self._index[trigram].append(position)
+        
+        self._common_limit = max(self.MIN_COMMON_TRIGRAM, len(self._appids) * self.COMMON_TRIGRAM_SHARE)
+
+    def __len__(self):
+        return len(self._appids)
+
+    def match(self, name: str, top_k: int = 5, min_score: float = 0.0)-> List[Tuple[int, str, float]]:
+        """
+            Finds the games whose names are closest to name.
+            Score is the Jaccard similarity of both names trigrams, an exact normalized match scores 1.0.
+
+            Args:
+                name: purchase name to look up
+                top_k: most candidates to return
+                min_score: candidates below this score are left out
+            Return: (appid, game_name, score) best first
+        """
+        query = normalize_name(name)
+        if not query:
+            return []
+
+        exact = self._exact.get(query)
+        if exact:
+            return [(self._appids[position], self._names[position], 1.0) for position in exact[:top_k]]
+
+        query_trigrams = trigrams(query)
+        rare_trigrams = [trigram for trigram in query_trigrams if len(self._index.get(trigram, ())) <= self._common_limit]
+        shared = defaultdict(int)
+        for trigram in rare_trigrams or query_trigrams:
+            for position in self._index.get(trigram, ()):
+                shared[position] += 1
+
+        candidates = heapq.nlargest(top_k * self.CANDIDATES_PER_RESULT, shared, key=shared.get)
+        scored = []
+        for position in candidates:
+            name_trigrams = trigrams(self._normalized[position])
+            overlap = len(query_trigrams & name_trigrams)
+            scored.append((overlap / len(query_trigrams | name_trigrams), position))
+        best = heapq.nlargest(top_k, scored)
+        return [
+            (self._appids[position], self._names[position], score)
+            for score, position in best if score >= min_score
+        ]
+
+    def best_match(self, name: str, min_score: float = 0.5)-> Tuple[int, str, float]:
+        """
+            Return: best (appid, game_name, score) for name, None if nothing scores at least min_score
+        """
+        matches = self.match(name, top_k=1, min_score=min_score)
+        return matches[0] if matches else None
@@ -0,0 +1,79 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+        Thread safe token bucket used to share a request budget between workers.
+
+        Tokens are added at a steady rate (requests / period) up to capacity.
+        A caller that finds the bucket empty reserves the next token and sleeps outside the lock,
+        so many workers can wait on the bucket while their requests are still in flight.
+    """
+
+    def __init__(self, requests: int, period: float, capacity: int = 1):
+        """
+            Args:
+                requests: number of requests allowed within period
+                period: seconds the request budget covers
+                capacity: max tokens that can be saved up, how many requests can burst at once
+        """
+        if requests <= 0 or period <= 0:
+            raise ValueError("TokenBucket requests and period must be greater than 0!")
+
+        self.rate = requests / period
+        self.base_rate = self.rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._throttled_until = 0.0
+        self._lock = threading.Lock()
+
+    def throttle(self, factor: float, duration: float):
+        """
+            Lower the rate for a while, used when the server says requests are being made too fast.
+            Calling again while throttled lowers the rate further and extends the duration.
+
+            Args:
+                factor: multiplied with the current rate, between 0 and 1
+                duration: seconds until the rate goes back to normal
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # repeated throttling can lower the rate at most 4 times
+            self.rate = max(self.base_rate * factor ** 4, self.rate * factor)
+            self._throttled_until = now + duration
+
+    def _refill(self, now: float):
+        """
+            Add tokens earned since last refill, never going above capacity.
+            Tokens can be negative when callers have reserved future tokens.
+        """
+        if self._throttled_until and now >= self._throttled_until:
+            # tokens earned while throttled are added at the lowered rate
+            self._tokens = min(self.capacity, self._tokens + (self._throttled_until - self._updated_at) * self.rate)
+            self._updated_at = self._throttled_until
+            self.rate = self.base_rate
+            self._throttled_until = 0.0
+        
+        elapsed = now - self._updated_at
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def acquire(self, tokens: int = 1) -> float:
+        """
+            Take tokens from the bucket, blocking until they are available.
+
+            Return: seconds spent waiting for the tokens
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self._tokens -= tokens
+            # reserve the tokens now, wait for them outside the lock
+            wait_time = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait_time > 0:
+            time.sleep(wait_time)
+        return wait_time
+
@@ -0,0 +1,57 @@
+from collections.abc import Mapping
+from functools import lru_cache
+from typing import Any, Iterable, Tuple
+
+class Record(Mapping):
+    """
+        Compact read only row, an alternative to a dict per row for large results.
+
+        Each query shape gets its own subclass from record_type, values are kept in __slots__
+        and field names are stored once on the class instead of as keys on every row.
+        Rows are read like dicts (row['appid'], row.get, dict(row)) or by attribute (row.appid),
+        and compare equal to a dict with the same items.
+    """
+    __slots__ = ()
+    _fields: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_row(cls, values: Iterable[Any]) -> 'Record':
+        """
+            Build a record from database row values, in the same order as _fields.
+        """
+        record = cls.__new__(cls)
+        for field, value in zip(cls._fields, values):
+            object.__setattr__(record, field, value)
+        return record
+
+    def __getitem__(self, field: str) -> Any:
+        if field not in self._fields:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __setattr__(self, field: str, value: Any):
+        raise AttributeError(f"{type(self).__name__} is read only")
+
+    def __repr__(self):
+        values = ', '.join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{type(self).__name__}({values})"
+
+@lru_cache(maxsize=None)
+def record_type(fields: Tuple[str, ...]) -> type:
+    """
+        Record subclass for rows with these fields, the same class is returned for the same fields.
+
+        Args:
+            fields: column names of the query, each must be a valid identifier
+        Return: Record subclass with a slot per field
+    """
+    for field in fields:
+        if not field.isidentifier() or hasattr(Record, field):
+            raise ValueError(f"Record field {field!r} must be a valid identifier that isn't a Record attribute!")
+    return type('Record_' + '_'.join(fields), (Record,), {'__slots__': fields, '_fields': fields})
@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from typing import Dict, Any, List
+
+from src import logger
+
+DAY = 24 * 60 * 60 # Seconds
+
+class ResponseCache:
+    """
+        On disk cache of Steam appdetails responses, one file per appid and locale.
+
+        Files are named by a hash of their key and sharded into sub directories,
+        so a large catalogue doesn't end up in a single folder.
+        Fields within a response are split into classes that each have their own time to live,
+        prices change often while descriptions and genres rarely do.
+    """
+    # top level appdetails fields that expire quickly, everything else is static
+    FIELD_CLASSES = {
+        "price": ["price_overview"],
+    }
+    STATIC = "static"
+    TTLS = {
+        "price": 1 * DAY,
+        STATIC: 21 * DAY,
+    }
+
+    def __init__(self, cache_dir: str, ttls: Dict[str, float] = None):
+        """
+            Args:
+                cache_dir: directory where responses are stored
+                ttls: seconds each field class stays fresh, missing classes use TTLS
+        """
+        self.cache_dir = cache_dir
+        self.ttls = self.TTLS | (ttls or {})
+
+    def _path(self, appid: int, locale: str) -> str:
+        """
+            Content addressed file path for an appid and locale.
+        """
+        key = hashlib.sha256(f"{appid}:{locale}".encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def load(self, appid: int, locale: str = '') -> Dict[str, Any]:
+        """
+            Load a cached entry.
+
+            Return: entry with response, etag, last_modified and fetched_at per field class, None if not cached
+        """
+        try:
+            with open(self._path(appid, locale), 'r') as json_file:
+                return json.load(json_file)
+        except FileNotFoundError:
+            return None
+        except json.JSONDecodeError:
+            logger.warning(f"Cache entry for GameId {appid} is corrupt, ignoring it")
+            return None
+
+    def save(self, appid: int, locale: str, response: Dict[str, Any], etag: str = None, last_modified: str = None) -> Dict[str, Any]:
+        """
+            Store a full appdetails response, every field class is marked as fresh.
+
+            Return: entry that was saved
+        """
+        now = time.time()
+        entry = {
+            "appid": appid,
+            "locale": locale,
+            "etag": etag,
+            "last_modified": last_modified,
+            "fetched_at": {field_class: now for field_class in self.ttls},
+            "response": response
+        }
+        self._write(entry)
+        return entry
+
+    def refresh(self, entry: Dict[str, Any], field_classes: List[str]):
+        """
+            Mark field classes of an entry as fresh, used after the server confirms the data hasn't changed
+            or after only those fields were downloaded again.
+        """
+        now = time.time()
+        for field_class in field_classes:
+            entry["fetched_at"][field_class] = now
+        self._write(entry)
+
+    def stale_classes(self, entry: Dict[str, Any]) -> List[str]:
+        """
+            Return: field classes of entry whose time to live has passed
+        """
+        now = time.time()
+        fetched_at = entry.get("fetched_at", {})
+        return [
+            field_class for field_class, ttl in self.ttls.items()
+            if now - fetched_at.get(field_class, 0) > ttl
+        ]
+
+    def _write(self, entry: Dict[str, Any]):
+        """
+            Write entry to a temp file then move it into place so a crash never leaves half an entry.
+        """
+        path = self._path(entry["appid"], entry["locale"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w') as json_file:
+            json.dump(entry, json_file)
+        os.replace(temp_path, path)
@@ -1,8 +1,12 @@
 import pytest
+import threading
+import time
 import psycopg2 as pg2
+import psycopg2.pool
 from unittest.mock import patch, Mock, MagicMock
 
 from data.steam_database import SteamDatabase
+from src.tools.records import Record
 import test_data
 
 
@@ -11,6 +15,8 @@ def mock_conn():
     """Create a mock connection for database operations."""
     conn = MagicMock()
     conn.cursor.return_value = MagicMock()
+    # psycopg2 connections report 0 while open
+    conn.closed = 0
     return conn
 
 @pytest.fixture
@@ -20,6 +26,8 @@ def db(mock_conn):
         db = SteamDatabase(database=test_data.DATABASE_NAME, user=test_data.DATABASE_USER, password=test_data.DATABASE_PASSWORD)
         db.conn = mock_conn
         db.cur = mock_conn.cursor()
+        # no users loaded yet, user checks fall through to _check_table_item
+        db._known_users = set()
         return db
 
 def test_init_connects_to_database():
@@ -37,6 +45,119 @@ def test_init_connects_to_database():
             password="test_password"
         )
         
+def _pooled_conn():
+    conn = MagicMock()
+    conn.closed = 0
+    return conn
+
+@pytest.fixture
+def pooled_db():
+    """Create a pooled SteamDatabase instance with a mocked pool."""
+    with patch('psycopg2.pool.ThreadedConnectionPool') as mock_pool:
+        mock_pool.return_value.maxconn = 4
+        db = SteamDatabase(database=test_data.DATABASE_NAME, user=test_data.DATABASE_USER, password=test_data.DATABASE_PASSWORD,
+                           min_connections=1, max_connections=4)
+        mock_pool.assert_called_once_with(1, 4, database="test_db", user="test_user", password="test_password")
+        return db
+
+def test_pooled_borrows_connection_per_operation(pooled_db: SteamDatabase):
+    assert pooled_db.conn is None and pooled_db.cur is None
+    conn = _pooled_conn()
+    pooled_db.pool.getconn.return_value = conn
+    cur = conn.cursor.return_value.__enter__.return_value
+    cur.fetchone.return_value = (test_data.STEAM_USER_ID,)
+    
+    assert pooled_db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID)
+    # connection goes back to the pool once the operation is done
+    pooled_db.pool.putconn.assert_called_once_with(conn, close=False)
+
+def test_pooled_replaces_broken_connection(pooled_db: SteamDatabase):
+    broken_conn = _pooled_conn()
+    broken_conn.closed = 2
+    healthy_conn = _pooled_conn()
+    pooled_db.pool.getconn.side_effect = [broken_conn, healthy_conn]
+    
+    with pooled_db._connection() as (conn, cur):
+        assert conn is healthy_conn
+    pooled_db.pool.putconn.assert_any_call(broken_conn, close=True)
+    pooled_db.pool.putconn.assert_called_with(healthy_conn, close=False)
+
+def test_pooled_skips_health_check_for_recent_connection(pooled_db: SteamDatabase):
+    conn = _pooled_conn()
+    pooled_db.pool.getconn.return_value = conn
+    pooled_db._pool_opened_at = time.monotonic()
+    
+    with pooled_db._connection():
+        pass
+    with pooled_db._connection():
+        pass
+    # connections used recently go straight to the operation, no extra round trip
+    conn.rollback.assert_not_called()
+    conn.cursor.return_value.__enter__.return_value.execute.assert_not_called()
+
+def test_pooled_checks_idle_connection(pooled_db: SteamDatabase):
+    idle_conn = _pooled_conn()
+    idle_conn.cursor.return_value.__enter__.return_value.execute.side_effect = pg2.OperationalError("server closed the connection")
+    healthy_conn = _pooled_conn()
+    pooled_db.pool.getconn.side_effect = [idle_conn, healthy_conn]
+    pooled_db._idle_since[idle_conn] = time.monotonic() - SteamDatabase.POOL_IDLE_CHECK_TIME - 1
+    pooled_db._idle_since[healthy_conn] = time.monotonic() - SteamDatabase.POOL_IDLE_CHECK_TIME - 1
+    
+    with pooled_db._connection() as (conn, cur):
+        assert conn is healthy_conn
+    # the idle connection the server dropped is checked and replaced
+    pooled_db.pool.putconn.assert_any_call(idle_conn, close=True)
+    healthy_conn.cursor.return_value.__enter__.return_value.execute.assert_called_with("SELECT 1")
+
+def test_pooled_closes_connection_after_operational_error(pooled_db: SteamDatabase):
+    conn = _pooled_conn()
+    pooled_db.pool.getconn.return_value = conn
+    
+    with pytest.raises(pg2.OperationalError):
+        with pooled_db._connection():
+            raise pg2.OperationalError("server closed the connection unexpectedly")
+    pooled_db.pool.putconn.assert_called_once_with(conn, close=True)
+
+def test_pooled_waits_for_free_connection(pooled_db: SteamDatabase):
+    # stand in for ThreadedConnectionPool, which raises instead of waiting once every connection is lent out
+    free = [_pooled_conn() for _ in range(pooled_db.pool.maxconn)]
+    pool_lock = threading.Lock()
+    def getconn():
+        with pool_lock:
+            if not free:
+                raise pg2.pool.PoolError("connection pool exhausted")
+            return free.pop()
+    def putconn(conn, close=False):
+        with pool_lock:
+            free.append(conn)
+    pooled_db.pool.getconn.side_effect = getconn
+    pooled_db.pool.putconn.side_effect = putconn
+    pooled_db._pool_opened_at = time.monotonic()
+    
+    errors = []
+    def operation():
+        try:
+            with pooled_db._connection():
+                time.sleep(0.01)
+        except Exception as e:
+            errors.append(e)
+    # twice as many threads as connections, the extra ones wait for a connection to come back
+    threads = [threading.Thread(target=operation) for _ in range(2 * pooled_db.pool.maxconn)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    
+    assert errors == []
+    assert len(free) == pooled_db.pool.maxconn
+
+def test_single_connection_reconnects(db: SteamDatabase):
+    db.conn.closed = 1
+    with patch('psycopg2.connect') as mock_connect:
+        with db._connection() as (conn, cur):
+            assert conn == mock_connect.return_value
+        mock_connect.assert_called_once_with(database="test_db", user="test_user", password="test_password")
+
 @pytest.mark.parametrize("return_value, expected", [
     #Test _check_table_item when the item is found.
     (test_data.STEAM_USER_ID, True),
@@ -50,8 +171,7 @@ def test_check_table_item_found(return_value, expected, db: SteamDatabase):
     assert result == expected
     
     # Verify execute was called with the correct query
-    expected_query = f"SELECT steamid FROM users WHERE steamid = '{test_data.STEAM_USER_ID}'"
-    db.cur.execute.assert_called_once_with(expected_query)
+    assert_prepared(db.cur, "SELECT steamid FROM users WHERE steamid = $1", (test_data.STEAM_USER_ID,))
 
 def test_check_table_item_database_error(db: SteamDatabase):
     """Test _check_table_item when a database error occurs."""
@@ -110,6 +230,37 @@ def test_insert_new_row_database_error(db: SteamDatabase):
     db.conn.rollback.assert_called_once()
     
 
+def test_insert_new_row_copy(db: SteamDatabase):
+    """Test _insert_new_row streams large inserts through a staging table."""
+    db.COPY_THRESHOLD = 2
+    fields = ['appid', 'developer_name']
+    items = [
+        {'appid': 1, 'developer_name': 'Valve'},
+        {'appid': 2, 'developer_name': None},
+        {'appid': 1, 'developer_name': 'Say "hi"'}
+    ]
+    on_conflict = """
+        ON CONFLICT (appid, developer_name)
+        DO NOTHING
+    """
+    result = db._insert_new_row('developers', fields, items, on_conflict)
+    assert result == True
+    db.cur.executemany.assert_not_called()
+    
+    # rows are sent as csv, None is an unquoted NULL
+    copy_query, copy_file = db.cur.copy_expert.call_args[0]
+    assert normalize_sql(copy_query) == normalize_sql("COPY staging_developers (appid, developer_name, staging_row) FROM STDIN WITH (FORMAT csv)")
+    assert copy_file.getvalue() == '1,"Valve",0\n2,,1\n1,"Say ""hi""",2\n'
+    
+    expected_query = """
+        INSERT INTO developers (appid, developer_name)
+        SELECT DISTINCT ON (appid, developer_name) appid, developer_name FROM staging_developers
+        ORDER BY appid, developer_name, staging_row DESC
+    """ + on_conflict
+    actual_query = db.cur.execute.call_args[0][0]
+    assert normalize_sql(actual_query) == normalize_sql(expected_query)
+    db.conn.commit.assert_called_once()
+
 def test_add_steam_user_new_user(db: SteamDatabase):
     """Test adding a new user to the database."""
     # Mock _check_table_item to return False (user doesn't exist)
@@ -141,59 +292,93 @@ def test_add_steam_user_existing_user(db: SteamDatabase):
             # Verify _insert_new_row was not called
             mock_insert.assert_not_called()
 
+def test_known_users_loaded_once(db: SteamDatabase):
+    db._known_users = None
+    db.cur.fetchall.return_value = [(test_data.STEAM_USER_ID,)]
+    with patch.object(db, '_check_table_item', return_value=False) as mock_check:
+        assert db._is_known_user(test_data.STEAM_USER_ID)
+        assert db._is_known_user(test_data.STEAM_USER_ID)
+        # every user is read by one query, then lookups are served from memory
+        db.cur.execute.assert_called_once_with("SELECT steamid FROM users")
+        mock_check.assert_not_called()
+        
+        # a user not loaded is still looked up
+        assert db._is_known_user("76561198000000000") == False
+        mock_check.assert_called_once_with('steamid', 'users', "76561198000000000")
+
+@patch.object(SteamDatabase, '_insert_new_row', return_value=True)
+@patch.object(SteamDatabase, '_check_table_item', return_value=False)
+def test_add_steam_user_remembers_user(mock_check, mock_insert, db: SteamDatabase):
+    assert db.add_steam_user(test_data.CORRECT_USER_PROCESSED) == True
+    
+    # later writes for the user skip the existence query
+    assert db.add_to_library(test_data.STEAM_USER_ID, test_data.CORRECT_LIBRARY_PROCESSED) == len(test_data.CORRECT_LIBRARY_PROCESSED)
+    mock_check.assert_called_once_with('steamid', 'users', test_data.CORRECT_USER_PROCESSED['steamid'])
+
 def test_check_update_status_user_not_found(db: SteamDatabase):
     """Test check_update_status when the user is not found in the database."""
-    # Mock _check_table_item to return False (user doesn't exist)
-    with patch.object(db, '_check_table_item', return_value=False):
+    # no schedule row for the user
+    db.cur.fetchone.return_value = None
+    with patch.object(db, '_check_table_item') as mock_check:
         result = db.check_update_status("765611980415113", "wishlist_update_at")
-        # Verify the result is False (data needs to be updated)
+        # Verify the result is True (data needs to be updated)
         assert result == True
         
-        # Verify _check_table_item was called with the correct parameters
-        db._check_table_item.assert_called_once_with('steamid', 'schedule_data_retrieval', "765611980415113")
-        # Verify execute was not called
-        db.cur.execute.assert_not_called()
+        # the schedule is read directly, without a separate existence check
+        mock_check.assert_not_called()
+        assert db.cur.execute.call_args[0][1] == ("765611980415113",)
 
 def test_check_update_status_success(db: SteamDatabase):
     """Test check_update_status when the user is found and query is successful."""
-    # Mock _check_table_item to return True (user exists)
-    with patch.object(db, '_check_table_item', return_value=True):
-        # Mock cursor.fetchone to return True (update needed)
-        db.cur.fetchone.return_value = True
+    with patch.object(db, '_check_table_item') as mock_check:
+        # Mock cursor.fetchone to return False (no update needed)
+        db.cur.fetchone.return_value = (False,)
         result = db.check_update_status(test_data.STEAM_USER_ID, "wishlist_updated_at")
         
-        # Verify the result is True (update needed)
-        assert result == True
-        
-        # Verify _check_table_item was called with the correct parameters
-        db._check_table_item.assert_called_once_with('steamid', 'schedule_data_retrieval', test_data.STEAM_USER_ID)
+        # Verify the result is False (update not needed)
+        assert result == False
+        mock_check.assert_not_called()
         
         # Verify execute was called with the correct query
         expected_query = f"""
                 SELECT needs_retrieval(wishlist_updated_at) 
                 FROM schedule_data_retrieval 
-                WHERE steamid = '{test_data.STEAM_USER_ID}';
+                WHERE steamid = $1
             """
-            
-        # query being called within the method
-        actual_query = db.cur.execute.call_args[0][0]
-        assert normalize_sql(actual_query) == normalize_sql(expected_query)
+        assert_prepared(db.cur, expected_query, (test_data.STEAM_USER_ID,))
 
 def test_check_update_status_database_error(db: SteamDatabase):
     """Test check_update_status when a database error occurs."""
-    # Mock _check_table_item to return True (user exists)
-    with patch.object(db, '_check_table_item', return_value=True):
-        # Mock cursor.execute to raise a database error
-        db.cur.execute.side_effect = pg2.Error("Database error")
-        
-        result = db.check_update_status(test_data.STEAM_USER_ID, "wishlist_update_at")
-        # Verify the result is None (error occurred)
-        assert result == True
-        
-        # Verify _check_table_item was called with the correct parameters
-        db._check_table_item.assert_called_once_with('steamid', 'schedule_data_retrieval', test_data.STEAM_USER_ID)
-        # Verify rollback was called
-        db.conn.rollback.assert_called_once()
+    # Mock cursor.execute to raise a database error
+    db.cur.execute.side_effect = pg2.Error("Database error")
+    
+    result = db.check_update_status(test_data.STEAM_USER_ID, "wishlist_update_at")
+    # Verify the result is True (data is retrieved again)
+    assert result == True
+    # Verify rollback was called
+    db.conn.rollback.assert_called_once()
+
+def test_prepared_statement_per_connection(db: SteamDatabase):
+    db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID)
+    db._check_table_item('steamid', 'users', "76561198000000000")
+    # second lookup only executes the statement prepared by the first
+    assert [call.args[0].split()[0] for call in db.cur.execute.call_args_list] == ['PREPARE', 'EXECUTE', 'EXECUTE']
+    assert db.cur.execute.call_args[0][1] == ("76561198000000000",)
+    
+    # a new connection doesn't have the statement yet
+    new_conn = MagicMock(closed=0)
+    db.conn, db.cur = new_conn, new_conn.cursor()
+    db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID)
+    assert [call.args[0].split()[0] for call in db.cur.execute.call_args_list] == ['PREPARE', 'EXECUTE']
+
+def test_prepared_statement_dropped(db: SteamDatabase):
+    db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID)
+    db.cur.execute.side_effect = [pg2.errors.InvalidSqlStatementName("missing"), None, None]
+    assert db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID) == False
+    db.conn.rollback.assert_called_once()
+    
+    db._check_table_item('steamid', 'users', test_data.STEAM_USER_ID)
+    assert db.cur.execute.call_args_list[-2].args[0].startswith('PREPARE')
 
 add_to_library_conflict = f"""
     ON CONFLICT (steamid, appid)
@@ -226,6 +411,43 @@ def test_add_appids_to_db(db: SteamDatabase, func_name, on_conflict, data):
             assert normalize_sql(actual_query) == normalize_sql(on_conflict) 
             mock_insert.assert_called_once()     
 
+@pytest.mark.parametrize('func_name, table, field, data', [
+    ('sync_library', 'user_library', 'playtime_minutes', test_data.CORRECT_LIBRARY_PROCESSED),
+    ('sync_wishlist', 'wishlist', 'priority', test_data.WISHLIST)
+])
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_sync_user_items(mock_check_user, db: SteamDatabase, func_name, table, field, data):
+    db.cur.fetchall.return_value = [(10, 'added'), (20, 'removed'), (30, 'changed'), (10, 'new_games')]
+    changes = getattr(db, func_name)(test_data.STEAM_USER_ID, data)
+    assert changes == {"added": [10], "removed": [20], "changed": [30], "new_games": [10]}
+    
+    # diff and writes happen in one statement
+    db.cur.execute.assert_called_once()
+    query, params = db.cur.execute.call_args[0]
+    assert f"DELETE FROM {table}" in query
+    assert f"INSERT INTO {table} (steamid, appid, {field})" in query
+    assert params == {
+        "steamid": test_data.STEAM_USER_ID,
+        "appids": [item['appid'] for item in data],
+        "values": [item[field] for item in data]
+    }
+    db.conn.commit.assert_called_once()
+
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_sync_user_items_missing_field(mock_check_user, db: SteamDatabase):
+    changes = db.sync_wishlist(test_data.STEAM_USER_ID, test_data.CORRECT_LIBRARY_PROCESSED)
+    assert changes == {"added": [], "removed": [], "changed": [], "new_games": []}
+    db.cur.execute.assert_not_called()
+    db.conn.rollback.assert_called_once()
+
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_sync_user_items_database_error(mock_check_user, db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("Test database error")
+    changes = db.sync_library(test_data.STEAM_USER_ID, test_data.CORRECT_LIBRARY_PROCESSED)
+    assert changes == {"added": [], "removed": [], "changed": [], "new_games": []}
+    db.conn.rollback.assert_called_once()
+    db.conn.commit.assert_not_called()
+
 add_to_games_conflict = f"""
     ON CONFLICT (appid)
     DO UPDATE SET
@@ -347,13 +569,40 @@ def test_add_to_db_fail(db: SteamDatabase, func_name, error_message):
     #  Verify the exception has the expected message including the specific user ID
     assert str(excinfo.value) == error_message
 
+@patch.object(SteamDatabase,'_check_table_item', return_value=True)
+def test_add_games_batch(mock_table, db: SteamDatabase):
+    result = db.add_games_batch(test_data.STEAM_USER_ID, [test_data.CORRECT_GAME_PROCESSED])
+    assert result == 1
+    
+    # user is checked once and all seven tables are written in one transaction
+    mock_table.assert_called_once_with('steamid', 'users', test_data.STEAM_USER_ID)
+    tables = [call[0][0].split()[2] for call in db.cur.executemany.call_args_list]
+    assert tables == ['games', 'developers', 'publishers', 'categories', 'genres', 'prices', 'metacritic']
+    db.conn.commit.assert_called_once()
+    db.conn.rollback.assert_not_called()
+
+@patch.object(SteamDatabase,'_check_table_item', return_value=True)
+def test_add_games_batch_database_error(mock_table, db: SteamDatabase):
+    # third table fails, nothing from the batch should be kept
+    db.cur.executemany.side_effect = [None, None, pg2.Error("Database error")]
+    result = db.add_games_batch(test_data.STEAM_USER_ID, [test_data.CORRECT_GAME_PROCESSED])
+    assert result == 0
+    
+    db.conn.commit.assert_not_called()
+    db.conn.rollback.assert_called_once()
+
+@patch.object(SteamDatabase,'_check_table_item', return_value=False)
+def test_add_games_batch_no_user(mock_table, db: SteamDatabase):
+    assert db.add_games_batch(test_data.STEAM_USER_ID, [test_data.CORRECT_GAME_PROCESSED]) == 0
+    db.cur.executemany.assert_not_called()
+
 get_library_query = f"""
     SELECT steamid, appid, playtime_minutes, user_paid_price FROM user_library
-    WHERE steamid = '{test_data.STEAM_USER_ID}';
+    WHERE steamid = $1
 """
 get_wishlist_query = f"""
     SELECT steamid, appid, priority FROM wishlist
-    WHERE steamid = '{test_data.STEAM_USER_ID}';
+    WHERE steamid = $1
 """
 @pytest.mark.parametrize('func_name, response, processed, query', [
     ('get_library', test_data.DB_LIBRARY_RESPONSE, test_data.DB_LIBRARY_PROCESSED, get_library_query),
@@ -376,8 +625,277 @@ def test_get_user_appids(db: SteamDatabase, func_name, response, processed, quer
         
         # query being called within the method
         if query:
-            actual_query = db.cur.execute.call_args[0][0]
-            assert normalize_sql(actual_query) == normalize_sql(query)  
+            assert_prepared(db.cur, query, (test_data.STEAM_USER_ID,))
+
+@pytest.mark.parametrize('func_name, response, processed', [
+    ('get_library', test_data.DB_LIBRARY_RESPONSE, test_data.DB_LIBRARY_PROCESSED),
+    ('get_wishlist', test_data.DB_WISHLIST_RESPONSE, test_data.DB_WISHLIST_PROCESSED)
+])
+def test_get_user_appids_compact(db: SteamDatabase, func_name, response, processed):
+    db.cur.fetchall.return_value = response
+    items = getattr(db, func_name)(test_data.STEAM_USER_ID, compact=True)
+    
+    # same rows as dicts, every row shares one Record class
+    assert items == processed
+    assert all(isinstance(item, Record) for item in items)
+    assert len({type(item) for item in items}) == 1
+
+def test_stream_rows_compact(db: SteamDatabase):
+    db.cur.__iter__.return_value = iter(test_data.DB_WISHLIST_RESPONSE)
+    rows = list(db.stream_rows('wishlist', ['steamid', 'appid', 'priority'], compact=True))
+    assert rows == test_data.DB_WISHLIST_PROCESSED
+    assert isinstance(rows[0], Record)
+
+@pytest.fixture
+def cached_db(mock_conn):
+    with patch('psycopg2.connect', return_value=mock_conn):
+        db = SteamDatabase(database=test_data.DATABASE_NAME, user=test_data.DATABASE_USER, password=test_data.DATABASE_PASSWORD, cache_size=10)
+        db.cur = mock_conn.cursor()
+        db._known_users = set()
+        return db
+
+def test_get_game_cached(cached_db: SteamDatabase):
+    cached_db.cur.fetchall.return_value = test_data.DB_GAMES_RESPONSE
+    assert cached_db.get_game(test_data.STEAM_APPID) == test_data.CORRECT_GAMES_PROCESSED
+    # changing a result doesn't change the cache
+    cached_db.get_game(test_data.STEAM_APPID)["game_name"] = "changed"
+    
+    assert cached_db.get_game(str(test_data.STEAM_APPID)) == test_data.CORRECT_GAMES_PROCESSED
+    # PREPARE and EXECUTE for the first call only
+    assert cached_db.cur.execute.call_count == 2
+    assert cached_db.cache_stats() == {"hits": 2, "misses": 1, "evictions": 0, "size": 1}
+
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_add_to_invalidates_cache(mock_check_user, cached_db: SteamDatabase):
+    cached_db.cur.fetchall.return_value = test_data.DB_PRICES_RESPONSE
+    cached_db.get_prices(test_data.STEAM_APPID)
+    cached_db.get_developers(test_data.STEAM_APPID)
+    
+    price_overview = {"currency": "USD", "price_in_cents": 999, "final_formatted": "$9.99", "discount_percentage": 0}
+    cached_db.add_to_prices(test_data.STEAM_USER_ID, [{"appid": test_data.STEAM_APPID, "price_overview": price_overview}])
+    # only the table that was written to is read again
+    cached_db.cur.execute.reset_mock()
+    cached_db.get_prices(test_data.STEAM_APPID)
+    cached_db.get_developers(test_data.STEAM_APPID)
+    cached_db.cur.execute.assert_called_once()
+
+def test_get_game_error_not_cached(cached_db: SteamDatabase):
+    cached_db.cur.execute.side_effect = pg2.OperationalError("server closed the connection")
+    assert cached_db.get_game(test_data.STEAM_APPID) == {}
+    
+    # once the database recovers the game is read instead of the failed result
+    cached_db.cur.execute.side_effect = None
+    cached_db.cur.fetchall.return_value = test_data.DB_GAMES_RESPONSE
+    assert cached_db.get_game(test_data.STEAM_APPID) == test_data.CORRECT_GAMES_PROCESSED
+    assert cached_db.cache_stats()["size"] == 1
+
+def test_cache_off(db: SteamDatabase):
+    db.cur.fetchall.return_value = test_data.DB_GAMES_RESPONSE
+    db.get_game(test_data.STEAM_APPID)
+    db.get_game(test_data.STEAM_APPID)
+    # prepared once, executed twice
+    assert db.cur.execute.call_count == 3
+    assert db.cache_stats() == {}
+
+def test_get_game_features(db: SteamDatabase):
+    game_row = (test_data.STEAM_APPID, 'game', 'Test Game', False, 'description', 'header.jpg', 'site', 10, 'Jan 1, 2020', 'm')
+    db.cur.fetchall.side_effect = [
+        [game_row],
+        [(test_data.STEAM_APPID, ['Dev A', 'Dev B'])],
+        [(test_data.STEAM_APPID, ['Pub'])],
+        [(test_data.STEAM_APPID, ['Single-player'])],
+        [],
+        [(test_data.STEAM_APPID, 'USD', 1999, '$19.99', 0)],
+        [(test_data.STEAM_APPID, 85, 'url')]
+    ]
+    features = db.get_game_features([str(test_data.STEAM_APPID), 1])
+    
+    # one query per table, each for every appid at once
+    assert db.cur.execute.call_count == 7
+    for call in db.cur.execute.call_args_list:
+        assert 'ANY(%s)' in call[0][0]
+        assert call[0][1] == ([test_data.STEAM_APPID, 1],)
+    
+    game = features[test_data.STEAM_APPID]
+    assert game['game_name'] == 'Test Game'
+    assert game['developers'] == ['Dev A', 'Dev B']
+    assert game['genres'] == []
+    assert game['price'] == {'currency': 'USD', 'price_in_cents': 1999, 'final_formatted': '$19.99', 'discount_percentage': 0}
+    assert game['metacritic'] == {'score': 85, 'url': 'url'}
+    # appid not in games table is left out
+    assert list(features) == [test_data.STEAM_APPID]
+
+def test_get_game_features_empty(db: SteamDatabase):
+    assert db.get_game_features([]) == {}
+    db.cur.execute.assert_not_called()
+
+def test_get_game_features_from_feature_table(db: SteamDatabase):
+    db.cur.fetchall.return_value = [
+        (test_data.STEAM_APPID, 'game', 'Test Game', False, 'description', 'header.jpg', 'site', 10, 'Jan 1, 2020', 'm',
+         ['Dev'], ['Pub'], [], ['Action'], 'USD', 1999, '$19.99', 0, None, None)
+    ]
+    features = db.get_game_features([test_data.STEAM_APPID], from_feature_table=True)
+    
+    # a single lookup against the denormalized table
+    db.cur.execute.assert_called_once()
+    assert 'FROM game_features WHERE appid = ANY(%s)' in db.cur.execute.call_args[0][0]
+    game = features[test_data.STEAM_APPID]
+    assert game['developers'] == ['Dev']
+    assert game['genres'] == ['Action']
+    assert game['price']['price_in_cents'] == 1999
+    assert game['metacritic'] == {}
+
+@pytest.mark.parametrize('table_error', [False, True])
+def test_get_game_features_feature_table_fallback(db: SteamDatabase, table_error):
+    feature_row = (test_data.STEAM_APPID, 'game', 'Test Game', False, 'description', 'header.jpg', 'site', 10, 'Jan 1, 2020', 'm',
+                   ['Dev'], ['Pub'], [], ['Action'], None, None, None, None, None, None)
+    game_row = (1, 'game', 'Other Game', False, 'description', 'header.jpg', 'site', 10, 'Jan 1, 2020', 'm')
+    # games, then 4 name lists, prices and metacritic from the game tables
+    join_rows = [[game_row]] + [[]] * 6
+    if table_error:
+        # game_features hasn't been created, every game comes from the game tables
+        db.cur.execute.side_effect = [pg2.Error("relation game_features does not exist")] + [None] * 7
+        db.cur.fetchall.side_effect = join_rows
+        expected_appids = [test_data.STEAM_APPID, 1]
+    else:
+        # appid 1 isn't in game_features yet
+        db.cur.fetchall.side_effect = [[feature_row]] + join_rows
+        expected_appids = [1]
+    
+    features = db.get_game_features([test_data.STEAM_APPID, 1], from_feature_table=True)
+    
+    # missing games are built from the game tables instead of being left out
+    assert features[1]['game_name'] == 'Other Game'
+    assert db.cur.execute.call_args_list[1][0][1] == (expected_appids,)
+    if table_error:
+        db.conn.rollback.assert_called_once()
+    else:
+        assert features[test_data.STEAM_APPID]['genres'] == ['Action']
+
+def test_create_game_features_table_backfills(db: SteamDatabase):
+    db.cur.fetchone.side_effect = [(None,), ([test_data.STEAM_APPID, 1],)]
+    assert db.create_game_features_table()
+    
+    # every game already stored is added when the table is created
+    backfill = db.cur.execute.call_args_list[-1][0]
+    assert backfill[0].strip().startswith('INSERT INTO game_features')
+    assert backfill[1] == ([test_data.STEAM_APPID, 1],)
+    db.conn.commit.assert_called_once()
+
+def test_stream_rows(db: SteamDatabase, mock_conn):
+    db.cur.__iter__.return_value = iter(test_data.DB_WISHLIST_RESPONSE)
+    rows = db.stream_rows('wishlist', ['steamid', 'appid', 'priority'], 'steamid', test_data.STEAM_USER_ID, itersize=50)
+    
+    assert list(rows) == test_data.DB_WISHLIST_PROCESSED
+    # a named cursor that outlives commits on the shared connection
+    name = mock_conn.cursor.call_args.kwargs['name']
+    assert name.startswith('steam_db_stream_')
+    assert mock_conn.cursor.call_args.kwargs['withhold'] == True
+    assert db.cur.itersize == 50
+    db.cur.execute.assert_called_once_with("SELECT steamid, appid, priority FROM wishlist WHERE steamid = %s", (test_data.STEAM_USER_ID,))
+    # cursor closed then the read transaction ended, the connection isn't left idle in transaction
+    db.cur.close.assert_called_once()
+    db.conn.rollback.assert_called_once()
+
+def test_stream_rows_batches(db: SteamDatabase):
+    db.cur.fetchmany.side_effect = [[(1, 'Action'), (1, 'Indie')], [(2, 'RPG')], []]
+    batches = list(db.stream_rows('genres', ['appid', 'genre_name'], batch_size=2))
+    
+    assert batches == [
+        [{'appid': 1, 'genre_name': 'Action'}, {'appid': 1, 'genre_name': 'Indie'}],
+        [{'appid': 2, 'genre_name': 'RPG'}]
+    ]
+    db.cur.execute.assert_called_once_with("SELECT appid, genre_name FROM genres", None)
+    assert db.cur.itersize == SteamDatabase.STREAM_ITERSIZE
+
+def test_stream_rows_closed_early(db: SteamDatabase):
+    db.cur.__iter__.return_value = iter(test_data.DB_WISHLIST_RESPONSE)
+    rows = db.stream_rows('wishlist', ['steamid', 'appid', 'priority'])
+    next(rows)
+    rows.close()
+    
+    # cursor is closed and the shared connection is free again
+    db.cur.close.assert_called_once()
+    db.conn.rollback.assert_called_once()
+    assert db._lock.acquire(blocking=False)
+    db._lock.release()
+
+def test_stream_rows_database_error(db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("Database error")
+    with pytest.raises(pg2.Error):
+        list(db.stream_rows('genres', ['appid', 'genre_name']))
+    db.cur.close.assert_called_once()
+    db.conn.rollback.assert_called_once()
+
+def test_stream_rows_error_mid_scan(db: SteamDatabase):
+    db.cur.fetchmany.side_effect = [[(1, 'Action'), (1, 'Indie')], pg2.OperationalError("server closed the connection")]
+    rows = db.stream_rows('genres', ['appid', 'genre_name'], batch_size=2)
+    assert next(rows) == [{'appid': 1, 'genre_name': 'Action'}, {'appid': 1, 'genre_name': 'Indie'}]
+    
+    # a scan cut short raises instead of ending like a complete one
+    with pytest.raises(pg2.OperationalError):
+        next(rows)
+    db.cur.close.assert_called_once()
+    db.conn.rollback.assert_called_once()
+
+def test_stream_game_features(db: SteamDatabase):
+    db.cur.fetchmany.side_effect = [[
+        (test_data.STEAM_APPID, 'game', 'Test Game', False, 'description', 'header.jpg', 'site', 10, 'Jan 1, 2020', 'm',
+         ['Dev'], ['Pub'], [], ['Action'], None, None, None, None, 88, 'url')
+    ], []]
+    batches = list(db.stream_game_features(batch_size=100))
+    
+    assert len(batches) == 1
+    game = batches[0][test_data.STEAM_APPID]
+    assert game['game_name'] == 'Test Game'
+    assert game['price'] == {}
+    assert game['metacritic'] == {'score': 88, 'url': 'url'}
+    assert 'FROM game_features' in db.cur.execute.call_args[0][0]
+
+def test_refresh_game_features(db: SteamDatabase):
+    result = db.refresh_game_features([test_data.STEAM_APPID])
+    assert result == True
+    
+    upsert_query, params = db.cur.execute.call_args_list[0][0]
+    assert normalize_sql(upsert_query).startswith("INSERT INTO game_features")
+    assert 'WHERE g.appid = ANY(%s)' in upsert_query
+    assert 'ON CONFLICT (appid)' in upsert_query
+    # only the appids passed are rebuilt
+    assert params == ([test_data.STEAM_APPID],)
+    db.conn.commit.assert_called_once()
+
+def test_refresh_game_features_database_error(db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("Database error")
+    assert db.refresh_game_features([test_data.STEAM_APPID]) == False
+    db.conn.rollback.assert_called_once()
+
+def test_mark_games_refreshed(db: SteamDatabase):
+    assert db.mark_games_refreshed([test_data.STEAM_APPID], ['price']) == True
+    query, params = db.cur.execute.call_args[0]
+    assert normalize_sql(query).startswith("INSERT INTO game_refresh_status")
+    assert params == ([int(test_data.STEAM_APPID)], ['price'])
+    db.conn.commit.assert_called_once()
+
+def test_mark_games_refreshed_nothing_to_mark(db: SteamDatabase):
+    assert db.mark_games_refreshed([], ['price']) == False
+    db.cur.execute.assert_not_called()
+
+def test_get_stale_games(db: SteamDatabase):
+    db.cur.fetchall.return_value = [(10, ['price', 'static']), (20, ['price'])]
+    stale_games = db.get_stale_games({'price': 86400, 'static': 1814400}, 200)
+    assert stale_games == [
+        {"appid": 10, "stale_classes": ['price', 'static']},
+        {"appid": 20, "stale_classes": ['price']}
+    ]
+    
+    query, params = db.cur.execute.call_args[0]
+    assert 'LIMIT %(limit)s' in query
+    assert params == {"classes": ['price', 'static'], "ttls": [86400.0, 1814400.0], "limit": 200}
+
+def test_get_stale_games_database_error(db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("Database error")
+    assert db.get_stale_games({'price': 86400}, 200) == []
+    db.conn.rollback.assert_called_once()
 
 @pytest.mark.parametrize('items, actual_result', [
     ([839770, 878290, 881100], True),
@@ -388,38 +906,34 @@ def test_delete_entries(items, actual_result, db: SteamDatabase):
     assert result == actual_result
     
     if actual_result:
-        appids = ', '.join(str(item) for item in items)
         query = f"""
             DELETE FROM wishlist
-            WHERE steamid = '76561198041511379' AND appid IN ({appids})
+            WHERE steamid = $1 AND appid = ANY($2)
         """
-        actual_query = db.cur.execute.call_args[0][0]
-        assert normalize_sql(actual_query) == normalize_sql(query)
+        assert_prepared(db.cur, query, (test_data.STEAM_USER_ID, items))
         
         
-def test_set_games_update_status(db: SteamDatabase):
-    # Mock _check_table_item to return False (user doesn't exist)
-    with patch.object(db, '_check_table_item', return_value=True):
-        # Mock cursor.fetchone to return True (update needed)
-        db.cur.fetchone.return_value = True
+@pytest.mark.parametrize('rowcount, expected', [
+    (1, True),
+    # user has no schedule row
+    (0, False)
+])
+def test_set_games_update_status(db: SteamDatabase, rowcount, expected):
+    with patch.object(db, '_check_table_item') as mock_check:
+        db.cur.rowcount = rowcount
         result = db.set_games_update_status(test_data.STEAM_USER_ID)
         
-        # Verify the result is True (update needed)
-        assert result == True
-        
-        # Verify _check_table_item was called with the correct parameters
-        db._check_table_item.assert_called_once_with('steamid', 'schedule_data_retrieval', test_data.STEAM_USER_ID)
+        assert result == expected
+        # the update reports whether the row exists, no separate existence check
+        mock_check.assert_not_called()
         
         # Verify execute was called with the correct query
         expected_query = f"""
                 UPDATE schedule_data_retrieval
                 SET games_updated_at = NOW()
-                WHERE steamid = '{test_data.STEAM_USER_ID}'
+                WHERE steamid = $1
             """
-            
-        # query being called within the method
-        actual_query = db.cur.execute.call_args[0][0]
-        assert normalize_sql(actual_query) == normalize_sql(expected_query)
+        assert_prepared(db.cur, expected_query, (test_data.STEAM_USER_ID,))
 
 @patch.object(SteamDatabase, '_check_table_item', return_value=True)        
 def test_add_paid_price(mock_check_user, db: SteamDatabase):
@@ -483,6 +997,67 @@ def test_add_paid_price_database_error(mock_logger, mock_table, db: SteamDatabas
     log_message = mock_logger.call_args[0][0]
     assert "Database Insert Adding user_paid_price to user_library" in log_message
         
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_add_paid_price_bulk(mock_check_user, db: SteamDatabase):
+    db.cur.rowcount = 2
+    db.cur.fetchone.return_value = (2,)
+    counts = db.add_paid_price_bulk(test_data.STEAM_USER_ID, test_data.CORRECT_USER_PRICES)
+    assert counts == {"matched": 2, "unmatched": 1, "updated": 2}
+    
+    # all purchases are copied into staging at once
+    copy_query, copy_file = db.cur.copy_expert.call_args[0]
+    assert "COPY staging_purchases" in copy_query
+    assert len(copy_file.getvalue().splitlines()) == len(test_data.CORRECT_USER_PRICES)
+    
+    # then applied in a single update limited to the user
+    update_calls = [call for call in db.cur.execute.call_args_list if 'UPDATE user_library' in call[0][0]]
+    assert len(update_calls) == 1
+    assert update_calls[0][0][1] == (test_data.STEAM_USER_ID,)
+    assert 'ul.steamid = %s' in update_calls[0][0][0]
+    db.conn.commit.assert_called_once()
+    # the name index is made by create_game_name_index, not inside the purchase transaction
+    assert not [call for call in db.cur.execute.call_args_list if 'CREATE INDEX' in call[0][0]]
+
+def test_create_game_name_index(db: SteamDatabase):
+    assert db.create_game_name_index()
+    assert "CREATE INDEX IF NOT EXISTS games_normalized_name_idx ON games" in db.cur.execute.call_args[0][0]
+    db.conn.commit.assert_called_once()
+
+def test_create_game_name_index_database_error(db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("permission denied")
+    assert not db.create_game_name_index()
+    db.conn.rollback.assert_called_once()
+
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_add_paid_price_bulk_resolved_appids(mock_check_user, db: SteamDatabase):
+    db.cur.fetchone.return_value = (2,)
+    purchases = [{"game_name": "Fort Solis", "price": 1999, "appid": 1144200}, {"game_name": "Unknown Game", "price": 499}]
+    db.add_paid_price_bulk(test_data.STEAM_USER_ID, purchases)
+    
+    # the matcher's appid is staged, unresolved purchases are staged without one
+    copy_query, copy_file = db.cur.copy_expert.call_args[0]
+    assert "(game_name, price, appid, staging_row)" in copy_query
+    assert copy_file.getvalue().splitlines() == ['"Fort Solis",1999,1144200,0', '"Unknown Game",499,,1']
+    # resolved purchases are joined by appid, only the rest by name
+    update_query = normalize_sql([call[0][0] for call in db.cur.execute.call_args_list if 'UPDATE user_library' in call[0][0]][0])
+    assert "FROM staging_purchases sp WHERE sp.appid IS NOT NULL" in update_query
+    assert "WHERE sp.appid IS NULL" in update_query
+
+@patch.object(SteamDatabase, '_check_table_item', return_value=True)
+def test_add_paid_price_bulk_database_error(mock_check_user, db: SteamDatabase):
+    db.cur.execute.side_effect = pg2.Error("Test database error")
+    counts = db.add_paid_price_bulk(test_data.STEAM_USER_ID, test_data.CORRECT_USER_PRICES)
+    assert counts == {"matched": 0, "unmatched": 0, "updated": 0}
+    db.conn.rollback.assert_called_once()
+    db.conn.commit.assert_not_called()
+        
 def normalize_sql(query):
     # Remove extra whitespace, newlines, and indentation
-    return ' '.join(query.split())
\ No newline at end of file
+    return ' '.join(query.split())
+
+def assert_prepared(cur, query, params):
+    # query is prepared once then executed with params bound
+    prepare, execute = [call.args for call in cur.execute.call_args_list[-2:]]
+    name = prepare[0].split()[1]
+    assert normalize_sql(prepare[0]) == normalize_sql(f"PREPARE {name} AS {query}")
+    assert execute == (f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
\ No newline at end of file
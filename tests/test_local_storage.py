@@ -74,6 +74,32 @@ def test_remove_items():
     
     assert update_list == [2,3,5,6,7,9,10]
 
+def test_append_to_journal(tmp_path):
+    journal_path = str(tmp_path / "temp_data.journal")
+    local_storage.append_to_journal(journal_path, [1, 2, 3])
+    local_storage.append_to_journal(journal_path, [4])
+    
+    assert local_storage.load_journal(journal_path) == [1, 2, 3, 4]
+
+def test_load_journal_missing_file(tmp_path):
+    assert local_storage.load_journal(str(tmp_path / "missing.journal")) == []
+
+def test_load_journal_torn_line(tmp_path):
+    journal_path = tmp_path / "temp_data.journal"
+    # last line was cut short by a crash while writing
+    journal_path.write_text("1\n2\n[3")
+    
+    assert local_storage.load_journal(str(journal_path)) == [1, 2]
+
+def test_compact_journal(tmp_path):
+    journal_path = str(tmp_path / "temp_data.journal")
+    file_path = str(tmp_path / "temp_data.json")
+    local_storage.append_to_journal(journal_path, [1, 2])
+    
+    local_storage.compact_journal(journal_path, file_path, [3, 4])
+    assert local_storage.load_from_json(file_path) == {"data": [3, 4]}
+    assert local_storage.load_journal(journal_path) == []
+
 @pytest.fixture
 def create_html_steam_file():
     with open(FILE_PATH_HTML, 'w', encoding='utf-8') as file:
@@ -141,6 +167,179 @@ def test_parse_library_purchase_history_error(mock_join, mock_listdir, mock_isdi
     actual_values = local_storage.parse_library_purchase_history(dir_path)
     assert result == actual_values
     
+@patch("os.path.isdir", return_value=True)
+@patch("os.listdir", return_value=["file2.html", "file1.html", "file3.html"])
+def test_parse_library_purchase_history_failure_report(mock_listdir, mock_isdir):
+    dir_path = "../data/purchase_history/steam"
+    def parse(file_path):
+        if file_path.endswith("file2.html"):
+            raise IndexError("list index out of range")
+        return [{"game_name": file_path, "price": 100}]
+    
+    report = {}
+    with patch.object(local_storage, "parse_payment_history_steam", side_effect=parse), \
+        patch("src.tools.local_storage.logger.error") as mock_log:
+        actual_values = local_storage.parse_library_purchase_history(dir_path, report=report)
+    
+    # files are merged in name order and a failed file doesn't stop the rest
+    assert [item["game_name"] for item in actual_values] == [os.path.join(dir_path, "file1.html"), os.path.join(dir_path, "file3.html")]
+    assert report["files"] == 3
+    assert report["failed"] == {os.path.join(dir_path, "file2.html"): "IndexError: list index out of range"}
+    assert report["files_per_sec"] > 0
+    mock_log.assert_called_once()
+
+def test_parse_library_purchase_history_parallel(tmp_path):
+    dir_path = tmp_path / "steam"
+    dir_path.mkdir()
+    for i in range(4):
+        (dir_path / f"order{i}.html").write_text(HTML_STEAM_DATA, encoding='utf-8')
+    # more names than prices can't be parsed
+    (dir_path / "order2.html").write_text('<div class="purchase_line_items"><span class="purchase_detail_field">INSIDE</span></div>', encoding='utf-8')
+    
+    report = {}
+    actual_values = local_storage.parse_library_purchase_history(str(dir_path), workers=2, report=report)
+    assert actual_values == TEST_HTML_STEAM_DATA * 3
+    assert list(report["failed"]) == [str(dir_path / "order2.html")]
+    assert actual_values == local_storage.parse_library_purchase_history(str(dir_path))
+
+def test_parse_library_purchase_history_incremental(tmp_path):
+    dir_path = tmp_path / "steam"
+    dir_path.mkdir()
+    (dir_path / "order0.html").write_text(HTML_STEAM_DATA, encoding='utf-8')
+    manifest = {}
+    
+    report = {}
+    actual_values = local_storage.parse_library_purchase_history_incremental(str(dir_path), manifest, report=report)
+    assert actual_values == TEST_HTML_STEAM_DATA
+    assert report["files"] == 1 and report["unchanged"] == 0
+    
+    # a copy of an order page and an unchanged page aren't parsed again or counted twice
+    (dir_path / "order1.html").write_text(HTML_STEAM_DATA, encoding='utf-8')
+    with patch.object(local_storage, "parse_payment_history_steam") as mock_parser:
+        actual_values = local_storage.parse_library_purchase_history_incremental(str(dir_path), manifest, report=report)
+    mock_parser.assert_not_called()
+    assert actual_values == TEST_HTML_STEAM_DATA
+    assert report["files"] == 0 and report["unchanged"] == 2
+    assert len(manifest["files"]) == 2 and len(manifest["orders"]) == 1
+    
+    # changed content is parsed again and replaces the old orders
+    (dir_path / "order0.html").write_text(HTML_STEAM_DATA.replace("$1.99", "$0.99"), encoding='utf-8')
+    os.remove(dir_path / "order1.html")
+    actual_values = local_storage.parse_library_purchase_history_incremental(str(dir_path), manifest, report=report)
+    assert actual_values == [{"game_name": "INSIDE", "price": 99}] + TEST_HTML_STEAM_DATA[1:]
+    assert report["files"] == 1
+    assert list(manifest["files"]) == [str(dir_path / "order0.html")]
+    assert len(manifest["orders"]) == 1
+
+KINGUIN_ORDERS = {"orders": [
+    {"order_id": "A1", "date": "17/03/2025", "payment_status": "COMPLETED", "products": [
+        {"product_name": "Fort Solis PC Steam", "value": "0.80"},
+        {"product_name": "Superliminal Steam", "value": "0.29"}
+    ]},
+    {"order_id": "B2", "date": "31-10-2022", "payment_status": "CANCELED", "products": [
+        {"product_name": "Visage Steam", "value": "14.97"}
+    ]},
+    {"order_id": "C3", "date": "unknown", "payment_status": "COMPLETED", "products": [
+        # product names are kept whole, platform words are removed when they're matched to games
+        {"product_name": "BEAT SABER", "value": "2.82"},
+        {"product_name": "No Price"}
+    ]}
+]}
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_iter_kinguin_orders(tmp_path, chunk_size):
+    file_path = tmp_path / "kinguin.json"
+    file_path.write_text(json.dumps(KINGUIN_ORDERS, indent=2), encoding='utf-8')
+    
+    actual_values = list(local_storage.iter_kinguin_orders(str(file_path), chunk_size=chunk_size))
+    assert actual_values == [
+        {"game_name": "Fort Solis PC Steam", "price": 80, "date": "2025-03-17", "order_id": "A1"},
+        {"game_name": "Superliminal Steam", "price": 29, "date": "2025-03-17", "order_id": "A1"},
+        {"game_name": "BEAT SABER", "price": 282, "date": None, "order_id": "C3"}
+    ]
+
+def test_iter_json_array_unclosed(tmp_path):
+    file_path = tmp_path / "kinguin.json"
+    file_path.write_text('{"orders": [{"order_id": "A1"}, {"order_', encoding='utf-8')
+    
+    with open(file_path, 'r') as file:
+        items = local_storage.iter_json_array(file, "orders", chunk_size=8)
+        assert next(items) == {"order_id": "A1"}
+        with pytest.raises(ValueError):
+            next(items)
+
+def steam_history_page(rows, continued=()):
+    """ 
+        Positioned text like the purchase history PDF, rows are (date, type, total, items).
+        Cells are centered on their row like the page does, y goes up the page.
+    """
+    fragments = [(49, 1000, 12, "Date"), (118, 1000, 12, "Items"), (606, 1000, 12, "Type"), (771, 1000, 12, "Total"),
+                 (871, 1007, 12, "Wallet"), (836, 993, 12, "Change"), (893, 993, 12, "Balance")]
+    y = 970
+    for item in continued:
+        fragments.append((118, y, 12, item))
+        y -= 14
+    y -= 30
+    for date, kind, total, items in rows:
+        middle = y - (len(items) - 1) * 7
+        fragments += [(43, middle, 12, date), (606, middle + 6, 12, kind), (606, middle - 6, 12, "Wallet"), (763, middle, 12, total)]
+        for item in items:
+            fragments.append((118, y, 12, item))
+            y -= 14
+            if kind == "Gift Purchase":
+                fragments.append((139, y, 12, "Gift sent to "))
+                y -= 12
+        y -= 30
+    fragments.append((32, 40, 10, "https://store.steampowered.com/account/history/"))
+    return fragments
+
+def test_parse_steam_history_page():
+    continued, transactions = local_storage.parse_steam_history_page(steam_history_page([
+        ("Apr 16, 2024", "Purchase", "$8.38", ["INSIDE", "Project Warlock", "The Inheritance of Crimson Manor"]),
+        ("Mar 18, 2024", "Gift Purchase", "$14.99", ["DAVE THE DIVER"]),
+        ("Mar 8, 2024", "Purchase", "$11.69", ["Backpack Battles &amp; Friends"])
+    ], continued=["Grim Dawn"]))
+    
+    assert continued == ["Grim Dawn"]
+    assert transactions == [
+        {"date": "2024-04-16", "type": "Purchase", "total": 838, "items": ["INSIDE", "Project Warlock", "The Inheritance of Crimson Manor"]},
+        {"date": "2024-03-18", "type": "Gift Purchase", "total": 1499, "items": ["DAVE THE DIVER"]},
+        {"date": "2024-03-08", "type": "Purchase", "total": 1169, "items": ["Backpack Battles & Friends"]}
+    ]
+
+def test_parse_steam_history_page_without_table():
+    assert local_storage.parse_steam_history_page([(32, 40, 10, "3/31/25, 3:08 PM")]) == ([], [])
+
+def test_merge_steam_history_pages():
+    pages = [
+        local_storage.parse_steam_history_page(steam_history_page([
+            ("Dec 23, 2024", "Purchase", "$10.00", ["Purchased $10.00 Wallet Credit"]),
+            ("Dec 28, 2024", "Refund", "$2.99", ["Unboxing the Cryptic Killer"]),
+            ("Mar 18, 2024", "Purchase", "$10.00", ["Fingered", "Not Tonight"])
+        ])),
+        local_storage.parse_steam_history_page(steam_history_page([
+            ("Mar 8, 2024", "Purchase", "$11.69", ["Backpack Battles"])
+        ], continued=["Grim Dawn"]))
+    ]
+    
+    # the row split over both pages shares its total with the game on the second page
+    assert list(local_storage._merge_steam_history_pages(iter(pages))) == [
+        {"game_name": "Fingered", "price": 334, "date": "2024-03-18"},
+        {"game_name": "Not Tonight", "price": 333, "date": "2024-03-18"},
+        {"game_name": "Grim Dawn", "price": 333, "date": "2024-03-18"},
+        {"game_name": "Backpack Battles", "price": 1169, "date": "2024-03-08"}
+    ]
+
+def test_iter_steam_pdf_purchases_without_pypdf():
+    with patch.object(local_storage, "PdfReader", None):
+        with pytest.raises(ImportError):
+            next(local_storage.iter_steam_pdf_purchases("../files/steam_game_history.pdf"))
+
+def test_iter_steam_pdf_purchases():
+    pytest.importorskip("pypdf")
+    purchases = list(local_storage.iter_steam_pdf_purchases("../files/steam_game_history.pdf", workers=2))
+    assert {"game_name": "Balatro", "price": 1349, "date": "2024-02-20"} in purchases
+    assert purchases == list(local_storage.iter_steam_pdf_purchases("../files/steam_game_history.pdf"))
+
 def test_parse_payment_history_steam(create_html_steam_file):
     actual_values = local_storage.parse_payment_history_steam(FILE_PATH_HTML)
     assert TEST_HTML_STEAM_DATA == actual_values  
@@ -199,4 +398,16 @@ HTML_KINGUIN_DATA = """
 <tr class="sc-jwQYvw hlGyez"><td class="sc-gFSQbh emltay">Green Keys</td><td class="sc-gFSQbh qqhMa">1 </td><td class="sc-gFSQbh isTTpv">Dead Space 2 Origin CD Key</td><td class="sc-gFSQbh isTTpv"><div><span class="sc-juEPzu hGHSJl"><span>Inventory</span></span></div></td><td class="sc-gFSQbh isTTpv"><div class="sc-gDGHff bPODr"><span>Archived</span></div></td><td class="sc-gFSQbh fRcDTw"><span itemprop="priceCurrency" content="USD"></span><span class="" content="5.14">$5.14</span></td></tr>
 
 <tr class="sc-jwQYvw hlGyez"><td class="sc-gFSQbh emltay">Green Keys</td><td class="sc-gFSQbh qqhMa">1 </td><td class="sc-gFSQbh isTTpv">Dead Space 3 EA Origin CD Key</td><td class="sc-gFSQbh isTTpv"><div><span class="sc-juEPzu hGHSJl"><span>Inventory</span></span></div></td><td class="sc-gFSQbh isTTpv"><div class="sc-gDGHff bPODr"><span>Archived</span></div></td><td class="sc-gFSQbh fRcDTw"><span itemprop="priceCurrency" content="USD"></span><span class="" content="7.49">$7.49</span></td>
-"""
\ No newline at end of file
+"""
+@pytest.mark.parametrize('name, game_name', [
+    ("Dead Space Origin CD Key", "Dead Space "),
+    ("Fort Solis PC Steam", "Fort Solis "),
+    # platform words only count as whole words
+    ("BEAT SABER Steam", "BEAT SABER "),
+    ("PC Building Simulator", "PC Building Simulator"),
+    ("Apex Legends Origin", "Apex Legends "),
+    # no platform within name
+    ("Toodee and Topdee", "Toodee and Topdee")
+])
+def test_parse_game_name(name, game_name):
+    assert local_storage.parse_game_name(name) == game_name
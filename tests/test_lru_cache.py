@@ -0,0 +1,56 @@
+import pytest
+from unittest.mock import patch
+
+from src.tools.lru_cache import LRUCache
+
+def test_lru_cache_init_error():
+    with pytest.raises(ValueError):
+        LRUCache(0)
+
+def test_lru_cache_hit_and_miss():
+    cache = LRUCache(2)
+    assert cache.get("a") == (False, None)
+    cache.set("a", [1])
+    assert cache.get("a") == (True, [1])
+    assert cache.stats() == {"hits": 1, "misses": 1, "evictions": 0, "size": 1}
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # reading a makes b the least recently used
+    cache.get("a")
+    cache.set("c", 3)
+    
+    assert cache.get("b") == (False, None)
+    assert cache.get("a") == (True, 1)
+    assert cache.get("c") == (True, 3)
+    assert cache.evictions == 1
+
+@patch('time.monotonic')
+def test_lru_cache_ttl(mock_time):
+    cache = LRUCache(2, ttl=10)
+    mock_time.return_value = 100.0
+    cache.set("a", 1)
+    
+    mock_time.return_value = 110.0
+    assert cache.get("a") == (True, 1)
+    mock_time.return_value = 110.1
+    assert cache.get("a") == (False, None)
+    assert len(cache) == 0
+
+def test_lru_cache_invalidate():
+    cache = LRUCache(4)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    generation = cache.generation
+    
+    cache.invalidate(["a", "missing"])
+    assert cache.get("a") == (False, None)
+    assert cache.get("b") == (True, 2)
+    
+    # a value read before the invalidation isn't stored after it
+    cache.set("a", 1, generation)
+    assert cache.get("a") == (False, None)
+    cache.set("a", 1, cache.generation)
+    assert cache.get("a") == (True, 1)
@@ -0,0 +1,90 @@
+import pytest
+from unittest.mock import patch, MagicMock
+
+from src.multi_user_ingest import MultiUserIngest
+from src.tools.rate_limiter import TokenBucket
+
+def make_store(steam, db):
+    """
+        StoreToDB stand in whose syncs find the games set on its steam client.
+    """
+    store = MagicMock()
+    store.steam = steam
+    store.user_id = steam.user_id
+    store.load_user.return_value = steam.user_id != "missing"
+    store.new_appids = list(steam.new_games)
+    store.wishlist = []
+    store.library = [{"appid": appid} for appid in steam.new_games]
+    def store_game_data_to_db(pipelined):
+        # every appid handed over is saved unless the steam client fails it
+        store.downloaded = list(store.new_appids)
+        store.new_appids = [appid for appid in store.new_appids if appid in steam.failed_games]
+    store.store_game_data_to_db.side_effect = store_game_data_to_db
+    return store
+
+@pytest.fixture
+def steam_clients():
+    new_games = {"user1": [10, 20, 30], "user2": [20, 30, 40], "user3": [], "missing": [50]}
+    failed_games = set()
+    def make_steam(api_key, steamid, rate_limiter=None, cache=None):
+        steam = MagicMock()
+        steam.user_id = steamid
+        steam.rate_limiter = rate_limiter
+        steam.cache = cache
+        steam.new_games = new_games[steamid]
+        steam.failed_games = failed_games
+        return steam
+
+    with patch('src.multi_user_ingest.Steam', side_effect=make_steam), \
+        patch('src.multi_user_ingest.StoreToDB', MagicMock(side_effect=make_store, REQUEST_LIMIT=200, REQUEST_PERIOD=300)):
+        yield failed_games
+
+def test_multi_user_ingest_shares_budget(steam_clients):
+    bucket = TokenBucket(200, 300)
+    ingest = MultiUserIngest("key", ["user1", "user2", "user1"], MagicMock(), rate_limiter=bucket, cache=MagicMock())
+
+    # repeated steamids are ingested once and every client draws from the same bucket
+    assert list(ingest.users) == ["user1", "user2"]
+    assert all(store.steam.rate_limiter is bucket for store in ingest.users.values())
+    assert ingest.users["user1"].steam.cache is ingest.users["user2"].steam.cache
+
+def test_multi_user_ingest_run(steam_clients):
+    db = MagicMock()
+    ingest = MultiUserIngest("key", ["missing", "user1", "user2", "user3"], db, cache=MagicMock())
+    stores = ingest.users
+
+    results = ingest.run()
+
+    # each game is downloaded once by a single ingest
+    stores["user1"].store_game_data_to_db.assert_called_once_with(False)
+    assert stores["user1"].downloaded == [10, 20, 30, 40]
+    stores["user2"].store_game_data_to_db.assert_not_called()
+    stores["user1"].refresh_stale_games.assert_called_once()
+    stores["missing"].load_wishlist.assert_not_called()
+
+    # then every other user is marked as updated
+    assert [call.args[0] for call in db.set_games_update_status.call_args_list] == ["user2", "user3"]
+    assert stores["user2"].new_appids == []
+    assert results == {
+        "user1": {"wishlist": 0, "library": 3, "new_games": 3, "shared_games": 2},
+        "user2": {"wishlist": 0, "library": 3, "new_games": 3, "shared_games": 2},
+        "user3": {"wishlist": 0, "library": 0, "new_games": 0, "shared_games": 0}
+    }
+
+def test_multi_user_ingest_failed_games_left_pending(steam_clients):
+    # the batch holding 40 fails to save
+    steam_clients.add(40)
+    db = MagicMock()
+    ingest = MultiUserIngest("key", ["user1", "user2", "user3"], db, cache=MagicMock())
+    stores = ingest.users
+
+    ingest.run()
+
+    # only users that needed 40 stay pending, with just the games still to save
+    assert [call.args[0] for call in db.set_games_update_status.call_args_list] == ["user3"]
+    assert stores["user2"].new_appids == [40]
+
+def test_multi_user_ingest_no_accounts(steam_clients):
+    ingest = MultiUserIngest("key", ["missing"], MagicMock(), cache=MagicMock())
+    assert ingest.run() == {}
+    ingest.users["missing"].store_game_data_to_db.assert_not_called()
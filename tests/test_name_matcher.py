@@ -0,0 +1,54 @@
+import pytest
+
+from src.tools.name_matcher import NameMatcher, normalize_name, trigrams
+
+GAMES = [
+    {"appid": 1, "game_name": "Fort Solis™"},
+    {"appid": 2, "game_name": "Dead Space 3"},
+    {"appid": 3, "game_name": "Dead Space 2"},
+    {"appid": 4, "game_name": "Superliminal"},
+    {"appid": 5, "game_name": "The Witcher® 3: Wild Hunt"},
+    {"appid": 6, "game_name": None}
+]
+
+@pytest.fixture
+def matcher():
+    return NameMatcher(GAMES)
+
+@pytest.mark.parametrize("name, expected", [
+    ("Fort Solis™", "fort solis"),
+    ("Fort Solis PC Steam", "fort solis"),
+    ("Dead Space 3 EA Origin CD Key", "dead space 3"),
+    ("The Witcher® 3: Wild Hunt – Game of the Year Edition", "the witcher 3 wild hunt"),
+    ("Steam", "")
+])
+def test_normalize_name(name, expected):
+    assert normalize_name(name) == expected
+
+def test_trigrams():
+    assert trigrams("ab") == {"  a", " ab", "ab "}
+
+def test_matcher_skips_games_without_names(matcher: NameMatcher):
+    assert len(matcher) == 5
+
+@pytest.mark.parametrize("name, appid", [
+    ("Fort Solis PC Steam", 1),
+    ("Dead Space 3 EA Origin CD Key", 2),
+    ("Superlimnal", 4),
+    ("Witcher 3 Wild Hunt GOTY", 5)
+])
+def test_best_match(name, appid, matcher: NameMatcher):
+    match = matcher.best_match(name)
+    assert match[0] == appid
+
+def test_match_exact_scores_one(matcher: NameMatcher):
+    assert matcher.match("Superliminal Steam") == [(4, "Superliminal", 1.0)]
+
+def test_match_top_k(matcher: NameMatcher):
+    matches = matcher.match("Dead Space", top_k=2)
+    assert {appid for appid, _, _ in matches} == {2, 3}
+    # best first
+    assert matches[0][2] >= matches[1][2]
+
+def test_best_match_no_match(matcher: NameMatcher):
+    assert matcher.best_match("Toodee and Topdee") is None
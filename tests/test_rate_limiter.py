@@ -0,0 +1,54 @@
+import pytest
+from unittest.mock import patch
+
+from src.tools.rate_limiter import TokenBucket
+
+def test_token_bucket_init():
+    bucket = TokenBucket(200, 300)
+    assert bucket.rate == pytest.approx(200/300)
+    assert bucket.capacity == 1
+
+@pytest.mark.parametrize("requests, period", [
+    (0, 300),
+    (200, 0)
+])
+def test_token_bucket_init_error(requests, period):
+    with pytest.raises(ValueError):
+        TokenBucket(requests, period)
+
+@patch('time.sleep')
+@patch('time.monotonic', return_value=100.0)
+def test_token_bucket_acquire(mock_time, mock_sleep):
+    bucket = TokenBucket(2, 1)
+    # first token is already in the bucket
+    assert bucket.acquire() == 0.0
+    mock_sleep.assert_not_called()
+    
+    # the next two have to be waited for, each reserving its own slot
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert bucket.acquire() == pytest.approx(1.0)
+    assert mock_sleep.call_count == 2
+
+@patch('time.sleep')
+@patch('time.monotonic')
+def test_token_bucket_refill(mock_time, mock_sleep):
+    mock_time.return_value = 100.0
+    bucket = TokenBucket(1, 1)
+    assert bucket.acquire() == 0.0
+    
+    # a token is earned after a second
+    mock_time.return_value = 101.0
+    assert bucket.acquire() == 0.0
+    mock_sleep.assert_not_called()
+
+@patch('time.monotonic')
+def test_token_bucket_throttle(mock_time):
+    mock_time.return_value = 100.0
+    bucket = TokenBucket(2, 1)
+    bucket.throttle(0.5, 10)
+    assert bucket.rate == pytest.approx(1.0)
+    
+    # rate goes back to normal once the throttle period is over
+    mock_time.return_value = 111.0
+    bucket.acquire()
+    assert bucket.rate == pytest.approx(2.0)
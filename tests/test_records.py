@@ -0,0 +1,38 @@
+import pytest
+import sys
+
+from src.tools.records import Record, record_type
+
+def test_record_type_shared_per_shape():
+    library_record = record_type(('steamid', 'appid', 'playtime_minutes'))
+    assert record_type(('steamid', 'appid', 'playtime_minutes')) is library_record
+    assert record_type(('steamid', 'appid', 'priority')) is not library_record
+    # values are kept in slots, no dict per row
+    assert not hasattr(library_record.from_row(("1", 10, 0)), '__dict__')
+
+def test_record_reads_like_dict():
+    record = record_type(('appid', 'priority')).from_row((1144200, 3))
+    
+    assert record['appid'] == 1144200
+    assert record.priority == 3
+    assert record.get('missing', -1) == -1
+    assert dict(record) == {'appid': 1144200, 'priority': 3}
+    assert record == {'appid': 1144200, 'priority': 3}
+    assert isinstance(record, Record)
+    with pytest.raises(KeyError):
+        record['missing']
+
+def test_record_read_only():
+    record = record_type(('appid',)).from_row((1144200,))
+    with pytest.raises(AttributeError):
+        record.appid = 1
+
+@pytest.mark.parametrize('fields', [('appid', 'game name'), ('appid', 'items')])
+def test_record_type_invalid_field(fields):
+    with pytest.raises(ValueError):
+        record_type(fields)
+
+def test_record_smaller_than_dict():
+    fields = ('steamid', 'appid', 'playtime_minutes', 'user_paid_price')
+    row = ("76561198041511379", 1144200, 120, None)
+    assert sys.getsizeof(record_type(fields).from_row(row)) < sys.getsizeof(dict(zip(fields, row))) / 2
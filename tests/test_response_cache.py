@@ -0,0 +1,40 @@
+import pytest
+import copy
+from unittest.mock import patch
+
+from src.tools.response_cache import ResponseCache, DAY
+import test_data
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(str(tmp_path))
+
+def test_load_missing_entry(cache: ResponseCache):
+    assert cache.load(test_data.STEAM_APPID, 'english') is None
+
+def test_save_and_load(cache: ResponseCache):
+    cache.save(test_data.STEAM_APPID, 'english', test_data.CORRECT_GAME_RESPONSE, etag='"abc"')
+    entry = cache.load(test_data.STEAM_APPID, 'english')
+    
+    assert entry["response"] == test_data.CORRECT_GAME_RESPONSE
+    assert entry["etag"] == '"abc"'
+    assert cache.stale_classes(entry) == []
+    # each locale is stored separately
+    assert cache.load(test_data.STEAM_APPID, 'german') is None
+
+def test_stale_classes(cache: ResponseCache):
+    entry = cache.save(test_data.STEAM_APPID, '', test_data.CORRECT_GAME_RESPONSE)
+    now = entry["fetched_at"]["price"]
+    
+    # prices expire before static data
+    with patch('time.time', return_value=now + 2 * DAY):
+        assert cache.stale_classes(entry) == ['price']
+    with patch('time.time', return_value=now + 30 * DAY):
+        assert cache.stale_classes(entry) == ['price', 'static']
+
+def test_refresh(cache: ResponseCache):
+    entry = cache.save(test_data.STEAM_APPID, '', test_data.CORRECT_GAME_RESPONSE)
+    entry["fetched_at"]["price"] = 0
+    cache.refresh(entry, ['price'])
+    
+    assert cache.stale_classes(cache.load(test_data.STEAM_APPID, '')) == []
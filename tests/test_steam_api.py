@@ -1,9 +1,11 @@
 import pytest
 from unittest.mock import patch, Mock
 import json
+import copy
 import requests
 
 from src.steam_api import Steam
+from src.tools.response_cache import ResponseCache
 import test_data
 
 @pytest.fixture
@@ -27,7 +29,7 @@ def test_init_calls_check_user_account(steam_api: Steam):
 ])
 def test_check_user_account(actual, expected, steam_api: Steam):
     """Test that check_user_account properly process"""
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         # Configure the mock to return a successful response
         mock_response = Mock()
         mock_response.json.return_value = actual
@@ -39,12 +41,13 @@ def test_check_user_account(actual, expected, steam_api: Steam):
         assert user_data == expected
         mock_get.assert_called_once_with(
             test_data.STEAM_USER_URL,
-            params={'key': test_data.STEAM_API_KEY, 'steamids': test_data.STEAM_USER_ID}
+            params={'key': test_data.STEAM_API_KEY, 'steamids': test_data.STEAM_USER_ID},
+            timeout=Steam.TIMEOUT
         )
 
 def test_check_user_account_request_exception(steam_api: Steam):
     """Test that check_user_account handles request exceptions."""
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         # Configure the mock to raise an exception
         mock_get.side_effect = requests.RequestException("API Error")
         
@@ -56,7 +59,8 @@ def test_check_user_account_request_exception(steam_api: Steam):
         
         mock_get.assert_called_once_with(
             test_data.STEAM_USER_URL,
-            params={'key': test_data.STEAM_API_KEY, 'steamids': test_data.STEAM_USER_ID}
+            params={'key': test_data.STEAM_API_KEY, 'steamids': test_data.STEAM_USER_ID},
+            timeout=Steam.TIMEOUT
         )
 
 @pytest.mark.parametrize("actual, expected", [
@@ -78,7 +82,7 @@ def test_process_user_data(actual, expected, steam_api: Steam):
 # ------  WISHLIST  ------
 # ------------------------
 def test_get_wishlist(steam_api: Steam):
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.json.return_value = test_data.CORRECT_WISHLIST_RESPONSE
         mock_response.raise_for_status.return_value = None
@@ -89,11 +93,12 @@ def test_get_wishlist(steam_api: Steam):
         
         mock_get.assert_called_once_with(
         test_data.STEAM_WISHLIST_URL,
-        params={'key': test_data.STEAM_API_KEY, 'steamid': test_data.STEAM_USER_ID}
+        params={'key': test_data.STEAM_API_KEY, 'steamid': test_data.STEAM_USER_ID},
+        timeout=Steam.TIMEOUT
     )
         
 def test_get_wishlist_request_exception(steam_api: Steam):
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_get.side_effect = requests.RequestException("API Error")
         
         with pytest.raises(requests.RequestException) as excinfo:
@@ -102,7 +107,8 @@ def test_get_wishlist_request_exception(steam_api: Steam):
         
         mock_get.assert_called_once_with(
         test_data.STEAM_WISHLIST_URL,
-        params={'key': test_data.STEAM_API_KEY, 'steamid': test_data.STEAM_USER_ID}
+        params={'key': test_data.STEAM_API_KEY, 'steamid': test_data.STEAM_USER_ID},
+        timeout=Steam.TIMEOUT
     )
 
 @pytest.mark.parametrize("actual, expected", [
@@ -121,7 +127,7 @@ def test_process_wishlist_data(actual, expected, steam_api: Steam):
 # ------  LIBRARY  -------
 # ------------------------    
 def test_get_library(steam_api: Steam):
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.json.return_value = test_data.CORRECT_LIBRARY_RESPONSE
         mock_response.raise_for_status.return_value = None
@@ -137,12 +143,13 @@ def test_get_library(steam_api: Steam):
                 'steamid': test_data.STEAM_USER_ID,
                 'format': 'json',
                 'include_played_free_games': True
-            }
+            },
+            timeout=Steam.TIMEOUT
         )
         
 def test_get_library_request_exception(steam_api: Steam):
     """Test that check_user_account handles request exceptions."""
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         # Configure the mock to raise an exception
         mock_get.side_effect = requests.RequestException("API Error")
         
@@ -159,7 +166,8 @@ def test_get_library_request_exception(steam_api: Steam):
                 'steamid': test_data.STEAM_USER_ID,
                 'format': 'json',
                 'include_played_free_games': True
-            }
+            },
+            timeout=Steam.TIMEOUT
         )
 
 @pytest.mark.parametrize("actual, expected", [
@@ -196,7 +204,7 @@ def test_process_single_game_data(response, processed, steam_api: Steam):
     assert processed_data == processed
 
 def test_get_single_game_data(steam_api: Steam):
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_response = Mock()
         mock_response.json.return_value = test_data.CORRECT_GAME_RESPONSE
         mock_response.raise_for_status.return_value = True
@@ -209,11 +217,12 @@ def test_get_single_game_data(steam_api: Steam):
             test_data.STEAM_GAME_URL,
             params={
                 'appids': test_data.STEAM_APPID
-            }
+            },
+            timeout=Steam.TIMEOUT
         )
         
 def testt_get_single_game_data_request_exception(steam_api: Steam):
-    with patch('requests.get') as mock_get:
+    with patch('requests.Session.get') as mock_get:
         mock_get.side_effect = requests.RequestException("API Error")
         
         with pytest.raises(requests.RequestException) as exinfo:
@@ -225,7 +234,8 @@ def testt_get_single_game_data_request_exception(steam_api: Steam):
             test_data.STEAM_GAME_URL,
             params={
                 'appids': test_data.STEAM_APPID
-            }
+            },
+            timeout=Steam.TIMEOUT
         )
         
 
@@ -235,4 +245,185 @@ def test_get_games_data(steam_api: Steam):
         processed_games = steam_api.get_games_data(appids)
         assert processed_games == [test_data.CORRECT_GAME_PROCESSED]
         
-        steam_api.get_single_game_data.assert_called_once_with(appids[0])
\ No newline at end of file
+        steam_api.get_single_game_data.assert_called_once_with(appids[0])
+def test_get_games_data_concurrent(steam_api: Steam):
+    appids = [1, 2, 3, 4, 5]
+    with patch.object(steam_api, 'get_single_game_data', side_effect=lambda appid: {"appid": appid}):
+        processed_games = steam_api.get_games_data(appids, max_workers=3)
+        # games come back in the same order as requested
+        assert processed_games == [{"appid": appid} for appid in appids]
+
+def test_get_games_data_reuses_executor(steam_api: Steam):
+    with patch.object(steam_api, 'get_single_game_data', side_effect=lambda appid: {"appid": appid}):
+        steam_api.get_games_data([1, 2], max_workers=3)
+        executor = steam_api._executor
+        steam_api.get_games_data([3, 4], max_workers=3)
+        steam_api.get_games_data([5, 6], max_workers=2)
+        # later batches use the same workers
+        assert steam_api._executor is executor
+        
+        # more workers than the pool has replaces it
+        steam_api.get_games_data([7, 8], max_workers=4)
+        assert steam_api._executor is not executor
+        assert steam_api._executor_workers == 4
+    
+    steam_api.close()
+    assert steam_api._executor is None
+
+def test_get_single_game_data_rate_limited(steam_api: Steam):
+    steam_api.rate_limiter = Mock()
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.json.return_value = test_data.CORRECT_GAME_RESPONSE
+        steam_api.get_single_game_data(test_data.STEAM_APPID)
+        
+        steam_api.rate_limiter.acquire.assert_called_once()
+
+def test_get_uses_pooled_session_per_host(steam_api: Steam):
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.json.return_value = test_data.CORRECT_GAME_RESPONSE
+        steam_api.get_single_game_data(test_data.STEAM_APPID)
+        steam_api.get_single_game_data(test_data.STEAM_APPID)
+        mock_get.return_value.json.return_value = test_data.CORRECT_WISHLIST_RESPONSE
+        steam_api.get_wishlist()
+        
+        # one session is kept for each host and reused between calls
+        assert set(steam_api._sessions) == {'store.steampowered.com', 'api.steampowered.com'}
+        stats = steam_api.connection_stats()
+        assert stats['store.steampowered.com']['requests'] == 2
+        assert stats['api.steampowered.com']['requests'] == 1
+        
+        steam_api.close()
+        assert steam_api._sessions == {}
+
+def test_get_single_game_data_cache_hit(steam_api: Steam, tmp_path):
+    steam_api.cache = ResponseCache(str(tmp_path))
+    steam_api.rate_limiter = Mock()
+    steam_api.cache.save(test_data.STEAM_APPID, '', test_data.CORRECT_GAME_RESPONSE)
+    
+    with patch('requests.Session.get') as mock_get:
+        process_game = steam_api.get_single_game_data(test_data.STEAM_APPID)
+        assert process_game == test_data.CORRECT_GAME_PROCESSED
+        
+        # cache hits skip both the server and the rate limiter
+        mock_get.assert_not_called()
+        steam_api.rate_limiter.acquire.assert_not_called()
+
+def test_get_single_game_data_cache_miss(steam_api: Steam, tmp_path):
+    steam_api.cache = ResponseCache(str(tmp_path))
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.json.return_value = test_data.CORRECT_GAME_RESPONSE
+        mock_get.return_value.headers = {'ETag': '"abc"'}
+        steam_api.get_single_game_data(test_data.STEAM_APPID)
+        
+        entry = steam_api.cache.load(test_data.STEAM_APPID, '')
+        assert entry["response"] == test_data.CORRECT_GAME_RESPONSE
+        assert entry["etag"] == '"abc"'
+
+def test_get_single_game_data_failure_not_cached(steam_api: Steam, tmp_path):
+    steam_api.cache = ResponseCache(str(tmp_path))
+    appid = str(test_data.STEAM_APPID)
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.json.return_value = {appid: {"success": False}}
+        mock_get.return_value.headers = {}
+        assert steam_api.get_single_game_data(test_data.STEAM_APPID) == {}
+        
+        # an unsuccessful response isn't cached, the next call asks the server again
+        assert steam_api.cache.load(test_data.STEAM_APPID, '') is None
+        mock_get.return_value.json.return_value = test_data.CORRECT_GAME_RESPONSE
+        assert steam_api.get_single_game_data(test_data.STEAM_APPID) == test_data.CORRECT_GAME_PROCESSED
+        assert mock_get.call_count == 2
+
+def test_get_single_game_data_stale_price(steam_api: Steam, tmp_path):
+    steam_api.cache = ResponseCache(str(tmp_path))
+    entry = steam_api.cache.save(test_data.STEAM_APPID, '', copy.deepcopy(test_data.CORRECT_GAME_RESPONSE))
+    entry["fetched_at"]["price"] = 0
+    steam_api.cache.refresh(entry, [])
+    
+    appid = str(test_data.STEAM_APPID)
+    new_price = {"currency": "USD", "initial": 100, "final_formatted": "$1.00", "discount_percent": 0}
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.json.return_value = {appid: {"success": True, "data": {"price_overview": new_price}}}
+        process_game = steam_api._get_game_response(test_data.STEAM_APPID)
+        
+        # only the price is downloaded again
+        assert mock_get.call_args[1]['params']['filters'] == 'price_overview'
+        assert process_game[appid]["data"]["price_overview"] == new_price
+        assert process_game[appid]["data"]["name"] == test_data.CORRECT_GAME_RESPONSE[appid]["data"]["name"]
+
+def test_get_single_game_data_not_modified(steam_api: Steam, tmp_path):
+    steam_api.cache = ResponseCache(str(tmp_path))
+    entry = steam_api.cache.save(test_data.STEAM_APPID, '', test_data.CORRECT_GAME_RESPONSE, etag='"abc"')
+    entry["fetched_at"] = {"price": 0, "static": 0}
+    steam_api.cache.refresh(entry, [])
+    
+    with patch('requests.Session.get') as mock_get:
+        mock_get.return_value.status_code = 304
+        process_game = steam_api._get_game_response(test_data.STEAM_APPID)
+        
+        assert mock_get.call_args[1]['headers'] == {'If-None-Match': '"abc"'}
+        assert process_game == test_data.CORRECT_GAME_RESPONSE
+        assert steam_api.cache.stale_classes(steam_api.cache.load(test_data.STEAM_APPID, '')) == []
+
+def _mock_response(status_code, headers=None):
+    response = Mock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    response.json.return_value = test_data.CORRECT_GAME_RESPONSE
+    return response
+
+@patch('time.sleep')
+def test_get_retries_throttled_request(mock_sleep, steam_api: Steam):
+    steam_api.rate_limiter = Mock()
+    with patch('requests.Session.get') as mock_get:
+        mock_get.side_effect = [_mock_response(429, {'Retry-After': '7'}), _mock_response(200)]
+        process_game = steam_api.get_single_game_data(test_data.STEAM_APPID)
+        assert process_game == test_data.CORRECT_GAME_PROCESSED
+        
+        # waits as long as the server asked and slows the shared rate limiter
+        mock_sleep.assert_called_once_with(7.0)
+        steam_api.rate_limiter.throttle.assert_called_once_with(Steam.THROTTLE_FACTOR, Steam.THROTTLE_PERIOD)
+        # every attempt takes a token
+        assert steam_api.rate_limiter.acquire.call_count == 2
+
+@patch('time.sleep')
+def test_get_caps_retry_after(mock_sleep, steam_api: Steam):
+    steam_api.rate_limiter = Mock()
+    with patch('requests.Session.get') as mock_get:
+        mock_get.side_effect = [_mock_response(503, {'Retry-After': '86400'}), _mock_response(200)]
+        assert steam_api.get_single_game_data(test_data.STEAM_APPID) == test_data.CORRECT_GAME_PROCESSED
+        
+        # a huge Retry-After doesn't park the request for a day
+        mock_sleep.assert_called_once_with(Steam.RETRY_AFTER_MAX)
+
+@patch('time.sleep')
+@pytest.mark.parametrize("first_attempt", [
+    _mock_response(503),
+    requests.ConnectionError("Connection reset")
+])
+def test_get_retries_transient_errors(mock_sleep, first_attempt, steam_api: Steam):
+    with patch('requests.Session.get') as mock_get:
+        mock_get.side_effect = [first_attempt, _mock_response(200)]
+        process_game = steam_api.get_single_game_data(test_data.STEAM_APPID)
+        assert process_game == test_data.CORRECT_GAME_PROCESSED
+        assert mock_get.call_count == 2
+        mock_sleep.assert_called_once()
+        # each attempt counts as a request
+        assert steam_api._request_counts['store.steampowered.com'] == 2
+
+@patch('time.sleep')
+def test_get_retries_exhausted(mock_sleep, steam_api: Steam):
+    steam_api.max_retries = 2
+    with patch('requests.Session.get') as mock_get:
+        mock_get.side_effect = requests.ConnectionError("Connection reset")
+        with pytest.raises(requests.RequestException):
+            steam_api.get_single_game_data(test_data.STEAM_APPID)
+        assert mock_get.call_count == 3
+
+@pytest.mark.parametrize("retry_after, expected", [
+    (None, None),
+    ('12', 12.0),
+    ('not a date', None),
+    ('Wed, 21 Oct 2015 07:28:00 GMT', 0.0)
+])
+def test_parse_retry_after(retry_after, expected, steam_api: Steam):
+    assert steam_api._parse_retry_after(retry_after) == expected
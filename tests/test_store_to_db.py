@@ -0,0 +1,164 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+
+from src.store_to_db import StoreToDB
+from src.tools.local_storage import load_journal, load_from_json, check_file, save_to_json, append_to_journal
+
+def make_games(appids):
+    return [{"appid": appid, "name": f"game {appid}"} for appid in appids]
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """
+        StoreToDB with a stub steam client and db, work list and journal kept in tmp_path.
+    """
+    monkeypatch.setattr(StoreToDB, 'TEMP_FILE', str(tmp_path / 'temp_data.json'))
+    monkeypatch.setattr(StoreToDB, 'JOURNAL_FILE', str(tmp_path / 'temp_data.journal'))
+    monkeypatch.setattr(StoreToDB, 'BATCH_SIZE', 2)
+    monkeypatch.setattr(StoreToDB, 'PIPELINE_QUEUE_SIZE', 1)
+    monkeypatch.setattr(StoreToDB, 'PIPELINE_POLL_TIME', 0.01)
+
+    steam = MagicMock()
+    steam.get_games_data.side_effect = lambda appids, max_workers: make_games(appids)
+    db = MagicMock()
+    db.add_games_batch.side_effect = lambda user_id, games: len(games)
+    store = StoreToDB(steam, db)
+    store.user_id = "76561198041511379"
+    store.new_appids = [1, 2, 3, 4, 5]
+    return store
+
+def run_pipelined(store):
+    """
+        Run the pipelined ingest in a thread so a stage that never finishes fails the test instead of hanging it.
+        Return: error raised by the ingest, None if it finished
+    """
+    errors = []
+    def ingest():
+        try:
+            store.store_game_data_to_db(pipelined=True)
+        except Exception as e:
+            errors.append(e)
+    worker = threading.Thread(target=ingest, daemon=True)
+    worker.start()
+    worker.join(timeout=10)
+    assert not worker.is_alive(), "pipeline hung"
+    # no stage thread is left running
+    assert not [thread for thread in threading.enumerate() if thread.name.startswith('ingest-')]
+    return errors[0] if errors else None
+
+def saved_appids(store):
+    return [game["appid"] for call in store.db.add_games_batch.call_args_list for game in call.args[1]]
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_store_game_data(store: StoreToDB, pipelined):
+    store.store_game_data_to_db(pipelined)
+
+    # every batch saved in order, then the work list is cleared
+    assert saved_appids(store) == [1, 2, 3, 4, 5]
+    assert not check_file(store.TEMP_FILE)
+    assert not check_file(store.JOURNAL_FILE)
+    assert store.new_appids == []
+    store.db.set_games_update_status.assert_called_once_with(store.user_id)
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_store_game_data_failed_batch_not_checkpointed(store: StoreToDB, pipelined):
+    # batch [3, 4] fails to save
+    store.db.add_games_batch.side_effect = lambda user_id, games: 0 if games[0]["appid"] == 3 else len(games)
+    store.store_game_data_to_db(pipelined)
+
+    # the failed batch is kept for the next ingest, the rest are done
+    assert load_journal(store.JOURNAL_FILE) == []
+    assert load_from_json(store.TEMP_FILE)["data"] == [3, 4]
+    assert store.new_appids == [3, 4]
+    store.db.set_games_update_status.assert_not_called()
+
+def test_store_game_data_empty_batch_checkpointed(store: StoreToDB):
+    # steam has nothing for 3 and 4, that batch is still done
+    store.steam.get_games_data.side_effect = lambda appids, max_workers: [] if 3 in appids else make_games(appids)
+    assert store._persist_games([]) == StoreToDB.PERSIST_EMPTY
+    store.store_game_data_to_db()
+
+    assert saved_appids(store) == [1, 2, 5]
+    assert not check_file(store.TEMP_FILE)
+    store.db.set_games_update_status.assert_called_once()
+
+@pytest.mark.parametrize('failing', ['fetch', 'transform', 'persist'])
+def test_store_game_data_pipelined_stage_error(store: StoreToDB, failing):
+    store.new_appids = list(range(1, 21))
+    error = RuntimeError(f"{failing} failed")
+    def fail_on_batch_7(result):
+        # stand in for a stage step that raises on the batch starting at appid 7
+        def step(first_appid, *args):
+            if first_appid == 7:
+                raise error
+            return result(*args)
+        return step
+    
+    if failing == 'fetch':
+        fetch = fail_on_batch_7(lambda appids: make_games(appids))
+        store.steam.get_games_data.side_effect = lambda appids, max_workers: fetch(appids[0], appids)
+    elif failing == 'transform':
+        transform = fail_on_batch_7(lambda games: games)
+        store._transform_games = lambda games: transform(games[0]["appid"], games)
+    else:
+        persist = fail_on_batch_7(lambda games: len(games))
+        store.db.add_games_batch.side_effect = lambda user_id, games: persist(games[0]["appid"], games)
+
+    # the error stops every stage and is raised once they have all finished
+    assert run_pipelined(store) is error
+
+    # batches are only checkpointed in order up to the failed one, the work list is kept
+    journaled = load_journal(store.JOURNAL_FILE)
+    assert journaled == list(range(1, len(journaled) + 1))
+    assert 7 not in journaled
+    assert set(journaled) <= set(saved_appids(store))
+    assert check_file(store.TEMP_FILE)
+    store.db.set_games_update_status.assert_not_called()
+
+def test_store_game_data_pipelined_backpressure(store: StoreToDB):
+    store.new_appids = list(range(1, 41))
+    fetched_ahead = []
+    def add_games_batch(user_id, games):
+        # a slow database, fetch would finish every batch long before persist without bounded queues
+        time.sleep(0.01)
+        batches_saved = len(saved_appids(store)) // StoreToDB.BATCH_SIZE
+        fetched_ahead.append(store.steam.get_games_data.call_count - batches_saved)
+        return len(games)
+    store.db.add_games_batch.side_effect = add_games_batch
+
+    assert run_pipelined(store) is None
+
+    assert saved_appids(store) == list(range(1, 41))
+    # each queue holds PIPELINE_QUEUE_SIZE batches, each stage holds at most one more
+    assert max(fetched_ahead) <= 2 * StoreToDB.PIPELINE_QUEUE_SIZE + 2
+
+def test_refresh_stale_games_marks_empty_games(store: StoreToDB):
+    store.db.get_stale_games.return_value = [
+        {"appid": 1, "stale_classes": ["price"]},
+        {"appid": 2, "stale_classes": ["price"]},
+        {"appid": 3, "stale_classes": ["price", "static"]}
+    ]
+    # steam has nothing for 2 and 3
+    store.steam.get_games_data.side_effect = lambda appids, max_workers: [make_games([appid])[0] if appid == 1 else {} for appid in appids]
+
+    assert store.refresh_stale_games() == 1
+
+    # games steam returned empty are marked too, so they don't stay at the top of the stale list
+    marked = {(tuple(call.args[0]), tuple(call.args[1])) for call in store.db.mark_games_refreshed.call_args_list}
+    assert marked == {((1,), ("price",)), ((2,), ("price",)), ((3,), ("price", "static"))}
+
+def test_store_game_data_resumes_with_new_appids(store: StoreToDB):
+    # an earlier ingest left [3, 4, 6] with 3 finished, this sync found 4, 5 and 7
+    save_to_json(store.TEMP_FILE, [3, 4, 6])
+    append_to_journal(store.JOURNAL_FILE, [3])
+    store.new_appids = [4, 5, 7]
+    store.db.add_games_batch.side_effect = lambda user_id, games: 0 if games[0]["appid"] == 5 else len(games)
+    store.store_game_data_to_db()
+
+    # resumed appids come first, then the new ones, none dropped or fetched twice
+    assert saved_appids(store) == [4, 6, 5, 7]
+    assert load_from_json(store.TEMP_FILE)["data"] == [5, 7]
+    assert store.new_appids == [5, 7]
+    store.db.set_games_update_status.assert_not_called()